@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the optional AC stage of the simulation: the DC power of
+the module ("Pout" from "module_power_er") goes through an inverter with an
+efficiency curve and a DC/AC ratio:
+
+    - Inverter efficiency interpolated from a curve of efficiency against
+        the DC input power relative to the rated DC input of the inverter.
+    - Clipping of the AC power at the rated AC power of the inverter.
+    - AC energy, inverter and clipping losses for one or many DC/AC ratios
+        in one array operation (ratios x hours).
+
+The inverter is sized for one module: its rated AC power is the nominal
+power of the module divided by the DC/AC ratio.
+
+@author: mriveraa
+"""
+import numpy as np
+import pandas as pd
+
+# Inverter efficiency against the DC input power relative to the rated DC
+# input of the inverter (typical string inverter)
+DEFAULT_INVERTER_CURVE = pd.Series(
+    [0.0, 0.900, 0.945, 0.965, 0.970, 0.972, 0.970, 0.967],
+    index=[0.0, 0.05, 0.10, 0.20, 0.30, 0.50, 0.75, 1.00],
+    name="efficiency")
+
+
+def get_ac_energy(pout, pnom, dc_ac_ratios=1.2, curve=None,
+                  time_steps=None):
+    """
+    This function calculates the AC energy of a module with an inverter for
+    one or many DC/AC ratios.
+
+    Parameters
+    ----------
+    pout : Pandas Series or array_like
+        Instantaneous DC power of the module in W, e.g. "Pout" from the
+        simulation. NaN values are taken as 0.
+    pnom : Float
+        Module's nominal power in kW.
+    dc_ac_ratios : Float or array_like, optional
+        DC/AC ratio(s): nominal DC power of the module over the rated AC
+        power of the inverter. The default is 1.2.
+    curve : Pandas Series, optional
+        Inverter efficiency (values) against the DC input power relative to
+        the rated DC input (index, from 0 to 1). The default is
+        DEFAULT_INVERTER_CURVE.
+    time_steps : Pandas Series or array_like, optional
+        Duration in hours of each time step, please check "get_time_steps"
+        in utils.py. The default is None (one hour each).
+
+    Returns
+    -------
+    ac_table : Pandas DataFrame
+        One row per DC/AC ratio with the energy in Wh: "energy_dc",
+        "loss_inverter", "loss_clipping" and "energy_ac", and the
+        "clipping_hours" (hours with clipped power).
+    """
+    if curve is None:
+        curve = DEFAULT_INVERTER_CURVE
+    curve = curve.sort_index()
+    ratios = np.atleast_1d(np.asarray(dc_ac_ratios, dtype=float))
+    pdc = np.nan_to_num(np.asarray(pout, dtype=float))
+    hours = (np.ones_like(pdc) if time_steps is None
+             else np.asarray(time_steps, dtype=float))
+
+    # Rated AC and DC input power of the inverter of each ratio (W)
+    pac_rated = pnom * 1000 / ratios
+    pdc_rated = pac_rated / curve.values[-1]
+
+    # ratios x hours
+    load = pdc[None, :] / pdc_rated[:, None]
+    efficiency = np.interp(load.ravel(), curve.index.values,
+                           curve.values).reshape(load.shape)
+    pac = efficiency * pdc[None, :]
+    pac_clipped = np.minimum(pac, pac_rated[:, None])
+
+    energy_dc = pdc @ hours
+    energy_unclipped = pac @ hours
+    energy_ac = pac_clipped @ hours
+    return pd.DataFrame({"energy_dc": energy_dc,
+                         "loss_inverter": energy_dc - energy_unclipped,
+                         "loss_clipping": energy_unclipped - energy_ac,
+                         "energy_ac": energy_ac,
+                         "clipping_hours": (pac > pac_rated[:, None])
+                         @ hours},
+                        index=pd.Index(ratios, name="dc_ac_ratio"))
+
+
+def get_ac_table(sim_results, pnom, dc_ac_ratios=1.2, curve=None):
+    """
+    This function calculates the AC energy of a module in each climate.
+    Please check the function "get_ac_energy".
+
+    Parameters
+    ----------
+    sim_results : Dictionary
+        Dictionary with the climate names as keys and the DataFrames of the
+        simulation (with the column "Pout" and, for data that are not
+        hourly, "time_step") as values.
+    pnom : Float
+        Module's nominal power in kW.
+    dc_ac_ratios, curve : optional
+        Please check "get_ac_energy".
+
+    Returns
+    -------
+    ac_table : Pandas DataFrame
+        One row per climate and DC/AC ratio with the AC energy and losses,
+        also relative to the DC energy ("_rel" columns).
+    """
+    ac_table = pd.concat({site: get_ac_energy(df["Pout"], pnom,
+                                              dc_ac_ratios=dc_ac_ratios,
+                                              curve=curve,
+                                              time_steps=df.get("time_step"))
+                          for site, df in sim_results.items()},
+                         names=["Std_climate"])
+    relative = ac_table[["loss_inverter", "loss_clipping", "energy_ac"]].div(
+        ac_table["energy_dc"], axis=0)
+    return ac_table.join(relative.add_suffix("_rel"))
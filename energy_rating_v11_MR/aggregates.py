@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the functions to aggregate the results of the Energy
+Rating simulation, so the reporting does not need the hourly DataFrame:
+
+    - Group indices (month, day and hour of the day) of the time steps.
+    - Monthly and daily energy, irradiation and CSER-style ratio.
+    - Hour of the day x month breakdown of the losses (AOI, spectral,
+        irradiance and thermal) and of the bifacial gain.
+    - Annual loss waterfall of each module and climate.
+
+The losses are the differences between the energy of the module at STC
+efficiency and the energy after each correction step:
+
+    E_stc         = sum(G_tlt * A * ETA_stc)
+    loss_aoi      = sum((G_tlt - (g_aoi - g_bifacial)) * A * ETA_stc)
+    gain_bifacial = sum(g_bifacial * A * ETA_stc)
+    loss_spec     = sum((g_aoi - g_spec) * A * ETA_stc)
+    loss_irr      = sum(g_spec * A * ETA_stc * (1 - ETA_rel(g_spec, 25)))
+    loss_thermal  = sum(g_spec * A * ETA_stc * (ETA_rel(g_spec, 25)
+                                                - ETA_rel(g_spec, T_mod)))
+
+    so that E_stc minus the four losses plus the bifacial gain is the energy
+    of the module (Pout). The AOI loss is the one of the front side, the
+    bifacial gain is the AOI corrected rear side (and front ground)
+    irradiance of "bifacial_correction" and zero for monofacial modules.
+
+@author: mriveraa
+"""
+import numpy as np
+import pandas as pd
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+
+# Names of the columns of the loss breakdown
+LOSS_COLUMNS = ["energy_stc", "loss_aoi", "gain_bifacial", "loss_spectral",
+                "loss_irradiance", "loss_thermal", "energy_dc"]
+
+
+def get_group_indices(index):
+    """
+    This function gets the group indices of each time step, to be used with
+    "np.bincount".
+
+    Parameters
+    ----------
+    index : Pandas DatetimeIndex
+        Time steps of the climate data.
+
+    Returns
+    -------
+    groups : Dictionary
+        "month" (0 to 11), "hour" (0 to 23), "day" (0 to number of days - 1)
+        and "days" (DatetimeIndex with the date of each day index).
+    """
+    days, day = np.unique(index.normalize(), return_inverse=True)
+    groups = {"month": np.asarray(index.month, dtype=np.intp) - 1,
+              "hour": np.asarray(index.hour, dtype=np.intp),
+              "day": day.astype(np.intp),
+              "days": pd.DatetimeIndex(days)}
+    for name in ["month", "hour", "day"]:
+        groups[name].flags.writeable = False
+    return groups
+
+
+def get_energy_tables(climate_data, eta_interpolated, power_matrix,
+                      module_area, pnom, groups=None):
+    """
+    This function calculates the monthly and daily energy and the hour of
+    the day x month loss breakdown of an Energy Rating simulation. The time
+    steps with NaN power are left out, as in the CSER calculation, and the
+    energy of each time step uses its duration ('time_step' column) when
+    the data are not hourly.
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        DataFrame from the simulation with the columns 'G_tlt', 'g_aoi',
+        'g_spec', 'T_mod', 'eta_rel' and 'Pout', and 'g_bifacial' for the
+        bifacial modules.
+    eta_interpolated: Object.
+        This object gets the ETA if a irradiance and temperature are given.
+        Please check the function "get_eta_interpolation".
+    power_matrix : Pandas DataFrame
+        Power Matrix measured by Callab containing also the calcualted 'eta'.
+    module_area: Float
+        Module's area in m².
+    pnom : Float
+        Module's nominal power in kW.
+    groups : Dictionary, optional
+        Group indices of the rows of "climate_data", please check
+        "get_group_indices". When None they are computed from the index of
+        "climate_data". The default is None.
+
+    Returns
+    -------
+    tables : Dictionary
+        "monthly" and "daily" DataFrames with the energy (Wh), irradiation
+        in POA (Wh/m²) and CSER, "hour_month" DataFrame with LOSS_COLUMNS
+        (Wh) for each month and hour of the day and "waterfall" Series with
+        the annual LOSS_COLUMNS (Wh).
+    """
+    if groups is None:
+        groups = get_group_indices(climate_data.index)
+    pout = climate_data["Pout"].values
+    valid = ~np.isnan(pout)
+
+    # Energy at STC efficiency of each correction step
+    eta_stc = energy_rating.get_eta_stc(power_matrix=power_matrix,
+                                        module_area=module_area)
+    stc = module_area * eta_stc
+    g_spec = climate_data["g_spec"].values
+    eta_rel = climate_data["eta_rel"].values
+    eta_rel_25 = np.asarray(
+        eta_interpolated(g_spec, np.full(len(g_spec), 25.0)),
+        dtype=float).reshape(-1)
+    # No irradiance loss can be separated where the matrix has no value at 25°C
+    eta_rel_25 = np.where(np.isnan(eta_rel_25), eta_rel, eta_rel_25)
+    g_aoi = climate_data["g_aoi"].values
+    g_bifacial = (climate_data["g_bifacial"].values
+                  if "g_bifacial" in climate_data else np.zeros(len(g_aoi)))
+    steps = np.stack([
+        climate_data["G_tlt"].values * stc,
+        (climate_data["G_tlt"].values - (g_aoi - g_bifacial)) * stc,
+        g_bifacial * stc,
+        (g_aoi - g_spec) * stc,
+        g_spec * stc * (1 - eta_rel_25),
+        g_spec * stc * (eta_rel_25 - eta_rel),
+        pout])[:, valid]
+    g_tlt = climate_data["G_tlt"].values[valid]
+    if "time_step" in climate_data:
+        # Energy of each time step
+        time_steps = climate_data["time_step"].values[valid]
+        steps = steps * time_steps
+        g_tlt = g_tlt * time_steps
+
+    # Monthly and daily energy
+    tables = {}
+    for name, group, labels in [
+            ("monthly", "month", pd.RangeIndex(1, 13, name="month")),
+            ("daily", "day", groups["days"].rename("day"))]:
+        code = groups[group][valid]
+        energy = np.bincount(code, weights=steps[-1], minlength=len(labels))
+        irradiation = np.bincount(code, weights=g_tlt, minlength=len(labels))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cser = energy / (irradiation * pnom)
+        tables[name] = pd.DataFrame({"energy_dc": energy,
+                                     "irradiation": irradiation,
+                                     "cser": cser}, index=labels)
+
+    # Hour of the day x month loss breakdown
+    code = (groups["month"] * 24 + groups["hour"])[valid]
+    breakdown = np.stack([np.bincount(code, weights=step, minlength=12 * 24)
+                          for step in steps], axis=1)
+    tables["hour_month"] = pd.DataFrame(
+        breakdown, columns=LOSS_COLUMNS,
+        index=pd.MultiIndex.from_product([range(1, 13), range(24)],
+                                         names=["month", "hour"]))
+
+    # Annual loss waterfall (running sums of each step)
+    tables["waterfall"] = pd.Series(steps.sum(axis=1), index=LOSS_COLUMNS)
+    return tables
+
+
+def get_waterfall_table(waterfalls):
+    """
+    This function puts together the annual loss waterfalls of the modules in
+    the standard climates, with each loss also relative to the energy at STC
+    efficiency.
+
+    Parameters
+    ----------
+    waterfalls : Dictionary
+        Dictionary with (module ID, standard climate name) as keys and the
+        "waterfall" Series from "get_energy_tables" as values.
+
+    Returns
+    -------
+    waterfall_table : Pandas DataFrame
+        One row for each module and climate with LOSS_COLUMNS (Wh) and the
+        same columns relative to "energy_stc" with the suffix "_rel".
+    """
+    waterfall_table = pd.DataFrame(waterfalls).T
+    waterfall_table.index.names = ["Internal_ID", "Std_climate"]
+    relative = waterfall_table[LOSS_COLUMNS[1:]].div(
+        waterfall_table["energy_stc"], axis=0)
+    return waterfall_table.join(relative.add_suffix("_rel"))
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Batch runner of the Energy Rating simulation with the work queue (please
+check work_queue.py). The same commands are run in every node that shares
+the queue and results files:
+
+    Add the CalLab files of a folder (six standard climates, or the sites of
+    a site index with --sites):
+        python batch_run.py enqueue queue.db --modules folder
+
+    Add the modules of the CalLab results (summary workbook and customer
+    files of a folder), with the spectral responsivity, angle of incidence
+    and thermal coefficients of a template CalLab file (please check
+    "enqueue_callab" in work_queue.py):
+        python batch_run.py enqueue queue.db --modules folder
+            --callab summary.xlsx --template template.txt
+
+    Rate the items of the queue with 4 worker processes in this node:
+        python batch_run.py work queue.db --db results.db --processes 4
+
+    Number of items in each status and errors of the failed items:
+        python batch_run.py status queue.db
+
+    Profiling: each worker writes a cProfile dump per module and climate to
+    the folder, merged at the end into a hot function report and collapsed
+    stacks for flame graphs (please check profiling.py). The dumps of all
+    the nodes can be merged again afterwards:
+        python batch_run.py work queue.db --db results.db --profile prof
+        python batch_run.py profile prof
+
+@author: mriveraa
+"""
+import argparse
+import glob
+from multiprocessing import Process
+from os.path import abspath, basename, dirname, join
+# Importing the work queue
+import work_queue
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the profiling mode
+import profiling
+
+
+def enqueue(args):
+    """
+    Adds the work items of the CalLab files (or of the CalLab results) to the
+    queue.
+    """
+    sites = (multi_site.read_site_index(args.sites)
+             if args.sites is not None else None)
+    if args.callab is None:
+        module_files = sorted(glob.glob(join(args.modules, "*.txt")))
+        added = work_queue.enqueue(args.queue, module_files, sites=sites)
+        print("%d items added (%d CalLab files)" % (added, len(module_files)))
+        return
+    if args.template is None:
+        raise ValueError("The CalLab results need a template CalLab file "
+                         "(--template)")
+    folder = (args.callab_files if args.callab_files is not None
+              else join(args.modules, "cser_input"))
+    added, summary = work_queue.enqueue_callab(
+        args.queue, path=dirname(abspath(args.callab)),
+        folder_modules=abspath(args.modules),
+        data_file=basename(args.callab), template_path=args.template,
+        folder=folder, sites=sites, workers=args.workers)
+    print("%d items added (%d modules, CalLab files in %s)"
+          % (added, (summary["status"] == "ok").sum(), folder))
+    print(summary["status"].value_counts().to_string())
+    left_out = summary[summary["status"] != "ok"]
+    if not left_out.empty:
+        print("\nLeft out:\n%s" % left_out[["Measurement_ID_tk", "status",
+                                             "error"]].to_string(index=False))
+    return
+
+
+def _work(args, index):
+    # One worker process
+    done = work_queue.run_worker(
+        queue_path=args.queue,
+        db_path=args.db,
+        batch=args.batch,
+        lease_seconds=args.lease,
+        tau=args.tau,
+        fused=args.fused,
+        wait=not args.no_wait,
+        profile_dir=args.profile,
+        bifaciality=args.bifaciality,
+        albedo=args.albedo,
+        memory_budget=(None if args.memory_budget is None
+                       else args.memory_budget * 1e6 / args.processes))
+    print("Worker %d: %d items rated" % (index, done))
+    return
+
+
+def work(args):
+    """
+    Runs the workers of this node until the queue is finished.
+    """
+    if args.processes == 1:
+        _work(args, 0)
+    else:
+        workers = [Process(target=_work, args=(args, index))
+                   for index in range(args.processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    status(args)
+    if args.profile is not None:
+        report(args)
+    return
+
+
+def report(args):
+    """
+    Merges the profile dumps of a folder and prints the hottest functions.
+    """
+    hot_functions = profiling.write_profile_report(args.profile)
+    print("\n%s\nReport and collapsed stacks written to %s"
+          % (hot_functions.head(15).to_string(index=False), args.profile))
+    return
+
+
+def status(args):
+    """
+    Prints the number of items in each status and the failed items.
+    """
+    print(work_queue.get_status(args.queue).to_string())
+    failed = work_queue.get_failed(args.queue)
+    for item in failed.to_dict("records"):
+        print("\nFailed: %s in %s (%d attempts)\n%s"
+              % (item["module_file"], item["climate"], item["attempts"],
+                 item["error"]))
+    return
+
+
+def get_parser():
+    """
+    Returns the parser of the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Batch Energy Rating with a shared work queue.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_enqueue = commands.add_parser(
+        "enqueue", help="add the CalLab files of a folder to the queue")
+    parser_enqueue.add_argument("queue", help="SQLite file of the queue")
+    parser_enqueue.add_argument("--modules", required=True,
+                                help="folder with the CalLab files (or the "
+                                     "customer files with --callab)")
+    parser_enqueue.add_argument("--callab", default=None,
+                                help="summary workbook of the CalLab "
+                                     "results")
+    parser_enqueue.add_argument("--template", default=None,
+                                help="CalLab file with the quantities the "
+                                     "customer files do not have")
+    parser_enqueue.add_argument("--callab-files", default=None,
+                                help="folder of the CalLab files written "
+                                     "for the customer files (default: "
+                                     "cser_input in --modules)")
+    parser_enqueue.add_argument("--workers", type=int, default=None,
+                                help="processes reading the customer files")
+    parser_enqueue.add_argument("--sites", default=None,
+                                help="site index (default: the six "
+                                     "standard climates)")
+    parser_enqueue.set_defaults(function=enqueue)
+
+    parser_work = commands.add_parser(
+        "work", help="rate the items of the queue")
+    parser_work.add_argument("queue", help="SQLite file of the queue")
+    parser_work.add_argument("--db", required=True,
+                             help="SQLite file of the results")
+    parser_work.add_argument("--processes", type=int, default=1,
+                             help="worker processes in this node")
+    parser_work.add_argument("--batch", type=int, default=20,
+                             help="items claimed at once")
+    parser_work.add_argument("--lease", type=float,
+                             default=work_queue.LEASE_SECONDS,
+                             help="seconds the items are leased")
+    parser_work.add_argument("--tau", type=float, default=None,
+                             help="thermal time constant in seconds")
+    parser_work.add_argument("--fused", action="store_true",
+                             help="use the fused kernel")
+    parser_work.add_argument("--bifaciality", type=float, default=None,
+                             help="bifaciality factor of the modules "
+                                  "(default: monofacial)")
+    parser_work.add_argument("--albedo", type=float, default=0.2,
+                             help="reflectance of the ground for the "
+                                  "bifacial rating")
+    parser_work.add_argument("--memory-budget", type=float, default=None,
+                             help="memory for the workers of this node in "
+                                  "MB, shared by the processes")
+    parser_work.add_argument("--no-wait", action="store_true",
+                             help="stop when nothing can be claimed, "
+                                  "without waiting for expired leases")
+    parser_work.add_argument("--profile", default=None,
+                             help="folder of the cProfile dumps of each "
+                                  "module")
+    parser_work.set_defaults(function=work)
+
+    parser_profile = commands.add_parser(
+        "profile", help="merge the cProfile dumps of a folder")
+    parser_profile.add_argument("profile", help="folder of the dumps")
+    parser_profile.set_defaults(function=report)
+
+    parser_status = commands.add_parser(
+        "status", help="number of items in each status")
+    parser_status.add_argument("queue", help="SQLite file of the queue")
+    parser_status.set_defaults(function=status)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    args.function(args)
+    return
+
+
+if __name__ == "__main__":
+    main()
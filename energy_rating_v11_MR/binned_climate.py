@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the binned-climate mode of the Energy Rating, a fast
+approximation of the CSER for screening large catalogues of modules:
+
+    - Each climate is reduced once to a weighted histogram of its daylight
+        time steps over the irradiance in POA, the ambient temperature, the
+        wind speed, the angle of incidence and a spectral class (average
+        photon energy of the spectrum). Each bin keeps the mean of the
+        climate columns of its time steps (the angle of incidence weighted
+        by the direct irradiance, as "resample_climate" in
+        read_functions.py) and their duration.
+    - The steps of the module (AOI, spectral, temperature and ETA) are run
+        on the bins (from 553 in "Tropical humid" to 2780 in "Subtropical
+        coastal" instead of 8760 time steps in the six standard climates
+        with RESOLUTION), and the CSER and the average ETA are the sums
+        weighted by the duration of the bins. The
+        fused kernel (fused_kernel.py) is used when it can be, otherwise the
+        steps of energy_rating_functions.py.
+    - The error of the approximation against "ersim_dc_steps" is measured
+        for a set of calibration modules and kept with the reduced climate
+        as its error bound.
+
+The width of the bins is set for each variable (RESOLUTION), smaller bins
+give a smaller error with more bins. The thermal inertia of the modules
+needs the sequence of the time steps, so the binned mode uses the
+steady-state module temperature.
+
+@author: mriveraa
+"""
+import numpy as np
+import pandas as pd
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+# Importing the Steps Function
+import sim_steps
+# Importing utils
+import utils
+# Importing the spectral engine
+import spectral_bands
+# Importing the daylight-only representation
+import daylight
+# Importing the fused kernel
+import fused_kernel
+
+# Width of the bins: irradiance in POA (W/m²), ambient temperature (°C),
+# wind speed (m/s), angle of incidence (°) and average photon energy (eV)
+RESOLUTION = {"G_tlt": 50.0, "T_amb": 4.0, "wind": 2.0,
+              "IncidentAngle": 15.0, "ape": 0.05}
+
+# h * c / q in eV nm, photon energy of a wavelength in nm
+HC_EV_NM = 1239.84198
+
+
+def get_average_photon_energy(climate_data):
+    """
+    This function calculates the average photon energy (APE) of the spectrum
+    of each time step, from the spectral bands of the climate data: higher
+    for blue-rich spectra (overcast sky), lower for red-rich spectra (low
+    sun).
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        Climate data with the spectral band columns.
+
+    Returns
+    -------
+    ape : Numpy array
+        Average photon energy in eV, NaN without spectral irradiance.
+    """
+    bands = spectral_bands.get_climate_bands(climate_data.columns)
+    centres = (np.asarray(bands[1]) + np.asarray(bands[2])) / 2
+    spec_g = climate_data[list(bands[0])].values
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return spec_g.sum(axis=1) / (spec_g @ (centres / HC_EV_NM))
+
+
+def reduce_climate(climate_data, resolution=None):
+    """
+    This function reduces a climate to the weighted histogram of its
+    daylight time steps.
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        Climate data with the column names for the simulation.
+    resolution : Dictionary, optional
+        Width of the bins of some or all the variables of RESOLUTION. The
+        default is None (RESOLUTION).
+
+    Returns
+    -------
+    reduced : Dictionary
+        "bins" (DataFrame with one row per bin: mean of the climate columns
+        and "weight", the duration of its time steps in hours), "inputs"
+        (arrays of the bins for the fused kernel), "resolution", "n_steps"
+        (time steps of the climate) and "error_bound" (None until it is
+        calibrated, please check "calibrate").
+    """
+    resolution = dict(RESOLUTION, **(resolution or {}))
+    unknown = set(resolution) - set(RESOLUTION)
+    if unknown:
+        raise ValueError("Unknown bin variable(s): %s, please choose from: "
+                         "%s" % (", ".join(sorted(unknown)),
+                                 ", ".join(RESOLUTION)))
+    time_steps = utils.get_time_steps(climate_data.index)
+    weights = (np.ones(len(climate_data)) if time_steps is None
+               else time_steps.values)
+    mask = daylight.get_daylight_mask(climate_data)
+    climate_df = climate_data[mask].fillna(0)
+    weights = weights[mask]
+
+    # Bin of each time step
+    variables = {"G_tlt": climate_df["G_tlt"].values,
+                 "T_amb": climate_df["T_amb"].values,
+                 "wind": climate_df["wind"].values,
+                 "IncidentAngle": climate_df["IncidentAngle"].values,
+                 "ape": np.nan_to_num(get_average_photon_energy(climate_df))}
+    codes = np.column_stack([np.floor(values / resolution[name])
+                             for name, values in variables.items()])
+    _, inverse = np.unique(codes, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    n_bins = inverse.max() + 1 if len(inverse) else 0
+
+    # Mean of the climate columns weighted by the duration
+    weight = np.bincount(inverse, weights=weights, minlength=n_bins)
+    bins = {column: np.bincount(inverse, weights=weights
+                                * climate_df[column].values,
+                                minlength=n_bins) / weight
+            for column in climate_df.columns}
+    # Angle of incidence: mean of cos(AOI) weighted by the direct irradiance
+    direct = weights * climate_df["I_tlt"].clip(lower=0).values
+    direct_sum = np.bincount(inverse, weights=direct, minlength=n_bins)
+    cos_aoi = np.cos(np.radians(climate_df["IncidentAngle"].values))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos_avg = np.bincount(inverse, weights=direct * cos_aoi,
+                              minlength=n_bins) / direct_sum
+    bins["IncidentAngle"] = np.where(
+        direct_sum > 0, np.degrees(np.arccos(np.clip(cos_avg, -1, 1))),
+        bins["IncidentAngle"])
+    bins = pd.DataFrame(bins, columns=climate_df.columns)
+    bins["weight"] = weight
+    bins.index.name = "bin"
+    return {"bins": bins,
+            "inputs": fused_kernel.get_kernel_inputs(bins, hours=weight,
+                                                     rear=True),
+            "resolution": resolution, "n_steps": len(climate_data),
+            "error_bound": None}
+
+
+def ersim_dc_binned(reduced, eta_interpolated, pnom, mod_area, u0, u1, a_r,
+                    power_matrix, pv_tilt=20, spec_resp_factor=1.0,
+                    bifaciality=None, albedo=0.2):
+    """
+    This function has the steps for Energy Rating like "ersim_dc_steps" in
+    sim_steps.py, run on the bins of a reduced climate (steady-state module
+    temperature).
+
+    Parameters
+    ----------
+    reduced : Dictionary
+        Reduced climate, please check "reduce_climate".
+    eta_interpolated, pnom, mod_area, u0, u1, a_r, power_matrix, pv_tilt,
+    spec_resp_factor, bifaciality, albedo :
+        Please check the function "ersim_dc_steps" in sim_steps.py.
+
+    Returns
+    -------
+    cser : Float
+        Approximate Climate Specific Energy Rating.
+    eta_avg : Float
+        Approximate average ETA.
+    """
+    if fused_kernel.is_supported(eta_interpolated):
+        return fused_kernel.ersim_dc_fused(
+            climate_data=reduced["bins"],
+            eta_interpolated=eta_interpolated,
+            pnom=pnom, mod_area=mod_area, u0=u0, u1=u1, a_r=a_r,
+            power_matrix=power_matrix, pv_tilt=pv_tilt,
+            spec_resp_factor=spec_resp_factor,
+            inputs=reduced["inputs"],
+            bifaciality=bifaciality,
+            albedo=albedo)
+    bins_df = energy_rating.aoi_correction(climate_df=reduced["bins"],
+                                           a_r=a_r, pv_tilt=pv_tilt)
+    if bifaciality is not None:
+        bins_df = energy_rating.bifacial_correction(
+            climate_df=bins_df, a_r=a_r, albedo=albedo,
+            bifaciality=bifaciality, pv_tilt=pv_tilt)
+    bins_df = energy_rating.spec_correction(climate_df=bins_df,
+                                            spec_resp_factor=spec_resp_factor)
+    bins_df = energy_rating.temp_correction(climate_df=bins_df, u0=u0, u1=u1)
+    bins_df = energy_rating.module_power_er(climate_df=bins_df,
+                                            eta_interpolated=eta_interpolated,
+                                            power_matrix=power_matrix,
+                                            module_area=mod_area)
+    # Bins out of the ETA matrix are left out, as in "get_results"
+    bins_df = bins_df.dropna()
+    cser = utils.get_cser(power_series=bins_df["Pout"],
+                          gpoa_series=bins_df["G_tlt"],
+                          pnom=pnom,
+                          time_steps=bins_df["weight"])
+    eta_avg = utils.get_eta_avg(power_series=bins_df["Pout"],
+                                gpoa_series=bins_df["G_tlt"],
+                                mod_area=mod_area,
+                                time_steps=bins_df["weight"])
+    return cser, eta_avg
+
+
+def calibrate(reduced, climate_data, modules, pv_tilt=20):
+    """
+    This function measures the error of the binned CSER against the exact
+    steps (the daylight steps, the same as "ersim_dc_steps" in sim_steps.py)
+    for a set of calibration modules, e.g. the example CalLab files or a
+    synthetic batch. The largest relative error of the CSER is kept as
+    "error_bound" of the reduced climate.
+
+    Parameters
+    ----------
+    reduced : Dictionary
+        Reduced climate, please check "reduce_climate".
+    climate_data : Pandas DataFrame
+        Climate data that was reduced.
+    modules : List
+        Module characterisations, please check "get_module_characterisation"
+        in multi_site.py (the bifacial modules with their "bifaciality" and
+        "albedo").
+    pv_tilt : Float, optional
+        PV tilt angle. The default is 20.
+
+    Returns
+    -------
+    errors : Pandas DataFrame
+        One row per module with the exact and binned "cser" and "eta_avg"
+        and their relative errors ("error_cser" and "error_eta_avg").
+    """
+    rows = []
+    for module in modules:
+        kwargs = {"eta_interpolated": module["eta_interpolated"],
+                  "pnom": module["pnom"],
+                  "mod_area": module["module_area"],
+                  "u0": module["u0"],
+                  "u1": module["u1"],
+                  "a_r": module["a_r"],
+                  "power_matrix": module["power_matrix"],
+                  "pv_tilt": pv_tilt,
+                  "spec_resp_factor": module["spec_resp"],
+                  "bifaciality": module["bifaciality"],
+                  "albedo": module["albedo"]}
+        cser, eta_avg, _ = sim_steps.ersim_dc_daylight(
+            climate_data=climate_data, **kwargs)
+        cser_binned, eta_binned = ersim_dc_binned(reduced, **kwargs)
+        rows.append({"Internal_ID": module["int_id"],
+                     "cser": cser, "cser_binned": cser_binned,
+                     "error_cser": cser_binned / cser - 1,
+                     "eta_avg": eta_avg, "eta_avg_binned": eta_binned,
+                     "error_eta_avg": eta_binned / eta_avg - 1})
+    errors = pd.DataFrame(rows)
+    reduced["error_bound"] = float(errors["error_cser"].abs().max())
+    return errors
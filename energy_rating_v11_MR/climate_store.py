@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the climate store, which keeps the standard climate data
+files from IEC61853-4 [1] in memory once they are read, together with the
+data that can be precomputed for each climate:
+
+    - Climate DataFrame with the column names used in the simulation.
+    - Group indices (month, day and hour of the day) of each time step.
+    - Daylight mask and daylight-only climate, please check daylight.py.
+
+    References
+    ----------
+    .. [1] Energy Rating Standard IEC61853-4.
+
+@author: mriveraa
+"""
+from functools import lru_cache
+# Importing read functions
+import read_functions
+# Importing the aggregates
+import aggregates
+# Importing the daylight-only representation
+import daylight
+
+
+@lru_cache(maxsize=None)
+def _read_climate(folder_locations, loc_name):
+    # Read the climate file once, with the names for the simulation
+    climate_data = read_functions.read_climate_locs(
+        folder_locations=folder_locations,
+        loc_name=loc_name)
+    return read_functions.change_names_climate_df(climate_df=climate_data)
+
+
+def get_climate(folder_locations, loc_name):
+    """
+    This function returns the climate data of a location. The file is read
+    only the first time, afterwards a copy of the stored DataFrame is given.
+
+    Parameters
+    ----------
+    folder_locations : String
+        Path like. Path to where the standard locations files are.
+    loc_name : String
+        Name of the file for the location.
+
+    Returns
+    -------
+    climate_data : Pandas DataFrame
+        Copy of the climate DataFrame with Datetime index and the column
+        names for the simulation, please check "change_names_climate_df".
+    """
+    return _read_climate(folder_locations, loc_name).copy()
+
+
+@lru_cache(maxsize=None)
+def get_climate_groups(folder_locations, loc_name):
+    """
+    This function returns the group indices of the time steps of a location,
+    computed only once per climate. Please check "get_group_indices" in
+    aggregates.py.
+
+    Parameters
+    ----------
+    folder_locations : String
+        Path like. Path to where the standard locations files are.
+    loc_name : String
+        Name of the file for the location.
+
+    Returns
+    -------
+    groups : Dictionary
+        Month, day and hour of the day indices of each time step.
+    """
+    return aggregates.get_group_indices(
+        _read_climate(folder_locations, loc_name).index)
+
+
+@lru_cache(maxsize=None)
+def get_daylight(folder_locations, loc_name):
+    """
+    This function returns the daylight-only representation of a location,
+    computed only once per climate. Please check "compact_climate" in
+    daylight.py. It is shared, so it must not be changed (the steps of
+    "ersim_dc_daylight" in sim_steps.py work on a copy).
+
+    Parameters
+    ----------
+    folder_locations : String
+        Path like. Path to where the standard locations files are.
+    loc_name : String
+        Name of the file for the location.
+
+    Returns
+    -------
+    daylight : Dictionary
+        Daylight mask and daylight time steps of the climate.
+    """
+    return daylight.compact_climate(_read_climate(folder_locations, loc_name))
+
+
+def clear():
+    """
+    Removes all the climates kept in memory.
+    """
+    _read_climate.cache_clear()
+    get_daylight.cache_clear()
+    get_climate_groups.cache_clear()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the daylight-only representation of the climate data.
+About half of the time steps of the standard climate files are night (no
+irradiance, sun elevation 0 and incident angle 90), where the simulation
+gives no power and no irradiance. The correction steps and the ETA
+interpolation are run only on the daylight time steps:
+
+    - Daylight mask: time steps with irradiance (or missing irradiance) in
+        any of the irradiance columns.
+    - Compact climate: copy of the daylight time steps, with the full
+        index, the module temperature at night and the duration of the time
+        steps kept aside.
+    - Thermal inertia: the transient module temperature goes through the
+        night, so it is filtered over all the time steps (at night the
+        steady-state temperature is the ambient temperature) and only the
+        daylight time steps are kept.
+    - Scatter: the full-length DataFrame of the simulation, with the night
+        time steps as the steps of sim_steps.py give them, only when it is
+        requested.
+
+The night time steps add nothing to the CSER, the average ETA and the share
+of excluded irradiation, so the results are the same as "ersim_dc_steps"
+(up to the rounding of the sums).
+
+@author: mriveraa
+"""
+import numpy as np
+import pandas as pd
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+# Importing utils
+import utils
+
+# Irradiance columns of the climate data (with the names for the simulation)
+IRRADIANCE_COLUMNS = ["G_tlt", "I_tlt", "D_tlt", "ghor", "ihor", "dhor"]
+
+
+def get_daylight_mask(climate_data):
+    """
+    This function finds the daylight time steps: any irradiance column
+    above 0 or missing (so the time steps with missing values are treated
+    as in the full simulation).
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        Climate data with the column names for the simulation.
+
+    Returns
+    -------
+    mask : Numpy array
+        True for the daylight time steps.
+    """
+    columns = [column for column in IRRADIANCE_COLUMNS
+               if column in climate_data]
+    if not columns:
+        raise ValueError("No irradiance columns (%s) in the climate data"
+                         % ", ".join(IRRADIANCE_COLUMNS))
+    values = climate_data[columns].values
+    return ~(values <= 0).all(axis=1)
+
+
+def compact_climate(climate_data, mask=None):
+    """
+    This function gives the daylight-only representation of the climate
+    data.
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        Climate data with the column names for the simulation. It is not
+        changed.
+    mask : Numpy array, optional
+        Daylight mask, e.g. from the climate store. The default is None
+        (please check "get_daylight_mask").
+
+    Returns
+    -------
+    daylight : Dictionary
+        "climate_data" (copy of the daylight time steps), "mask", "index"
+        (full index), "t_night" (module temperature of all the time steps
+        at night: the ambient temperature, as "temp_correction" leaves it),
+        "gaps" (time steps without ambient temperature or wind speed, please
+        check "get_thermal_gaps" in energy_rating_functions.py) and
+        "time_steps" (duration of all the time steps, None for hourly data,
+        please check "get_time_steps" in utils.py).
+    """
+    if mask is None:
+        mask = get_daylight_mask(climate_data)
+    return {"climate_data": climate_data[mask],
+            "mask": mask,
+            "index": climate_data.index,
+            "t_night": climate_data["T_amb"].fillna(0),
+            "gaps": energy_rating.get_thermal_gaps(climate_data),
+            "time_steps": utils.get_time_steps(climate_data.index)}
+
+
+def temp_correction(daylight, climate_df, u0, u1, tau=None):
+    """
+    This function calculates the module temperature of the daylight time
+    steps. With thermal inertia the steady-state temperature of all the
+    time steps is filtered, please check "temp_correction" in
+    energy_rating_functions.py.
+
+    Parameters
+    ----------
+    daylight : Dictionary
+        Please check "compact_climate".
+    climate_df : Pandas DataFrame
+        Daylight time steps with "g_aoi", "T_amb" and "wind".
+    u0, u1, tau :
+        Please check "temp_correction" in energy_rating_functions.py.
+
+    Returns
+    -------
+    climate_df : Pandas DataFrame
+        "climate_df" with the column "T_mod".
+    temp_mod : Pandas Series
+        Module temperature of all the time steps.
+    """
+    climate_df = energy_rating.temp_correction(climate_df=climate_df,
+                                               u0=u0, u1=u1, tau=None)
+    values = daylight["t_night"].values.copy()
+    values[daylight["mask"]] = climate_df["T_mod"].values
+    temp_mod = pd.Series(values, index=daylight["index"], name="T_mod")
+    if tau is not None:
+        # Restarted after the gaps of the ambient temperature and wind
+        temp_mod = energy_rating.transient_temperature(
+            temp_steady=temp_mod.where(~daylight["gaps"]), tau=tau)
+        climate_df["T_mod"] = temp_mod.values[daylight["mask"]]
+    return climate_df, temp_mod
+
+
+def scatter(daylight, climate_df, climate_data, temp_mod, eta_interpolated,
+            power_matrix, module_area):
+    """
+    This function gives the full-length DataFrame of the simulation from
+    the daylight time steps: the night time steps have no irradiance and no
+    power, the module temperature of "temp_mod" and the ETA interpolated at
+    that temperature, as in the full simulation.
+
+    Parameters
+    ----------
+    daylight : Dictionary
+        Please check "compact_climate".
+    climate_df : Pandas DataFrame
+        Simulation of the daylight time steps (from "module_power_er").
+    climate_data : Pandas DataFrame
+        Full climate data given to "compact_climate".
+    temp_mod : Pandas Series
+        Module temperature of all the time steps, please check
+        "temp_correction".
+    eta_interpolated, power_matrix, module_area :
+        Please check "module_power_er" in energy_rating_functions.py.
+
+    Returns
+    -------
+    full_df : Pandas DataFrame
+        DataFrame with all the time steps and the columns of the simulation,
+        the time steps with NaN values are kept.
+    """
+    mask = daylight["mask"]
+    # Climate columns after "temp_correction" (NaN values taken as 0)
+    full_df = climate_data.fillna(0)
+    # ETA and power of the night time steps (no irradiance)
+    night = pd.DataFrame({"g_spec": 0.0, "T_mod": temp_mod.values[~mask]},
+                         index=climate_data.index[~mask])
+    night = energy_rating.module_power_er(climate_df=night,
+                                          eta_interpolated=eta_interpolated,
+                                          power_matrix=power_matrix,
+                                          module_area=module_area)
+    columns = {}
+    for column in climate_df.columns.difference(climate_data.columns,
+                                                sort=False):
+        values = np.zeros(len(mask))
+        values[mask] = climate_df[column].values
+        if column in night:
+            values[~mask] = night[column].values
+        elif column == "time_step":
+            values[~mask] = daylight["time_steps"].values[~mask]
+        columns[column] = values
+    full_df = pd.concat([full_df, pd.DataFrame(columns, index=full_df.index)],
+                        axis=1)
+    return full_df[climate_df.columns]
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the analytic efficiency models that can be fitted to the
+Power Rating Matrix measured by CalLab, as an alternative to the bilinear
+interpolation of the ETA matrix:
+
+    - HEY model from Heydenreich et al. [1].
+    - MPM5 and MPM6 models from Ransome & Sutterlueti [2].
+    - PVGIS model from Huld et al. [3].
+
+The models are fitted to the relative ETA (ETA / ETA at STC) with linear
+least squares and are evaluated as closed-form expressions, so they give a
+smooth extrapolation outside the measured irradiances and temperatures.
+
+    References
+    ----------
+    .. [1] Heydenreich, et al. "Describing the world with three parameters:
+            a new approach to PV module power modelling". 2008.
+    .. [2] S. Ransome and J. Sutterlueti, "How to Choose the Best Empirical
+            Model for Optimum Energy Yield Predictions". 2017.
+    .. [3] T. Huld, et al. "A power-rating model for crystalline silicon PV
+            modules". 2011.
+    .. [4] A. Driesse and J. S. Stein, "From IEC 61853 power measurements
+            to PV system simulations", Sandia Report No. SAND2020-3877, 2020.
+
+@author: mriveraa
+"""
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize_scalar
+
+
+def _hey_basis(g, dt):
+    # Irradiance terms of the HEY model (the temperature term is a factor)
+    return np.stack([g,
+                     np.log(g + 1),
+                     np.log(g + np.e) ** 2 / (g + 1) - 1], axis=-1)
+
+
+def _mpm5_basis(g, dt):
+    s = g / 1000
+    return np.stack([np.ones_like(s), dt, np.log10(s), s], axis=-1)
+
+
+def _mpm6_basis(g, dt):
+    s = g / 1000
+    return np.stack([np.ones_like(s), dt, np.log10(s), s, 1 / s], axis=-1)
+
+
+def _pvgis_basis(g, dt):
+    log_s = np.log(g / 1000)
+    return np.stack([log_s, log_s ** 2,
+                     dt, dt * log_s, dt * log_s ** 2,
+                     dt ** 2], axis=-1)
+
+
+# Name of the model: (basis function, offset, parameter names)
+EFFICIENCY_MODELS = {
+    "hey": (_hey_basis, 0.0, ["a", "b", "c", "gamma"]),
+    "mpm5": (_mpm5_basis, 0.0, ["c1", "c2", "c3", "c4"]),
+    "mpm6": (_mpm6_basis, 0.0, ["c1", "c2", "c3", "c4", "c6"]),
+    "pvgis": (_pvgis_basis, 1.0, ["k1", "k2", "k3", "k4", "k5", "k6"]),
+    }
+
+
+class EfficiencyModel:
+    """
+    Analytic efficiency model fitted to the Power Rating Matrix. The object
+    is called like the "BilinearInterpolator" object, so it can replace
+    "eta_interpolated" in the simulation steps.
+
+    Parameters
+    ----------
+    model : String
+        Name of the model: "hey", "mpm5", "mpm6" or "pvgis".
+    params : array_like
+        Fitted parameters of the model, in the order of
+        EFFICIENCY_MODELS[model].
+
+    Attributes
+    ----------
+    rmse, max_error, r2 : Float
+        Fit quality against the relative ETA of the measurements. Please
+        check the function "fit_efficiency_model".
+    """
+
+    def __init__(self, model, params):
+        self.model = model
+        self.params = np.asarray(params, dtype=float)
+        self.rmse = np.nan
+        self.max_error = np.nan
+        self.r2 = np.nan
+
+    def __call__(self, irradiance, temperature):
+        """
+        Relative ETA at the given irradiance (W/m²) and temperature (°C).
+        Irradiances equal or lower than zero give zero.
+        """
+        g = np.asarray(irradiance, dtype=float)
+        dt = np.asarray(temperature, dtype=float) - 25
+        g, dt = np.broadcast_arrays(g, dt)
+        positive = g > 0
+        eta_rel = np.zeros(g.shape)
+        eta_rel[positive] = self._evaluate(g[positive], dt[positive])
+        return eta_rel
+
+    def _evaluate(self, g, dt):
+        basis, offset, names = EFFICIENCY_MODELS[self.model]
+        if self.model == "hey":
+            return (basis(g, dt) @ self.params[:3]) * (1 + self.params[3] * dt)
+        return offset + basis(g, dt) @ self.params
+
+    def get_report(self):
+        """
+        Returns a Pandas Series with the parameters and the fit quality.
+        """
+        names = EFFICIENCY_MODELS[self.model][2]
+        report = pd.Series(dict(zip(names, self.params)), dtype=float)
+        report["rmse"] = self.rmse
+        report["max_error"] = self.max_error
+        report["r2"] = self.r2
+        return report
+
+
+def fit_efficiency_model(power_matrix, model="hey"):
+    """
+    This function fits an analytic efficiency model to the relative ETA of
+    the Power Rating Matrix with linear least squares. For the HEY model the
+    temperature coefficient is found with a bounded scalar search, the other
+    three parameters are linear for a given temperature coefficient.
+
+    Parameters
+    ----------
+    power_matrix : Pandas DataFrame
+        Power Matrix measured by Callab containing also the calcualted 'eta',
+        'g_round' and 't_round', please check the function
+        "prepare_power_matrix" in energy_rating_functions.py.
+    model : String, optional
+        Name of the model: "hey", "mpm5", "mpm6" or "pvgis". The default is
+        "hey".
+
+    Returns
+    -------
+    eta_model : EfficiencyModel
+        This object gets the relative ETA if a irradiance and temperature are
+        given. Its attributes "rmse", "max_error" and "r2" give the fit
+        quality against the measurements.
+    """
+    if model not in EFFICIENCY_MODELS:
+        raise ValueError("Unknown efficiency model '%s', please choose one "
+                         "of: %s" % (model, ", ".join(EFFICIENCY_MODELS)))
+    basis, offset, names = EFFICIENCY_MODELS[model]
+
+    # Relative ETA of the measurements
+    eta_stc = float(power_matrix.query(
+        "g_round == 1000 and t_round == 25")["eta"].values[0])
+    g = power_matrix["gmean"].values.astype(float)
+    dt = power_matrix["temp"].values.astype(float) - 25
+    eta_rel = power_matrix["eta"].values / eta_stc
+    x = basis(g, dt)
+
+    if model == "hey":
+        def solve(gamma):
+            design = x * (1 + gamma * dt)[:, None]
+            params = np.linalg.lstsq(design, eta_rel, rcond=None)[0]
+            return params, np.sum((design @ params - eta_rel) ** 2)
+        gamma = minimize_scalar(lambda gamma: solve(gamma)[1],
+                                bounds=(-0.02, 0.01), method="bounded",
+                                options={"xatol": 1e-9}).x
+        params = np.append(solve(gamma)[0], gamma)
+    else:
+        params = np.linalg.lstsq(x, eta_rel - offset, rcond=None)[0]
+
+    eta_model = EfficiencyModel(model=model, params=params)
+    # Fit quality
+    residuals = eta_model(g, dt + 25) - eta_rel
+    eta_model.rmse = float(np.sqrt(np.mean(residuals ** 2)))
+    eta_model.max_error = float(np.abs(residuals).max())
+    eta_model.r2 = float(1 - np.sum(residuals ** 2)
+                         / np.sum((eta_rel - eta_rel.mean()) ** 2))
+    return eta_model
+
+
+def fit_all_models(power_matrix):
+    """
+    This function fits all the analytic efficiency models to the Power Rating
+    Matrix and reports their parameters and fit quality.
+
+    Parameters
+    ----------
+    power_matrix : Pandas DataFrame
+        Power Matrix measured by Callab containing also the calcualted 'eta',
+        'g_round' and 't_round'.
+
+    Returns
+    -------
+    report : Pandas DataFrame
+        One row for each model with the parameters, "rmse", "max_error" and
+        "r2" of the fit.
+    """
+    report = pd.DataFrame(
+        {model: fit_efficiency_model(power_matrix, model).get_report()
+         for model in EFFICIENCY_MODELS}).T
+    # Fit quality at the end
+    quality = ["rmse", "max_error", "r2"]
+    columns = [c for c in report.columns if c not in quality] + quality
+    return report[columns]
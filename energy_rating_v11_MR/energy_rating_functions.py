@@ -10,6 +10,27 @@ based on IEC61853.
 # Importing the IEC91853 standard's code
 import pvpltools_python.pvpltools.iec61853 as std
 import pandas as pd
+import numpy as np
+from scipy.signal import lfilter
+# Importing the spectral engine
+import spectral_bands
+
+# Spectral irradiance columns of the standard climate files (29 bands)
+SPEC_BANDS = [
+    'Inclined global spectral irradiance,306.8-327.8nm',
+    '327.8-362.5nm', '362.5-407.5nm', '407.5-452.0nm', '452.0nm-517.7nm',
+    '517.7-540.0nm', '540.0-549.5nm', '549.5-566.6nm', '566.6-605.0nm',
+    '605.0-625.0nm', '625.0-666.7nm', '666.7-684.2nm', '684.2-704.4nm',
+    '704.4-742.6nm', '742.6-791.5nm', '791.5-844.5nm', '844.5-889.0nm',
+    '889.0-974.9nm', '974.9-1045.7nm', '1045.7-1194.2nm',
+    '1194.2-1515.9nm', '1515.9-1613.5nm', '1613.5-1964.8nm',
+    '1964.8-2153.5nm', '2153.5-2275.2nm', '2275.2-3001.9nm',
+    '3001.9-3635.4nm', '3635.4-3991.0nm', '3991.0-4605.65nm']
+
+# Inputs of the module temperature that are not taken as 0 before
+# "temp_correction", so their gaps restart the thermal inertia
+THERMAL_COLUMNS = ["T_amb", "wind"]
+
 
 def aoi_correction(climate_df, a_r, pv_tilt=20):
     """
@@ -44,6 +65,9 @@ def aoi_correction(climate_df, a_r, pv_tilt=20):
     ----------
     .. [1] Energy Rating Standard IEC61853-3
     """
+    # The columns are set on a shallow copy, the given DataFrame is not
+    # changed
+    climate_df = climate_df.copy(deep=False)
     # Getting the direct incident angle modifier
     b_mod = std.martin_ruiz(aoi=climate_df.IncidentAngle, a_r=a_r)
     # Direct in POA correction
@@ -61,11 +85,137 @@ def aoi_correction(climate_df, a_r, pv_tilt=20):
     return climate_df
 
 
+def bifacial_correction(climate_df, a_r, albedo, bifaciality, pv_tilt=20,
+                        front_ground=False):
+    """
+    This function adds the ground-reflected and rear side irradiance of a
+    bifacial module to the AOI corrected irradiance. It has to be called
+    after "aoi_correction". The ground is taken as an isotropic reflector
+    of the global horizontal irradiance and the sky diffuse as isotropic,
+    without shading of the ground or the rear side by other rows:
+
+        Front ground:  G_gf = albedo * Gh * (1 - cos(tilt)) / 2
+        Rear ground:   G_gr = albedo * Gh * (1 + cos(tilt)) / 2
+        Rear sky:      D_r  = Dh * (1 - cos(tilt)) / 2
+        Rear direct:   B_r  = Bn * max(-cos(AOI), 0)
+
+    Where Bn is the direct normal irradiance (Bh / sin(sun elevation)). The
+    ground and diffuse terms are AOI corrected with the Martin & Ruiz diffuse
+    modifiers (the ground modifier of the front side and both modifiers of
+    the rear side, with a tilt of 180 - tilt) and the rear direct one with
+    the Martin & Ruiz modifier at 180 - AOI. The effective irradiance is:
+
+        g_aoi = g_aoi_front + g_bifacial
+        g_bifacial = G_gf_aoi + bifaciality * g_rear_aoi
+
+    Where G_gf_aoi is only added with "front_ground".
+
+    Parameters
+    ----------
+    climate_df : Pandas DataFrame
+        DataFrame from "aoi_correction" with the columns "ghor", "ihor",
+        "dhor", "elev_sun" and "IncidentAngle".
+    a_r : Float
+        Angular response factor.
+    albedo : Float
+        Reflectance of the ground, e.g. 0.2 for grass or 0.6 for snow.
+    bifaciality : Float
+        Ratio of the rear to the front efficiency of the module, e.g. 0.7.
+    pv_tilt: float, optional.
+        PV tilt angle. The default is 20.
+    front_ground : Boolean, optional
+        If True the ground-reflected irradiance on the front side is added
+        too. The tilted irradiance "G_tlt" of the standard climate files is
+        the total irradiance on the front side, so the default is False.
+
+    Returns
+    -------
+    climate_df : Pandas DataFrame
+        A copy of "climate_df" with the extra columns "g_ground_front"
+        and "g_rear" (before the AOI correction), "g_rear_aoi", the
+        bifacial gain "g_bifacial" and the column "g_aoi" including it.
+    """
+    # The columns are set on a shallow copy, the given DataFrame is not
+    # changed
+    climate_df = climate_df.copy(deep=False)
+    cos_tilt = np.cos(np.radians(pv_tilt))
+    # Diffuse modifiers of the front and rear side
+    _, d_mod_ground = std.martin_ruiz_diffuse(surface_tilt=pv_tilt,
+                                              a_r=a_r, c1=0.4244, c2=None)
+    d_mod_sky_rear, d_mod_ground_rear = std.martin_ruiz_diffuse(
+        surface_tilt=180 - pv_tilt, a_r=a_r, c1=0.4244, c2=None)
+
+    ground = albedo * climate_df["ghor"].values
+    climate_df["g_ground_front"] = ground * (1 - cos_tilt) / 2
+    rear_ground = ground * (1 + cos_tilt) / 2
+    rear_sky = climate_df["dhor"].values * (1 - cos_tilt) / 2
+
+    # Direct irradiance on the rear side (sun behind the module)
+    aoi_rear = 180 - climate_df["IncidentAngle"].values
+    rear_direct = get_rear_direct(climate_df)
+
+    climate_df["g_rear"] = rear_ground + rear_sky + rear_direct
+    climate_df["g_rear_aoi"] = (
+        rear_ground * d_mod_ground_rear
+        + rear_sky * d_mod_sky_rear
+        + rear_direct * std.martin_ruiz(aoi=aoi_rear, a_r=a_r))
+    # Irradiance added to the front side AOI corrected irradiance
+    climate_df["g_bifacial"] = bifaciality * climate_df["g_rear_aoi"]
+    if front_ground:
+        climate_df["g_bifacial"] = (climate_df["g_bifacial"]
+                                    + climate_df["g_ground_front"]
+                                    * d_mod_ground)
+    climate_df["g_aoi"] = climate_df["g_aoi"] + climate_df["g_bifacial"]
+    return climate_df
+
+
+def get_rear_direct(climate_df):
+    """
+    This function calculates the direct irradiance on the rear side of the
+    module (sun behind the module), before the AOI correction. Please check
+    the function "bifacial_correction".
+
+    Parameters
+    ----------
+    climate_df : Pandas DataFrame
+        Climate data with the columns "ihor", "elev_sun" and
+        "IncidentAngle".
+
+    Returns
+    -------
+    rear_direct : Numpy array
+        Direct irradiance on the rear side in W/m².
+    """
+    elevation = climate_df["elev_sun"].values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b_normal = np.where(elevation > 0,
+                            climate_df["ihor"].values
+                            / np.sin(np.radians(elevation)), 0.0)
+    # Limit of the direct normal irradiance at very low sun elevations
+    b_normal = np.clip(b_normal, 0, 1361)
+    return b_normal * np.maximum(-np.cos(np.radians(
+        climate_df["IncidentAngle"].values)), 0)
+
+
+def get_banded_responsivity(spec_resp_factor=None,
+                            bands=spectral_bands.IEC_BANDS):
+    """
+    Converts the spectral response of the module to the bands of the climate
+    data (by default the 29 bands of the standard climate files). When
+    'None' a flat spectral responsivity of 1.0 is used. Please check
+    "get_banded_responsivity" in spectral_bands.py.
+    """
+    return spectral_bands.get_banded_responsivity(spec_resp_factor,
+                                                  bands=bands)
+
+
 def spec_correction(climate_df, spec_resp_factor=None):
     """
     Corrects the global irradiance in the POA spectrally. It takes the
     functions from iec61853.py file based on spectral correction model from
-    the Energy rating standard IEC61853-3 [1].
+    the Energy rating standard IEC61853-3 [1]. The spectral bands are read
+    from the column names of the climate data, so any band layout can be
+    used, please check spectral_bands.py.
 
     For more detailes, please check the iec61853.py file with the functions
     and the document of the standard.
@@ -81,52 +231,40 @@ def spec_correction(climate_df, spec_resp_factor=None):
     Returns
     -------
     climate_df : Pandas DataFrame
-        A copy of "climate_df" with an extra column named "g_spec".
+        A copy of "climate_df" with an extra column named "g_spec", the NaN
+        values taken as 0 (besides THERMAL_COLUMNS, please check
+        "temp_correction").
 
     References
     ----------
     .. [1] Energy Rating Standard IEC61853-3.
     """
 
+    # The columns are set on a shallow copy, the given DataFrame is not
+    # changed
+    climate_df = climate_df.copy(deep=False)
     # Get just the spectral irradiance
-    spec_bands = [
-        'Inclined global spectral irradiance,306.8-327.8nm',
-        '327.8-362.5nm', '362.5-407.5nm', '407.5-452.0nm', '452.0nm-517.7nm',
-        '517.7-540.0nm', '540.0-549.5nm', '549.5-566.6nm', '566.6-605.0nm',
-        '605.0-625.0nm', '625.0-666.7nm', '666.7-684.2nm', '684.2-704.4nm',
-        '704.4-742.6nm', '742.6-791.5nm', '791.5-844.5nm', '844.5-889.0nm',
-        '889.0-974.9nm', '974.9-1045.7nm', '1045.7-1194.2nm',
-        '1194.2-1515.9nm', '1515.9-1613.5nm', '1613.5-1964.8nm',
-        '1964.8-2153.5nm', '2153.5-2275.2nm', '2275.2-3001.9nm',
-        '3001.9-3635.4nm', '3635.4-3991.0nm', '3991.0-4605.65nm']
-    spec_g = pd.DataFrame()
-    for band in spec_bands:
-        spec_g[band]= climate_df[band]
-
-    # Convert the spectral response to banded (29 bands)
-    if spec_resp_factor is None:
-        spec_resp_factor = 1.0
-        # flat Spectral Responsivity beyond limts
-        sr = pd.Series([spec_resp_factor, spec_resp_factor], [200, 5000])
-        fsr = std.convert_to_banded(sr)
-    else:
-        fsr = std.convert_to_banded(spec_resp_factor)
-    
-    c_j = []
-    #Get the spectral modifier for each hour (C_j) - EQ.6
-    for i in range(8760):
-        spectral_factor = std.calc_spectral_factor(spec_g.iloc[i], fsr)
-        c_j.append(spectral_factor)
-        
-    
+    bands = spectral_bands.get_climate_bands(climate_df.columns)
+    spec_g = climate_df[list(bands[0])].values
+
+    # Convert the spectral response to banded (cached sparse operator)
+    fsr = get_banded_responsivity(spec_resp_factor, bands=bands)
+
+    #Get the spectral modifier for all the hours at once (C_j) - EQ.6
+    c_j = spectral_bands.get_spectral_factor(spec_g, fsr, bands=bands)
+
     climate_df["spectral_modifier"] = c_j
     climate_df["g_spec"] = climate_df["spectral_modifier"] * climate_df["g_aoi"]
+    # The ambient temperature and the wind speed are filled in
+    # "temp_correction", once their gaps are known
+    thermal = climate_df[THERMAL_COLUMNS]
     climate_df = climate_df.fillna(0)
+    climate_df[THERMAL_COLUMNS] = thermal
 
     return climate_df
 
 
-def temp_correction(climate_df, u0, u1):
+def temp_correction(climate_df, u0, u1, tau=None):
     """
     This function calls the temperature correction function from
     iec61853.py file based on faiman model from the
@@ -140,25 +278,135 @@ def temp_correction(climate_df, u0, u1):
     climate_df : Pandas DataFrame
         DataFrame with "g_aoi" (irradiance AOI corrected), "T_amb" (Ambient
         temperature) and "wind" column.
+    u0 : Float
+        Combined heat loss factor coefficient [W/(m^2 C)].
+    u1 : Float
+        Combined heat loss factor influenced by wind [(W/m^2 C)(m/s)].
+    tau : Float, optional
+        Thermal time constant of the module in seconds, e.g. 420. When given,
+        the steady-state Faiman temperature is passed through a first-order
+        filter to account for the thermal inertia of the module, please check
+        the function "transient_temperature". The time steps without ambient
+        temperature or wind speed are gaps of the filter: their module
+        temperature is NaN (so they are left out of the CSER) and the filter
+        restarts after them. The default is None (steady-state temperature).
 
     Returns
     -------
     climate_df : Pandas DataFrame
         Copy of "climate_df" with an extra column named "T_mod" with
-        the module's temperature calculated.
+        the module's temperature calculated. The NaN values of the ambient
+        temperature and the wind speed are taken as 0.
 
     References
     ----------
     .. [1] Energy Rating Standard IEC61853-3.
     """
+    # The columns are set on a shallow copy, the given DataFrame is not
+    # changed
+    climate_df = climate_df.copy(deep=False)
+    missing = get_thermal_gaps(climate_df)
+    climate_df[THERMAL_COLUMNS] = climate_df[THERMAL_COLUMNS].fillna(0)
     # Get module temperature
     climate_df["T_mod"] = std.faiman(poa_global=climate_df["g_aoi"],
                                      temp_air=climate_df["T_amb"],
                                      wind_speed=climate_df["wind"],
                                      u0=u0, u1=u1)
+    if tau is not None:
+        # Thermal inertia of the module, restarted after the gaps
+        climate_df["T_mod"] = transient_temperature(
+            temp_steady=climate_df["T_mod"].where(~missing),
+            tau=tau)
     return climate_df
 
 
+def get_thermal_gaps(climate_df):
+    """
+    Returns a boolean Numpy array, True for the time steps of "climate_df"
+    without ambient temperature or wind speed (THERMAL_COLUMNS).
+    """
+    return climate_df[THERMAL_COLUMNS].isna().any(axis=1).values
+
+
+def transient_temperature(temp_steady, tau):
+    """
+    This function applies a first-order time-constant filter to the
+    steady-state module temperature:
+
+        dT_mod/dt = (T_steady - T_mod) / tau
+
+        which for a time step dt_k gives the recursive (IIR) filter:
+
+        T_mod[k] = a_k * T_mod[k-1] + (1 - a_k) * T_steady[k]
+
+        Where a_k = exp(-dt_k / tau) and T_mod[0] = T_steady[0].
+
+    For a constant time step the filter is run with scipy's "lfilter". For
+    irregular time steps (e.g. the solar time of the standard climate files
+    or measured data with gaps) the closed-form solution of the recursion is
+    evaluated with cumulative sums, split in blocks to keep it within the
+    floating point range. In both cases there is no loop over the time steps.
+
+    Missing values (NaN) of the steady-state temperature stay missing and
+    the filter restarts from the steady-state temperature after each gap,
+    so a missing measurement does not spread to the rest of the series.
+
+    Parameters
+    ----------
+    temp_steady : Pandas Series
+        Steady-state module temperature in °C with Datetime index.
+    tau : Float
+        Thermal time constant of the module in seconds.
+
+    Returns
+    -------
+    temp_mod : Pandas Series
+        Module temperature in °C with the thermal inertia.
+    """
+    x = temp_steady.values.astype(float)
+    if len(x) < 2 or tau <= 0:
+        return temp_steady.copy()
+    valid = ~np.isnan(x)
+    if not valid.all():
+        # Each run of values is filtered on its own
+        y = np.full(len(x), np.nan)
+        for start, stop in zip(*_get_block_limits(valid.astype(int))):
+            if valid[start]:
+                y[start:stop] = transient_temperature(
+                    temp_steady=temp_steady.iloc[start:stop], tau=tau).values
+        return pd.Series(y, index=temp_steady.index, name=temp_steady.name)
+
+    seconds = (temp_steady.index - temp_steady.index[0]).total_seconds()
+    step = np.diff(np.asarray(seconds, dtype=float))
+    step_median = np.median(step)
+
+    if np.all(np.abs(step - step_median) <= 0.01 * step_median):
+        # Constant time step: IIR filter
+        a = np.exp(-step_median / tau)
+        y, _ = lfilter([1 - a], [1, -a], x, zi=[a * x[0]])
+    else:
+        # Irregular time step: T_mod[k] = P_k * (T_mod[s] + sum(w_j / P_j))
+        # with P_k the product of a_j since the start s of the block.
+        # Steps longer than 50 tau are a full relaxation (a_k ~ 0).
+        decay = np.minimum(np.r_[0.0, step] / tau, 50.0)
+        block = (np.cumsum(decay) // 500).astype(int)
+        y = np.empty(len(x))
+        y_start = x[0]
+        for start, stop in zip(*_get_block_limits(block)):
+            cum_decay = np.cumsum(decay[start:stop])
+            weights = -np.expm1(-decay[start:stop]) * x[start:stop]
+            y[start:stop] = np.exp(-cum_decay) * (
+                y_start + np.cumsum(weights * np.exp(cum_decay)))
+            y_start = y[stop - 1]
+    return pd.Series(y, index=temp_steady.index, name=temp_steady.name)
+
+
+def _get_block_limits(block):
+    # Start and stop positions of the runs of equal values in "block"
+    change = np.flatnonzero(np.diff(block)) + 1
+    return np.r_[0, change], np.r_[change, len(block)]
+
+
 def module_power_er(climate_df, eta_interpolated, power_matrix, module_area):
     """
     Calculates the instantaneous power from the energy rating simulation. This
@@ -183,7 +431,9 @@ def module_power_er(climate_df, eta_interpolated, power_matrix, module_area):
         ("g_spec"), the Module temperature calculated ("T_mod") based on [1].
     eta_interpolated: Object.
         This object gets the ETA if a irradiance and temperature are given.
-        Please check the function "get_eta_interpolation"
+        Please check the function "get_eta_interpolation". It can also be a
+        dense lookup table (eta_lookup.py) or an analytic efficiency model
+        (efficiency_models.py).
 
     Returns
     -------
@@ -195,19 +445,89 @@ def module_power_er(climate_df, eta_interpolated, power_matrix, module_area):
     ----------
     .. [1] Energy Rating Standard IEC61853-3.
     """
+    # The columns are set on a shallow copy, the given DataFrame is not
+    # changed
+    climate_df = climate_df.copy(deep=False)
     # Calculate relative ETA at G and T
     climate_df["eta_rel"] = eta_interpolated(climate_df[["g_spec"]],
                                          climate_df[["T_mod"]])
 
     # Calculates ETA
     climate_df["eta"] = (climate_df["eta_rel"] 
-                         * power_matrix.query("g_round == 1000 and t_round == 25")["eta"].values)
+                         * get_eta_stc(power_matrix=power_matrix,
+                                       module_area=module_area))
 
     climate_df["Pout"] = climate_df["eta"] * climate_df["g_spec"] *module_area
 
     return climate_df
 
 
+def prepare_power_matrix(module_df, module_area, eta_calc=False):
+    """
+    This function gives a copy of the power matrix with the columns used by
+    the simulation: "eta" (efficiency ETA, calculated from the power when
+    "eta_calc" is False), "g_round" (irradiance rounded to 100 W/m²) and
+    "t_round" (temperature rounded to 5 °C). The given power matrix is not
+    changed.
+
+    Parameters
+    ----------
+    module_df: Pandas DataFrame
+        Power matrix with the irradiance, temperature and power measurements.
+    module_area: Float
+        Module area in m²
+    eta_calc: Boolean, optional
+        If False then efficiency ETA is calcualted from the power matrix.
+        The default is False.
+
+    Returns
+    -------
+    power_matrix: Pandas DataFrame
+        Copy of "module_df" with the columns "eta", "g_round" and "t_round".
+    """
+    module_df = module_df.copy()
+    if eta_calc == False:
+        # Calculate ETA 
+        module_df['eta'] = (module_df["pmpp"] / module_area)/ module_df["gmean"]
+
+    module_df["g_round"] = module_df["gmean"].round(decimals=-2)
+    module_df["t_round"] = module_df["temp"].round()
+    module_df["t_round"] = 5 * round(module_df["t_round"] / 5)
+    return module_df
+
+
+def get_eta_stc(power_matrix, module_area):
+    """
+    This function gets the efficiency ETA at STC (1000 W/m² and 25 °C, with
+    the rounding of "prepare_power_matrix") of a power matrix. The "eta"
+    column is used when the matrix has it, otherwise ETA is calculated from
+    the power, so the power matrix read from the CalLab file can be given
+    directly.
+
+    Parameters
+    ----------
+    power_matrix: Pandas DataFrame
+        Power matrix with the irradiance, temperature and power measurements
+        (and optionally 'eta').
+    module_area: Float
+        Module area in m²
+
+    Returns
+    -------
+    eta_stc: Float
+        Efficiency ETA at STC.
+    """
+    g_round = power_matrix["gmean"].round(decimals=-2)
+    t_round = 5 * round(power_matrix["temp"].round() / 5)
+    stc = power_matrix[(g_round == 1000) & (t_round == 25)]
+    if stc.empty:
+        raise ValueError("The power matrix has no measurement at STC "
+                         "(1000 W/m² and 25 °C)")
+    if "eta" in stc:
+        return float(stc["eta"].values[0])
+    return float(((stc["pmpp"] / module_area) / stc["gmean"]).values[0])
+
+
 def get_eta_interpolation(module_df, module_area, eta_calc):
     """
     This function returns the ETA interpolated object using the function in
@@ -221,6 +541,8 @@ def get_eta_interpolation(module_df, module_area, eta_calc):
     ----------
     module_df: Pandas DataFrame
         Power matrix with the irradiance, temperature and power measurements.
+        It is not changed, the simulation takes the power matrix from
+        "prepare_power_matrix".
     module_area: Float
         Module area in m²
     eta_calc: Boolean
@@ -241,14 +563,10 @@ def get_eta_interpolation(module_df, module_area, eta_calc):
     [1] Energy Rating Standard IEC61853-3.
     """
 
-    if eta_calc == False:
-        # Calculate ETA 
-        module_df['eta'] = (module_df["pmpp"] / module_area)/ module_df["gmean"]
-
-
-    module_df["g_round"] = module_df["gmean"].round(decimals=-2)
-    module_df["t_round"] = module_df["temp"].round()
-    module_df["t_round"] = 5 * round(module_df["t_round"] / 5)
+    # ETA and rounded irradiance and temperature, on a copy of the matrix
+    module_df = prepare_power_matrix(module_df=module_df,
+                                     module_area=module_area,
+                                     eta_calc=eta_calc)
     module_df = module_df.drop_duplicates(["g_round", "t_round"])
     
     # get nominal power from measurements
@@ -0,0 +1,648 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the numerical equivalence harness of the Energy Rating
+engines. The NumPy steps ("ersim_dc_steps" in sim_steps.py, the reference)
+and the optimized engines are run with the same modules, climates and
+thermal time constants, and compared:
+
+    - CSER and average ETA of each engine against the reference, within
+        a relative tolerance.
+    - Hourly columns (AOI, spectral, thermal, ETA and power) of the engines
+        that give them, within a relative and an absolute tolerance, and
+        the same time steps left out.
+    - Hourly columns of the reference against the summary of the output
+        pinned in example_data/results/baseline_summary.csv (steps of the
+        first version of this tree, steady-state temperature, example
+        modules and six standard climates): number of time steps, mean,
+        weighted mean, minimum and maximum of each column, with the same
+        tolerances.
+    - CSER and average ETA of the reference against the results committed
+        in example_data/results/results_cser_eta.xlsx (golden results),
+        besides the known deviations (please check KNOWN_DEVIATIONS).
+
+The modules can be the example CalLab files or synthetic batches (please
+check synthetic.py) and the climates the six standard climates or the sites
+of a site index:
+
+    python equivalence.py
+    python equivalence.py --synthetic 50 --seed 1 --tau 300
+    python equivalence.py --bifaciality 0.7 --albedo 0.3
+
+@author: mriveraa
+"""
+import argparse
+import glob
+import tempfile
+from os.path import abspath, basename, dirname, isfile, join
+import numpy as np
+import pandas as pd
+# Importing the Steps Function
+import sim_steps
+# Importing the fused kernel
+import fused_kernel
+# Importing the stage graph
+import stage_graph
+# Importing read functions
+import read_functions
+# Importing the climate store
+import climate_store
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the synthetic data generator
+import synthetic
+
+FOLDER = dirname(abspath(__file__))
+EXAMPLE_FOLDER = join(FOLDER, "example_data")
+GOLDEN_PATH = join(EXAMPLE_FOLDER, "results", "results_cser_eta.xlsx")
+BASELINE_PATH = join(EXAMPLE_FOLDER, "results", "baseline_summary.csv")
+
+# Largest relative difference of the CSER and average ETA of an engine, the
+# closed-form thermal inertia of the NumPy steps differs from the recursion
+# of the fused kernel around 1e-9
+RTOL = 1e-8
+# Tolerances of the hourly columns
+HOURLY_RTOL = 1e-8
+HOURLY_ATOL = 1e-9
+# Largest absolute difference with the golden results (the excel file has
+# the full values, the Trinasolar column is given within 1e-15)
+GOLDEN_ATOL = 1e-6
+# Golden results that the reference is known not to give, by (module,
+# climate), with the reason. These cases are still checked against the
+# pinned baseline output
+KNOWN_DEVIATIONS = {
+    ("Sunpower_SPR-MAX3-375-BLK", climate):
+        "the Sunpower column of results_cser_eta.xlsx was written before the "
+        "first version of this tree: its steps give %s, as the reference and "
+        "the pinned baseline output" % values
+    for climate, values in [
+        ("Tropical humid",
+         "CSER 0.941694 and ETA 0.203610, excel 0.941547 and 0.203386"),
+        ("Subtropical arid (desert)",
+         "CSER 0.934175 and ETA 0.200602, excel 0.933866 and 0.200258"),
+        ("Subtropical coastal",
+         "CSER 0.972990 and ETA 0.207843, excel 0.972629 and 0.207355"),
+        ("Temperate coastal",
+         "CSER 0.992566 and ETA 0.214337, excel 0.990215 and 0.212535"),
+        ("High elevation (above 3 000 m)",
+         "CSER 0.985285 and ETA 0.212854, excel 0.984340 and 0.211981"),
+        ("Temperate continental",
+         "CSER 0.983992 and ETA 0.212768, excel 0.984213 and 0.213767")]}
+
+# Hourly columns of the simulation compared between engines
+HOURLY_COLUMNS = ["b_aoi", "d_aoi", "g_aoi", "spectral_modifier", "g_spec",
+                  "T_mod", "eta_rel", "eta", "Pout"]
+# Statistics of each hourly column in the pinned baseline output
+SUMMARY_STATS = ["count", "mean", "weighted_mean", "min", "max"]
+
+# Stage graph shared by the runs, so the memoized stages are checked too
+_graph = stage_graph.StageGraph()
+
+
+def _get_kwargs(module, pv_tilt, tau):
+    return {"eta_interpolated": module["eta_interpolated"],
+            "pnom": module["pnom"],
+            "mod_area": module["module_area"],
+            "u0": module["u0"],
+            "u1": module["u1"],
+            "a_r": module["a_r"],
+            "power_matrix": module["power_matrix"],
+            "pv_tilt": pv_tilt,
+            "spec_resp_factor": module["spec_resp"],
+            "tau": tau,
+            "bifaciality": module["bifaciality"],
+            "albedo": module["albedo"]}
+
+
+def run_steps(climate_data, module, pv_tilt, tau):
+    """
+    Reference engine: the NumPy steps of sim_steps.py.
+    """
+    return sim_steps.ersim_dc_steps(climate_data=climate_data,
+                                    eta_matrix=None,
+                                    **_get_kwargs(module, pv_tilt, tau))
+
+
+def run_fused(climate_data, module, pv_tilt, tau):
+    """
+    Fused kernel of fused_kernel.py, without hourly columns.
+    """
+    cser, eta_avg = fused_kernel.ersim_dc_fused(
+        climate_data=climate_data, **_get_kwargs(module, pv_tilt, tau))
+    return cser, eta_avg, None
+
+
+def run_daylight(climate_data, module, pv_tilt, tau):
+    """
+    Daylight-only steps of sim_steps.py, scattered to all the time steps.
+    """
+    return sim_steps.ersim_dc_daylight(climate_data=climate_data,
+                                       full_output=True,
+                                       **_get_kwargs(module, pv_tilt, tau))
+
+
+def run_stage_graph(climate_data, module, pv_tilt, tau):
+    """
+    Memoized stages of stage_graph.py.
+    """
+    return _graph.ersim_dc_steps(climate_data=climate_data,
+                                 **_get_kwargs(module, pv_tilt, tau))
+
+
+# Engines compared with the reference: each one takes the climate data, the
+# module characterisation (please check "get_module_characterisation" in
+# multi_site.py), the tilt and "tau", and gives the CSER, the average ETA and
+# the DataFrame of the simulation (None if it has no hourly columns)
+ENGINES = {"fused": run_fused,
+           "daylight": run_daylight,
+           "stage_graph": run_stage_graph}
+
+
+def get_climates(sites=None):
+    """
+    This function reads the climates of the comparison.
+
+    Parameters
+    ----------
+    sites : Pandas DataFrame, optional
+        Site index, please check "read_site_index" in multi_site.py. The
+        default is None (six standard climates).
+
+    Returns
+    -------
+    climates : List
+        One tuple (climate name, tilt, climate data) per climate.
+    """
+    climates = []
+    if sites is None:
+        for location in range(6):
+            std_location = read_functions.read_standard_locations(location)
+            climates.append((std_location["site_name"],
+                             std_location["pv_tilt"],
+                             climate_store.get_climate(
+                                 folder_locations=join(FOLDER, "the_standard"),
+                                 loc_name=std_location["loc"])))
+        return climates
+    for site in sites.to_dict("records"):
+        climate_data = read_functions.change_names_climate_df(
+            read_functions.read_climate_locs(
+                folder_locations=dirname(site["file"]),
+                loc_name=basename(site["file"])))
+        climates.append((str(site["site_id"]), site["pv_tilt"],
+                         climate_data))
+    return climates
+
+
+def compare_hourly(reference, candidate, rtol=HOURLY_RTOL, atol=HOURLY_ATOL):
+    """
+    This function compares the hourly columns of two simulations.
+
+    Parameters
+    ----------
+    reference, candidate : Pandas DataFrame
+        DataFrames of the simulations (time steps with NaN values left out).
+    rtol, atol : Float, optional
+        Relative and absolute tolerances, as in "numpy.allclose".
+
+    Returns
+    -------
+    equivalent : Boolean
+        True if both have the same time steps and all the columns are
+        within the tolerances.
+    max_diff : Float
+        Largest absolute difference (infinite if the time steps differ).
+    column : String
+        Column with the largest difference.
+    """
+    if not reference.index.equals(candidate.index):
+        return False, np.inf, "index"
+    equivalent, max_diff, worst = True, 0.0, None
+    for column in HOURLY_COLUMNS:
+        if column not in reference or column not in candidate:
+            continue
+        ref = reference[column].values.astype(float)
+        new = candidate[column].values.astype(float)
+        equivalent &= bool(np.allclose(new, ref, rtol=rtol, atol=atol,
+                                       equal_nan=True))
+        with np.errstate(invalid="ignore"):
+            diff = np.nanmax(np.abs(new - ref), initial=0.0)
+        if diff > max_diff or worst is None:
+            max_diff, worst = diff, column
+    return equivalent, max_diff, worst
+
+
+def get_summary(sim_df):
+    """
+    This function gives the summary of the hourly columns of a simulation
+    that is pinned instead of the hourly values: number of time steps kept
+    ("count"), "mean", mean weighted by the position of the time step from
+    1/n to 1 ("weighted_mean", so shifted or reordered time steps are
+    found), "min" and "max".
+
+    Parameters
+    ----------
+    sim_df : Pandas DataFrame
+        DataFrame of the simulation (time steps with NaN values left out).
+
+    Returns
+    -------
+    summary : Pandas DataFrame
+        One row per column of HOURLY_COLUMNS with SUMMARY_STATS.
+    """
+    weights = np.arange(1, len(sim_df) + 1) / max(len(sim_df), 1)
+    summary = {}
+    for column in HOURLY_COLUMNS:
+        values = sim_df[column].values.astype(float)
+        summary[column] = [len(values), values.mean(),
+                           (values * weights).mean(), values.min(),
+                           values.max()]
+    summary = pd.DataFrame.from_dict(summary, orient="index",
+                                     columns=SUMMARY_STATS)
+    summary.index.name = "column"
+    return summary
+
+
+def compare_summary(pinned, candidate, rtol=HOURLY_RTOL, atol=HOURLY_ATOL):
+    """
+    This function compares the hourly columns of a simulation with a pinned
+    summary, please check "get_summary".
+
+    Parameters
+    ----------
+    pinned : Pandas DataFrame
+        Pinned summary of the reference.
+    candidate : Pandas DataFrame
+        DataFrame of the simulation (time steps with NaN values left out).
+    rtol, atol : Float, optional
+        Relative and absolute tolerances, as in "numpy.allclose".
+
+    Returns
+    -------
+    equivalent : Boolean
+        True if both have the same number of time steps and all the
+        statistics are within the tolerances.
+    max_diff : Float
+        Largest absolute difference of the statistics (infinite if the
+        number of time steps differs).
+    column : String
+        Column with the largest difference.
+    """
+    summary = get_summary(candidate).loc[pinned.index, SUMMARY_STATS]
+    pinned = pinned[SUMMARY_STATS]
+    if not (summary["count"] == pinned["count"]).all():
+        return False, np.inf, "count"
+    equivalent = bool(np.allclose(summary.values, pinned.values, rtol=rtol,
+                                  atol=atol))
+    diff = (summary - pinned).abs().max(axis=1)
+    return equivalent, diff.max(), diff.idxmax()
+
+
+def read_baseline(path=BASELINE_PATH):
+    """
+    This function reads the pinned summary of the hourly output of the
+    reference.
+
+    Parameters
+    ----------
+    path : String, optional
+        Path like. Path to the csv file. The default is BASELINE_PATH.
+
+    Returns
+    -------
+    baseline : Dictionary
+        One summary (please check "get_summary") per (module, climate).
+        Empty if the file does not exist.
+    """
+    if path is None or not isfile(path):
+        return {}
+    baseline = pd.read_csv(path, index_col="column")
+    return {key: frame[SUMMARY_STATS]
+            for key, frame in baseline.groupby(["module", "climate"],
+                                               sort=False)}
+
+
+def write_baseline(path=BASELINE_PATH, module_files=None):
+    """
+    This function pins the summary of the hourly output of the reference,
+    with the steady-state temperature and the six standard climates. Only
+    needed after an intended change of the numbers of the simulation
+    (please check ENGINE_VERSION in utils.py).
+
+    Parameters
+    ----------
+    path : String, optional
+        Path like. Path to the csv file. The default is BASELINE_PATH.
+    module_files : List, optional
+        Paths to the CalLab files. The default is None (example files).
+
+    Returns
+    -------
+    None.
+    """
+    if module_files is None:
+        module_files = sorted(glob.glob(join(EXAMPLE_FOLDER, "*.txt")))
+    modules = [multi_site.get_module_characterisation(path)
+               for path in module_files]
+    frames = []
+    for climate, pv_tilt, climate_data in get_climates():
+        for module in modules:
+            sim_df = run_steps(climate_data, module, pv_tilt, None)[2]
+            frame = get_summary(sim_df)
+            frame.insert(0, "climate", climate)
+            frame.insert(0, "module", module["int_id"])
+            frames.append(frame)
+    pd.concat(frames).to_csv(path, float_format="%.15g")
+
+
+def _relative_diff(value, reference):
+    return abs(value - reference) / abs(reference) if reference \
+        else abs(value - reference)
+
+
+def run_equivalence(module_files=None, sites=None, taus=(None,),
+                    engines=None, rtol=RTOL, hourly_rtol=HOURLY_RTOL,
+                    hourly_atol=HOURLY_ATOL, baseline=None,
+                    bifaciality=None, albedo=0.2):
+    """
+    This function runs the reference and the engines with all the modules,
+    climates and thermal time constants, and compares them.
+
+    Parameters
+    ----------
+    module_files : List, optional
+        Paths to the CalLab files. The default is None (example files).
+    sites : Pandas DataFrame, optional
+        Site index, please check "read_site_index" in multi_site.py. The
+        default is None (six standard climates).
+    taus : List, optional
+        Thermal time constants in seconds (None for the steady-state
+        temperature). The default is (None,).
+    engines : Dictionary, optional
+        Engines compared by name, please check ENGINES. The default is None
+        (ENGINES).
+    rtol : Float, optional
+        Largest relative difference of the CSER and average ETA. The default
+        is RTOL.
+    hourly_rtol, hourly_atol : Float, optional
+        Tolerances of the hourly columns. The default is HOURLY_RTOL and
+        HOURLY_ATOL.
+    baseline : Dictionary, optional
+        Pinned hourly output of the reference, please check
+        "read_baseline". The reference is compared with it for the
+        monofacial modules and climates in both, with the steady-state
+        temperature. The default is None (no comparison).
+    bifaciality, albedo : Float, optional
+        Bifacial rating of the modules without "Bifaciality" in the CalLab
+        file, please check "get_module_characterisation" in multi_site.py.
+        The default is None (monofacial) and 0.2.
+
+    Returns
+    -------
+    results : Pandas DataFrame
+        One row per module, climate, "tau" and engine (the reference is
+        "steps") with the "bifaciality" of the module, "cser", "eta_avg",
+        their relative differences with the reference ("diff_cser" and
+        "diff_eta_avg"), the largest
+        difference of the hourly columns ("hourly_diff" and
+        "hourly_column", NaN and None without hourly columns) and "passed".
+        The hourly differences of the reference are the ones with the
+        pinned output (NaN and None without it).
+    """
+    if module_files is None:
+        module_files = sorted(glob.glob(join(EXAMPLE_FOLDER, "*.txt")))
+    engines = ENGINES if engines is None else engines
+    baseline = {} if baseline is None else baseline
+    modules = [multi_site.get_module_characterisation(
+        path, bifaciality=bifaciality, albedo=albedo)
+        for path in module_files]
+    rows = []
+    for climate, pv_tilt, climate_data in get_climates(sites):
+        for tau in taus:
+            for module in modules:
+                cser, eta_avg, sim_df = run_steps(climate_data, module,
+                                                  pv_tilt, tau)
+                key = {"module": module["int_id"], "climate": climate,
+                       "tau": tau, "bifaciality": module["bifaciality"]}
+                passed, hourly_diff, hourly_column = True, np.nan, None
+                pinned = baseline.get((module["int_id"], climate))
+                if (tau is None and module["bifaciality"] is None
+                        and pinned is not None):
+                    passed, hourly_diff, hourly_column = compare_summary(
+                        pinned, sim_df, rtol=hourly_rtol, atol=hourly_atol)
+                rows.append(dict(key, engine="steps", cser=cser,
+                                 eta_avg=eta_avg, diff_cser=0.0,
+                                 diff_eta_avg=0.0, hourly_diff=hourly_diff,
+                                 hourly_column=hourly_column,
+                                 passed=bool(passed)))
+                for name, engine in engines.items():
+                    e_cser, e_eta_avg, e_df = engine(climate_data, module,
+                                                     pv_tilt, tau)
+                    diff_cser = _relative_diff(e_cser, cser)
+                    diff_eta_avg = _relative_diff(e_eta_avg, eta_avg)
+                    passed = diff_cser <= rtol and diff_eta_avg <= rtol
+                    hourly_diff, hourly_column = np.nan, None
+                    if e_df is not None:
+                        hourly_passed, hourly_diff, hourly_column = \
+                            compare_hourly(sim_df, e_df, rtol=hourly_rtol,
+                                           atol=hourly_atol)
+                        passed &= hourly_passed
+                    rows.append(dict(key, engine=name, cser=e_cser,
+                                     eta_avg=e_eta_avg, diff_cser=diff_cser,
+                                     diff_eta_avg=diff_eta_avg,
+                                     hourly_diff=hourly_diff,
+                                     hourly_column=hourly_column,
+                                     passed=bool(passed)))
+    return pd.DataFrame(rows)
+
+
+def read_golden_results(path=GOLDEN_PATH):
+    """
+    This function reads the CSER and average ETA of an excel file of results
+    (please check "write_results" in utils.py).
+
+    Parameters
+    ----------
+    path : String, optional
+        Path like. Path to the excel file. The default is GOLDEN_PATH.
+
+    Returns
+    -------
+    golden : Pandas DataFrame
+        One row per module and climate with "cser" and "eta_avg".
+    """
+    sheet = pd.read_excel(path, sheet_name="Results", header=None)
+    # Header rows of the CSER and ETA tables
+    headers = sheet.index[sheet[1] == "Std_climate"]
+    tables = {}
+    for name, start, end in zip(["cser", "eta_avg"], headers,
+                                list(headers[1:]) + [len(sheet)]):
+        table = sheet.iloc[start + 1:end, 1:]
+        table.columns = sheet.iloc[start, 1:]
+        table = table.dropna(subset=["Std_climate"]).set_index("Std_climate")
+        # Columns "cser_<Internal_ID>" and "eta_<Internal_ID>"
+        table.columns = [column.split("_", 1)[1] for column in table.columns]
+        tables[name] = table.stack().astype(float)
+    golden = pd.DataFrame(tables)
+    golden.index.names = ["climate", "module"]
+    return golden.swaplevel().sort_index().reset_index()
+
+
+def check_golden(results, path=GOLDEN_PATH, atol=GOLDEN_ATOL,
+                 known_deviations=None):
+    """
+    This function compares the CSER and average ETA of the reference with
+    the golden results, for the monofacial modules and climates in both.
+
+    Parameters
+    ----------
+    results : Pandas DataFrame
+        Results of "run_equivalence".
+    path : String, optional
+        Path like. Path to the excel file. The default is GOLDEN_PATH.
+    atol : Float, optional
+        Largest absolute difference. The default is GOLDEN_ATOL.
+    known_deviations : Dictionary, optional
+        Reasons of the golden results that are not checked, by (module,
+        climate). The default is None (KNOWN_DEVIATIONS).
+
+    Returns
+    -------
+    golden : Pandas DataFrame
+        One row per module, climate and "tau" with the values of the
+        reference ("cser" and "eta_avg"), of the file ("golden_cser" and
+        "golden_eta_avg"), their absolute differences, the reason of the
+        known deviation ("known_deviation", None if it is not one) and
+        "passed".
+    """
+    if known_deviations is None:
+        known_deviations = KNOWN_DEVIATIONS
+    reference = results[(results["engine"] == "steps")
+                        & results["bifaciality"].isna()]
+    golden = read_golden_results(path).rename(
+        columns={"cser": "golden_cser", "eta_avg": "golden_eta_avg"})
+    golden = reference[["module", "climate", "tau", "cser", "eta_avg"]].merge(
+        golden, on=["module", "climate"])
+    golden["diff_cser"] = (golden["cser"] - golden["golden_cser"]).abs()
+    golden["diff_eta_avg"] = (golden["eta_avg"]
+                              - golden["golden_eta_avg"]).abs()
+    golden["known_deviation"] = [
+        known_deviations.get(key) for key in
+        zip(golden["module"], golden["climate"])]
+    golden["passed"] = (((golden["diff_cser"] <= atol)
+                         & (golden["diff_eta_avg"] <= atol))
+                        | golden["known_deviation"].notna())
+    return golden
+
+
+def run_synthetic(n_modules, seed=None, sites=None, taus=(None,),
+                  engines=None, **kwargs):
+    """
+    This function runs "run_equivalence" with a batch of synthetic modules,
+    written to a temporary folder.
+
+    Parameters
+    ----------
+    n_modules : Integer
+        Number of modules.
+    seed : Integer, optional
+        Seed of the generator, please check "write_modules" in synthetic.py.
+        The default is None.
+    sites, taus, engines, kwargs :
+        Please check the function "run_equivalence".
+
+    Returns
+    -------
+    results : Pandas DataFrame
+        Please check the function "run_equivalence".
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        module_files = synthetic.write_modules(folder, n_modules, seed=seed)
+        return run_equivalence(module_files=module_files, sites=sites,
+                               taus=taus, engines=engines, **kwargs)
+
+
+def get_parser():
+    """
+    Returns the parser of the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Numerical equivalence of the Energy Rating engines.")
+    parser.add_argument("--modules", default=None,
+                        help="folder with the CalLab files (default: the "
+                             "example files)")
+    parser.add_argument("--synthetic", type=int, default=None,
+                        help="number of synthetic modules instead")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the synthetic modules")
+    parser.add_argument("--sites", default=None,
+                        help="site index (default: the six standard "
+                             "climates)")
+    parser.add_argument("--tau", type=float, nargs="*", default=[],
+                        help="thermal time constants in seconds, besides "
+                             "the steady-state temperature")
+    parser.add_argument("--bifaciality", type=float, default=None,
+                        help="bifacial rating of the modules without "
+                             "Bifaciality in the CalLab file")
+    parser.add_argument("--albedo", type=float, default=0.2,
+                        help="reflectance of the ground for the bifacial "
+                             "rating")
+    parser.add_argument("--engines", nargs="*", default=list(ENGINES),
+                        choices=list(ENGINES), help="engines compared")
+    parser.add_argument("--rtol", type=float, default=RTOL,
+                        help="relative tolerance of the CSER and ETA")
+    parser.add_argument("--golden", default=GOLDEN_PATH,
+                        help="excel file with the golden results")
+    parser.add_argument("--baseline", default=BASELINE_PATH,
+                        help="pinned hourly output of the reference")
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    sites = (multi_site.read_site_index(args.sites)
+             if args.sites is not None else None)
+    kwargs = {"sites": sites, "taus": [None] + args.tau,
+              "engines": {name: ENGINES[name] for name in args.engines},
+              "rtol": args.rtol, "baseline": read_baseline(args.baseline),
+              "bifaciality": args.bifaciality, "albedo": args.albedo}
+    if args.synthetic is not None:
+        results = run_synthetic(args.synthetic, seed=args.seed, **kwargs)
+    else:
+        module_files = (sorted(glob.glob(join(args.modules, "*.txt")))
+                        if args.modules is not None else None)
+        results = run_equivalence(module_files=module_files, **kwargs)
+
+    engines = results[results["engine"] != "steps"]
+    summary = engines.groupby("engine").agg(
+        cases=("passed", "size"), passed=("passed", "sum"),
+        diff_cser=("diff_cser", "max"), diff_eta_avg=("diff_eta_avg", "max"),
+        hourly_diff=("hourly_diff", "max"))
+    print(summary.to_string())
+    failed = engines[~engines["passed"]]
+    if not failed.empty:
+        print("\nNot equivalent:\n%s" % failed.to_string())
+
+    pinned = results[(results["engine"] == "steps")
+                     & results["hourly_column"].notna()]
+    if not pinned.empty:
+        print("\nBaseline output: %d of %d equivalent, largest difference "
+              "%g" % (pinned["passed"].sum(), len(pinned),
+                      pinned["hourly_diff"].max()))
+        if not pinned["passed"].all():
+            print(pinned[~pinned["passed"]].to_string())
+
+    golden = check_golden(results, path=args.golden)
+    if not golden.empty:
+        print("\nGolden results: %d of %d within %g or known deviations"
+              % (golden["passed"].sum(), len(golden), GOLDEN_ATOL))
+        known = golden[golden["known_deviation"].notna()]
+        for row in known.drop_duplicates(["module", "climate"]).itertuples():
+            print("Known deviation %s, %s: %s"
+                  % (row.module, row.climate, row.known_deviation))
+        if not golden["passed"].all():
+            print(golden[~golden["passed"]].to_string())
+    return int(not failed.empty or not pinned["passed"].all()
+               or not golden["passed"].all())
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the dense ETA lookup surface. It is a precomputed version
+of the bilinear interpolation of the Power Rating Matrix given by the
+"BilinearInterpolator" from iec61853.py, so that the relative efficiency of
+each hour is taken from a fine irradiance x temperature grid with an integer
+index gather instead of locating the cell of the coarse matrix every time.
+
+    - Gap filling of the empty cells of the ETA matrix.
+    - Dense lookup table with a configurable resolution and its error bound
+        against the exact bilinear result.
+    - Cache of lookup tables, so thousands of modules can be kept in memory.
+
+@author: mriveraa
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+# Importing the IEC91853 standard's code
+import pvpltools_python.pvpltools.iec61853 as std
+
+# Maximum number of lookup tables kept by "get_eta_lookup"
+CACHE_SIZE = 1024
+_lookup_cache = OrderedDict()
+_lookup_lock = threading.Lock()
+
+
+class EtaLookupTable:
+    """
+    Dense table with the relative ETA on a regular irradiance x temperature
+    grid. The object is called like the "BilinearInterpolator" object, so it
+    can replace "eta_interpolated" in the simulation steps.
+
+    Every node of the table is the exact bilinear value of the ETA matrix;
+    between the nodes the value of the nearest node is returned. The
+    absolute difference with the exact bilinear result is then smaller than
+    "error_bound" everywhere inside the table limits:
+
+        error_bound = g_step/2 * max|dETA/dG| + t_step/2 * max|dETA/dT|
+
+    Where the slopes are the largest ones found in the cells of the (gap
+    filled) ETA matrix, including its extrapolation up to the table limits.
+    Irradiances and temperatures outside the table limits take the value at
+    the closest edge of the table, for them the error bound does not apply.
+
+    Parameters
+    ----------
+    matrix : Pandas DataFrame
+        ETA matrix, irradiances as index and temperatures as columns. Empty
+        cells give NaN in the table, please check the function
+        "fill_matrix_gaps".
+    g_step : Float, optional
+        Irradiance resolution of the table in W/m². The default is 5.
+    t_step : Float, optional
+        Temperature resolution of the table in °C. The default is 0.5.
+    g_max : Float, optional
+        Highest irradiance of the table in W/m² (the lowest is 0). The default
+        is 1500.
+    t_min, t_max : Float, optional
+        Lowest and highest temperature of the table in °C. The defaults are
+        -30 and 90.
+    """
+
+    def __init__(self, matrix, g_step=5.0, t_step=0.5, g_max=1500.0,
+                 t_min=-30.0, t_max=90.0):
+        self.g_step = float(g_step)
+        self.t_step = float(t_step)
+        self.g_min = 0.0
+        self.t_min = float(t_min)
+        self.g_nodes = self.g_min + self.g_step * np.arange(
+            int(np.ceil((g_max - self.g_min) / self.g_step)) + 1)
+        self.t_nodes = self.t_min + self.t_step * np.arange(
+            int(np.ceil((t_max - self.t_min) / self.t_step)) + 1)
+
+        # Exact bilinear values at the nodes of the table
+        interpolator = std.BilinearInterpolator(matrix=matrix)
+        g_grid, t_grid = np.meshgrid(self.g_nodes, self.t_nodes,
+                                     indexing="ij")
+        self.table = interpolator(g_grid, t_grid).astype(np.float32)
+
+        # Largest slopes in the cells of the matrix. The extrapolated borders
+        # of the table are added as extra cells, inside every cell the
+        # surface is bilinear so the largest slopes are found at its edges.
+        g_breaks = np.unique(np.clip(
+            np.r_[matrix.index, self.g_nodes[[0, -1]]],
+            self.g_nodes[0], self.g_nodes[-1]))
+        t_breaks = np.unique(np.clip(
+            np.r_[matrix.columns, self.t_nodes[[0, -1]]],
+            self.t_nodes[0], self.t_nodes[-1]))
+        values = interpolator(*np.meshgrid(g_breaks, t_breaks, indexing="ij"))
+        g_slope = np.abs(np.diff(values, axis=0) / np.diff(g_breaks)[:, None])
+        t_slope = np.abs(np.diff(values, axis=1) / np.diff(t_breaks)[None, :])
+        # Half a node apart at most, plus the float32 rounding
+        self.error_bound = float(
+            0.5 * self.g_step * np.nanmax(g_slope)
+            + 0.5 * self.t_step * np.nanmax(t_slope)
+            + np.nanmax(np.abs(self.table)) * np.finfo(np.float32).eps)
+
+    @property
+    def nbytes(self):
+        """Memory used by the table in bytes."""
+        return self.table.nbytes
+
+    def __call__(self, irradiance, temperature):
+        """
+        Get the relative ETA of the nearest node of the table.
+
+        Parameters
+        ----------
+        irradiance, temperature : array_like
+            The conditions to be looked up in the table.
+        """
+        g = np.asarray(irradiance, dtype=float)
+        t = np.asarray(temperature, dtype=float)
+        i = np.rint((g - self.g_min) / self.g_step)
+        j = np.rint((t - self.t_min) / self.t_step)
+        invalid = np.isnan(i) | np.isnan(j)
+        i = np.clip(np.nan_to_num(i), 0, len(self.g_nodes) - 1).astype(np.intp)
+        j = np.clip(np.nan_to_num(j), 0, len(self.t_nodes) - 1).astype(np.intp)
+        eta_rel = self.table[i, j].astype(float)
+        if invalid.any():
+            eta_rel[invalid] = np.nan
+        return eta_rel
+
+
+def fill_matrix_gaps(eta_matrix):
+    """
+    This function fills the empty cells of the ETA matrix. First the
+    extrapolation from Driesse & Stein used by the "BilinearInterpolator"
+    from iec61853.py [1] is applied, the cells that are still empty after it
+    (e.g. low irradiance at the lowest temperature) take the value of the
+    nearest filled cell at the same irradiance and, if the whole row is
+    empty, of the nearest filled row.
+
+    Parameters
+    ----------
+    eta_matrix: Pandas DataFrame
+        Matrix with ETA realative to STC at different irradiances (index) and
+        temperatures (columns).
+
+    Returns
+    -------
+    filled_matrix: Pandas DataFrame
+        Copy of "eta_matrix" without empty cells.
+
+    References
+    ----------
+    .. [1] A. Driesse and J. S. Stein, "From IEC 61853 power measurements to
+           PV system simulations," Sandia Report No. SAND2020-3877, 2020.
+    """
+    interpolator = std.BilinearInterpolator(matrix=eta_matrix.copy())
+    filled_matrix = pd.DataFrame(interpolator.values,
+                                 index=interpolator.grid[0],
+                                 columns=interpolator.grid[1])
+    # Nearest filled temperature, then nearest filled irradiance
+    filled_matrix = filled_matrix.ffill(axis=1).bfill(axis=1)
+    filled_matrix = filled_matrix.ffill(axis=0).bfill(axis=0)
+    return filled_matrix
+
+
+def get_eta_lookup(eta_matrix, g_step=5.0, t_step=0.5, g_max=1500.0,
+                   t_min=-30.0, t_max=90.0, fill_gaps=True):
+    """
+    This function returns the dense ETA lookup table of a module. The tables
+    are cached by the content of the ETA matrix and the resolution, so the
+    table is built only once per module even if it is asked for every
+    standard climate.
+
+    With the default resolution a table has 301 x 241 nodes in float32,
+    around 290 kB, and the cache keeps up to "CACHE_SIZE" tables.
+
+    Parameters
+    ----------
+    eta_matrix: Pandas DataFrame
+        Matrix with ETA realative to STC at different irradiances (index) and
+        temperatures (columns), as given by "get_eta_interpolation".
+    g_step, t_step, g_max, t_min, t_max : Float, optional
+        Resolution and limits of the table. Please check "EtaLookupTable".
+    fill_gaps: Boolean, optional
+        If True the empty cells of the matrix are filled (please check
+        "fill_matrix_gaps"), so the hours where the bilinear interpolation
+        gives NaN (and are dropped from the CSER) get an ETA as well. If False
+        those hours stay NaN. The default is True.
+
+    Returns
+    -------
+    eta_lookup: EtaLookupTable
+        This object gets the ETA if a irradiance and temperature are given.
+        Its "error_bound" attribute is the largest difference with the exact
+        bilinear interpolation.
+    """
+    key = hashlib.sha1(
+        np.ascontiguousarray(eta_matrix.values, dtype=float).tobytes()
+        + np.asarray(eta_matrix.index, dtype=float).tobytes()
+        + np.asarray(eta_matrix.columns, dtype=float).tobytes()
+        + np.array([g_step, t_step, g_max, t_min, t_max, fill_gaps]).tobytes()
+        ).hexdigest()
+    with _lookup_lock:
+        if key in _lookup_cache:
+            _lookup_cache.move_to_end(key)
+            return _lookup_cache[key]
+
+    if fill_gaps:
+        matrix = fill_matrix_gaps(eta_matrix)
+    else:
+        matrix = eta_matrix.copy()
+    eta_lookup = EtaLookupTable(matrix=matrix,
+                                g_step=g_step, t_step=t_step, g_max=g_max,
+                                t_min=t_min, t_max=t_max)
+    with _lookup_lock:
+        _lookup_cache[key] = eta_lookup
+        if len(_lookup_cache) > CACHE_SIZE:
+            _lookup_cache.popitem(last=False)
+    return eta_lookup
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the fused Energy Rating kernel: the AOI, spectral and
+module temperature corrections, the bilinear interpolation of the ETA and
+the sums of the CSER done hour by hour in one compiled loop, without the
+intermediate columns of the DataFrame (b_aoi, d_aoi, g_aoi,
+spectral_modifier, g_spec, T_mod, eta_rel, eta and Pout). The annual loss
+waterfall (please check aggregates.py) is summed in the same loop, and the
+rear side irradiance of the bifacial modules is added in it.
+
+The kernel is compiled with Numba [1] when it is installed. Without Numba,
+or when "eta_interpolated" is not a bilinear interpolation object (e.g. a
+dense lookup table or an analytic efficiency model), the NumPy steps of
+sim_steps.py are used instead, so the results are the same either way.
+
+It follows the NumPy steps exactly, including how missing values are
+treated: after the spectral correction every NaN is taken as 0 (as the
+"fillna(0)" of "spec_correction"), with thermal inertia the hours without
+ambient temperature or wind speed are gaps that restart the filter (as
+"temp_correction") and the hours where the ETA interpolation
+gives NaN are left out of the CSER and average ETA (as the "dropna" of
+"ersim_dc_steps"), and the sums use the duration of each time step when the
+data are not hourly (please check "get_time_steps" in utils.py).
+
+    References
+    ----------
+    .. [1] Numba, https://numba.pydata.org
+
+@author: mriveraa
+"""
+import math
+import numpy as np
+import pandas as pd
+from scipy.interpolate import RegularGridInterpolator
+# Importing the IEC91853 standard's code
+import pvpltools_python.pvpltools.iec61853 as std
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+# Importing the Steps Function
+import sim_steps
+# Importing the aggregates
+import aggregates
+# Importing utils
+import utils
+# Importing the spectral engine
+import spectral_bands
+
+try:
+    import numba
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+def _nan_to_zero(value):
+    if math.isnan(value):
+        return 0.0
+    return value
+
+
+def _find_cell(grid, x):
+    # Lower node of the cell of "x" and its position in the cell, the first
+    # and last cells are extended for the extrapolation. A value on a node
+    # is in the cell above it, as in RegularGridInterpolator, so a missing
+    # value of the cell below is not used
+    n = len(grid)
+    i = np.searchsorted(grid, x, side="right") - 1
+    if i < 0:
+        i = 0
+    elif i > n - 2:
+        i = n - 2
+    return i, (x - grid[i]) / (grid[i + 1] - grid[i])
+
+
+def _bilinear(values, i, x, j, y):
+    # Bilinear interpolation in the cell (i, j) of "values"
+    return ((1 - x) * (1 - y) * values[i, j]
+            + (1 - x) * y * values[i, j + 1]
+            + x * (1 - y) * values[i + 1, j]
+            + x * y * values[i + 1, j + 1])
+
+
+def _martin_ruiz(aoi, a_r, iam_norm):
+    # Martin & Ruiz incidence angle modifier, as "martin_ruiz" of the standard
+    if abs(aoi) >= 90.0:
+        return 0.0
+    return (1.0 - math.exp(-math.cos(math.radians(aoi)) / a_r)) / iam_norm
+
+
+def _er_kernel(aoi, i_tlt, d_tlt, bands, t_amb, wind, g_tlt, decay, hours,
+               fsr, uf_am15, a_r, d_mod_sky, u0, u1,
+               g_grid, t_grid, values, eta_stc, area,
+               bifacial, ghor, dhor, rear_direct, bifaciality,
+               ground_factor, sky_factor):
+    """
+    Loop over the hours of the fused kernel, please check "ersim_dc_fused".
+    With "bifacial" the rear side irradiance of "bifacial_correction" is
+    added (and summed as the bifacial gain of the waterfall), the factors of the ground and sky irradiance include the albedo,
+    the view factors and the diffuse modifiers of the rear side.
+    Returns the sums of the energy, the irradiation in POA and the ETA (times
+    the duration) of the valid time steps, the duration of the time steps
+    with an ETA and the sums of the loss waterfall (aggregates.LOSS_COLUMNS).
+    """
+    sum_pout = 0.0
+    sum_g_tlt = 0.0
+    sum_eta = 0.0
+    n_eta = 0.0
+    sum_losses = np.zeros(7)
+    iam_norm = 1.0 - math.exp(-1.0 / a_r)
+    t_mod = 0.0
+    restart = True
+    # Cell of 25°C for the irradiance loss
+    j_25, y_25 = _find_cell(t_grid, 25.0)
+    for k in range(len(aoi)):
+        # AOI correction (Martin & Ruiz)
+        g_aoi = (i_tlt[k] * _martin_ruiz(aoi[k], a_r, iam_norm)
+                 + d_tlt[k] * d_mod_sky)
+        g_bifacial = 0.0
+        if bifacial:
+            g_bifacial = bifaciality * (
+                ghor[k] * ground_factor + dhor[k] * sky_factor
+                + rear_direct[k] * _martin_ruiz(180.0 - aoi[k], a_r,
+                                                iam_norm))
+            g_aoi += g_bifacial
+
+        # Spectral correction
+        sum_sr = 0.0
+        sum_g = 0.0
+        for j in range(bands.shape[1]):
+            sum_sr += bands[k, j] * fsr[j]
+            sum_g += bands[k, j]
+        g_spec = _nan_to_zero(sum_sr / sum_g / uf_am15 * g_aoi
+                              if sum_g != 0.0 else math.nan)
+        g_aoi = _nan_to_zero(g_aoi)
+        g_bifacial = _nan_to_zero(g_bifacial)
+
+        # Module temperature (Faiman) and thermal inertia, a gap of the
+        # ambient temperature or the wind is left out and restarts the filter
+        if decay[k] >= 0.0 and (math.isnan(t_amb[k]) or math.isnan(wind[k])):
+            restart = True
+            continue
+        t_steady = (_nan_to_zero(t_amb[k])
+                    + g_aoi / (u0 + u1 * _nan_to_zero(wind[k])))
+        if restart or decay[k] < 0.0:
+            restart = False
+            t_mod = t_steady
+        else:
+            a = math.exp(-decay[k])
+            t_mod = a * t_mod + (1.0 - a) * t_steady
+
+        # Bilinear interpolation of the relative ETA
+        i, x = _find_cell(g_grid, g_spec)
+        j, y = _find_cell(t_grid, t_mod)
+        eta_rel = _bilinear(values, i, x, j, y)
+        if math.isnan(eta_rel):
+            continue
+
+        # Power and sums of the CSER
+        eta = eta_rel * eta_stc
+        pout = eta * g_spec * area
+        g = _nan_to_zero(g_tlt[k])
+        sum_pout += pout * hours[k]
+        sum_g_tlt += g * hours[k]
+        eta_hour = pout / area / g if g != 0.0 else (
+            math.nan if pout == 0.0 else math.copysign(math.inf, pout))
+        if not math.isnan(eta_hour):
+            sum_eta += eta_hour * hours[k]
+            n_eta += hours[k]
+
+        # Sums of the loss waterfall, no irradiance loss can be separated
+        # where the matrix has no value at 25°C
+        eta_rel_25 = _bilinear(values, i, x, j_25, y_25)
+        if math.isnan(eta_rel_25):
+            eta_rel_25 = eta_rel
+        stc = area * eta_stc * hours[k]
+        sum_losses[0] += g * stc
+        sum_losses[1] += (g - (g_aoi - g_bifacial)) * stc
+        sum_losses[2] += g_bifacial * stc
+        sum_losses[3] += (g_aoi - g_spec) * stc
+        sum_losses[4] += g_spec * stc * (1.0 - eta_rel_25)
+        sum_losses[5] += g_spec * stc * (eta_rel_25 - eta_rel)
+        sum_losses[6] += pout * hours[k]
+    return sum_pout, sum_g_tlt, sum_eta, n_eta, sum_losses
+
+
+if HAS_NUMBA:
+    # Without the GIL, so the modules can be rated in threads at the same time
+    _nan_to_zero = numba.njit(cache=True, nogil=True)(_nan_to_zero)
+    _find_cell = numba.njit(cache=True, nogil=True)(_find_cell)
+    _bilinear = numba.njit(cache=True, nogil=True)(_bilinear)
+    _martin_ruiz = numba.njit(cache=True, nogil=True)(_martin_ruiz)
+    _er_kernel = numba.njit(cache=True, nogil=True)(_er_kernel)
+
+
+def is_supported(eta_interpolated):
+    """
+    Returns True if the kernel can be used with this ETA interpolation
+    (bilinear interpolation object and Numba installed).
+    """
+    return HAS_NUMBA and isinstance(eta_interpolated, RegularGridInterpolator)
+
+
+def get_kernel_inputs(climate_data, tau=None, hours=None, rear=False):
+    """
+    This function gets the columns of the climate used by the kernel as
+    contiguous arrays, they can be reused for all the modules.
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        Climate data with the column names for the simulation.
+    tau : Float, optional
+        Thermal time constant of the modules in seconds. The default is None
+        (steady-state temperature).
+    hours : array_like, optional
+        Duration of each row in hours (e.g. the bins of a reduced climate,
+        please check binned_climate.py). The default is None (from the
+        index, please check "get_time_steps" in utils.py).
+    rear : Boolean, optional
+        If True, the arrays of the rear side irradiance of the bifacial
+        modules are added. The default is False.
+
+    Returns
+    -------
+    inputs : Dictionary
+        Arrays of the climate data, "layout" (spectral bands, please check
+        "get_climate_bands" in spectral_bands.py), "decay" (time step over "tau" of each
+        hour, -1 without thermal inertia), "hours" (duration of each time
+        step in hours) and with "rear" the arrays "ghor", "dhor" and
+        "rear_direct" (please check "get_rear_direct" in
+        energy_rating_functions.py).
+    """
+    inputs = {name: np.ascontiguousarray(climate_data[column].values,
+                                         dtype=float)
+              for name, column in [("aoi", "IncidentAngle"),
+                                   ("i_tlt", "I_tlt"),
+                                   ("d_tlt", "D_tlt"),
+                                   ("t_amb", "T_amb"),
+                                   ("wind", "wind"),
+                                   ("g_tlt", "G_tlt")]}
+    inputs["layout"] = spectral_bands.get_climate_bands(climate_data.columns)
+    inputs["bands"] = np.ascontiguousarray(
+        climate_data[list(inputs["layout"][0])].values, dtype=float)
+    if tau is None or tau <= 0 or len(climate_data) < 2:
+        inputs["decay"] = np.full(len(climate_data), -1.0)
+    else:
+        seconds = (climate_data.index
+                   - climate_data.index[0]).total_seconds()
+        step = np.diff(np.asarray(seconds, dtype=float))
+        # Same relaxation limit as "transient_temperature"
+        inputs["decay"] = np.minimum(np.r_[0.0, step] / tau, 50.0)
+    if hours is None:
+        time_steps = utils.get_time_steps(climate_data.index)
+        hours = (np.ones(len(climate_data)) if time_steps is None
+                 else time_steps.values)
+    inputs["hours"] = np.ascontiguousarray(hours, dtype=float)
+    if rear:
+        inputs.update(_get_rear_inputs(climate_data))
+    return inputs
+
+
+def _get_rear_inputs(climate_data):
+    # Arrays of the rear side irradiance, the albedo, the tilt and the AOI
+    # correction are applied in the kernel
+    return {"ghor": np.ascontiguousarray(climate_data["ghor"].values,
+                                         dtype=float),
+            "dhor": np.ascontiguousarray(climate_data["dhor"].values,
+                                         dtype=float),
+            "rear_direct": np.ascontiguousarray(
+                energy_rating.get_rear_direct(climate_data), dtype=float)}
+
+
+def ersim_dc_fused(climate_data, eta_interpolated, pnom, mod_area, u0, u1,
+                   a_r, power_matrix, pv_tilt=20, spec_resp_factor=1.0,
+                   tau=None, inputs=None, losses=False, bifaciality=None,
+                   albedo=0.2):
+    """
+    This function has the steps for Energy Rating like "ersim_dc_steps", but
+    only gives the CSER and the average ETA (and the annual loss waterfall),
+    computed with the fused kernel.
+
+    Parameters
+    ----------
+    climate_data, eta_interpolated, pnom, mod_area, u0, u1, a_r, power_matrix,
+    pv_tilt, spec_resp_factor, tau, bifaciality, albedo :
+        Please check the function "ersim_dc_steps" in sim_steps.py.
+    inputs : Dictionary, optional
+        Arrays of the climate from "get_kernel_inputs" (with the same "tau"),
+        to reuse them between modules. The default is None.
+    losses : Boolean, optional
+        If True, the annual loss waterfall is also returned. The default is
+        False.
+
+    Returns
+    -------
+    cser : Float
+        Climate Specific Energy Rating.
+    eta_avg : Float
+        Average ETA.
+    waterfall : Pandas Series
+        Only when "losses" is True. Annual LOSS_COLUMNS (Wh), as the
+        "waterfall" of "get_energy_tables" in aggregates.py.
+    """
+    if not is_supported(eta_interpolated) and losses:
+        # NumPy steps and tables
+        cser, eta_avg, tables = sim_steps.ersim_dc_tables(
+            climate_data=climate_data,
+            eta_interpolated=eta_interpolated,
+            pnom=pnom, mod_area=mod_area,
+            u0=u0, u1=u1, a_r=a_r,
+            power_matrix=power_matrix,
+            pv_tilt=pv_tilt,
+            spec_resp_factor=spec_resp_factor,
+            tau=tau,
+            bifaciality=bifaciality,
+            albedo=albedo)
+        return cser, eta_avg, tables["waterfall"]
+    if not is_supported(eta_interpolated):
+        # NumPy steps
+        cser, eta_avg, _ = sim_steps.ersim_dc_steps(
+            climate_data=climate_data,
+            eta_interpolated=eta_interpolated,
+            pnom=pnom, mod_area=mod_area,
+            u0=u0, u1=u1, a_r=a_r,
+            power_matrix=power_matrix,
+            eta_matrix=None,
+            pv_tilt=pv_tilt,
+            spec_resp_factor=spec_resp_factor,
+            tau=tau,
+            bifaciality=bifaciality,
+            albedo=albedo)
+        return cser, eta_avg
+
+    bifacial = bifaciality is not None
+    if inputs is None:
+        inputs = get_kernel_inputs(climate_data, tau=tau, rear=bifacial)
+    elif bifacial and "rear_direct" not in inputs:
+        inputs = dict(inputs, **_get_rear_inputs(climate_data))
+    fsr = np.asarray(energy_rating.get_banded_responsivity(
+        spec_resp_factor, bands=inputs["layout"]), dtype=float)
+    uf_am15 = float(spectral_bands.get_banded_reference(inputs["layout"])
+                    @ fsr / spectral_bands.AM15G_TOTAL)
+    d_mod_sky, _ = std.martin_ruiz_diffuse(surface_tilt=pv_tilt, a_r=a_r,
+                                           c1=0.4244, c2=None)
+    eta_stc = energy_rating.get_eta_stc(power_matrix=power_matrix,
+                                        module_area=mod_area)
+    if bifacial:
+        # Rear side as in "bifacial_correction"
+        cos_tilt = np.cos(np.radians(pv_tilt))
+        d_mod_sky_rear, d_mod_ground_rear = std.martin_ruiz_diffuse(
+            surface_tilt=180 - pv_tilt, a_r=a_r, c1=0.4244, c2=None)
+        rear = (inputs["ghor"], inputs["dhor"], inputs["rear_direct"],
+                float(bifaciality),
+                float(albedo * (1 + cos_tilt) / 2 * d_mod_ground_rear),
+                float((1 - cos_tilt) / 2 * d_mod_sky_rear))
+    else:
+        empty = np.empty(0)
+        rear = (empty, empty, empty, 0.0, 0.0, 0.0)
+
+    sum_pout, sum_g_tlt, sum_eta, n_eta, sum_losses = _er_kernel(
+        inputs["aoi"], inputs["i_tlt"], inputs["d_tlt"], inputs["bands"],
+        inputs["t_amb"], inputs["wind"], inputs["g_tlt"], inputs["decay"],
+        inputs["hours"], fsr, uf_am15, float(a_r), float(d_mod_sky),
+        float(u0), float(u1),
+        np.asarray(eta_interpolated.grid[0], dtype=float),
+        np.asarray(eta_interpolated.grid[1], dtype=float),
+        np.ascontiguousarray(eta_interpolated.values, dtype=float),
+        eta_stc, float(mod_area), bifacial, *rear)
+
+    # Same as "get_cser" in utils.py
+    cser = (sum_pout * 1000) / (sum_g_tlt * pnom * 1000)
+    eta_avg = sum_eta / n_eta if n_eta else np.nan
+    if losses:
+        return cser, eta_avg, pd.Series(sum_losses,
+                                        index=aggregates.LOSS_COLUMNS)
+    return cser, eta_avg
+
+
+def check_equivalence(climate_data, eta_interpolated, pnom, mod_area, u0, u1,
+                      a_r, power_matrix, pv_tilt=20, spec_resp_factor=1.0,
+                      tau=None, rtol=1e-8):
+    """
+    This function runs the fused kernel and the NumPy steps with the same
+    inputs and compares the CSER and the average ETA.
+
+    Parameters
+    ----------
+    climate_data, eta_interpolated, pnom, mod_area, u0, u1, a_r, power_matrix,
+    pv_tilt, spec_resp_factor, tau :
+        Please check the function "ersim_dc_steps" in sim_steps.py.
+    rtol : Float, optional
+        Largest relative difference accepted, the closed-form thermal
+        inertia of the NumPy steps differs from the recursion of the kernel
+        around 1e-9. The default is 1e-8.
+
+    Returns
+    -------
+    equivalent : Boolean
+        True if both differences are smaller than "rtol".
+    differences : Dictionary
+        Relative differences of "cser" and "eta_avg".
+    """
+    fused = ersim_dc_fused(climate_data, eta_interpolated, pnom, mod_area,
+                           u0, u1, a_r, power_matrix, pv_tilt=pv_tilt,
+                           spec_resp_factor=spec_resp_factor, tau=tau)
+    cser, eta_avg, _ = sim_steps.ersim_dc_steps(
+        climate_data=climate_data,
+        eta_interpolated=eta_interpolated,
+        pnom=pnom, mod_area=mod_area, u0=u0, u1=u1, a_r=a_r,
+        power_matrix=power_matrix, eta_matrix=None, pv_tilt=pv_tilt,
+        spec_resp_factor=spec_resp_factor, tau=tau)
+    differences = {name: abs(f - r) / abs(r) if r else abs(f - r)
+                   for name, f, r in [("cser", fused[0], cser),
+                                      ("eta_avg", fused[1], eta_avg)]}
+    equivalent = all(d <= rtol for d in differences.values())
+    return equivalent, differences
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the lifetime energy yield projection. One simulated
+standard year of each module and climate is projected over the lifetime of
+the module with degradation scenarios, as one array operation over
+scenarios x years x (module, climate), without running the hourly
+simulation again for every year.
+
+    - Degradation factors of each scenario and year: first year Light
+        Induced Degradation (LID) and linear, compound or two-step
+        degradation.
+    - Annual and total lifetime energy of each scenario and module.
+
+The power of the module in a year is the power of the simulated year times
+the degradation factor of that year, so the energy scales the same way:
+
+    E(year) = E_year1 * factor(year)
+
+    With factor(1) = 1 - LID and, for the following years:
+
+        linear:    (1 - LID) * (1 - rate * (year - 1))
+        compound:  (1 - LID) * (1 - rate) ** (year - 1)
+        two-step:  like linear with "rate" until the year "knee" and
+                   "rate_2" afterwards.
+
+@author: mriveraa
+"""
+import numpy as np
+import pandas as pd
+
+# Degradation models of the scenarios
+DEGRADATION_MODELS = ["linear", "compound", "two-step"]
+
+
+def get_degradation_factors(scenarios, years=25):
+    """
+    This function calculates the degradation factor of every year of the
+    lifetime for each scenario.
+
+    Parameters
+    ----------
+    scenarios : Pandas DataFrame
+        One row per scenario (index: name of the scenario) with the columns
+        "lid" (first year loss, e.g. 0.02) and "rate" (annual degradation,
+        e.g. 0.005) and optionally "model" (one of DEGRADATION_MODELS,
+        default "linear"), "rate_2" and "knee" (second rate and the last year
+        with the first rate of the two-step model).
+    years : Integer, optional
+        Lifetime in years. The default is 25.
+
+    Returns
+    -------
+    factors : Pandas DataFrame
+        Degradation factor of each scenario (rows) and year (columns, from
+        1 to "years").
+    """
+    models = (scenarios["model"] if "model" in scenarios
+              else pd.Series("linear", index=scenarios.index))
+    unknown = set(models) - set(DEGRADATION_MODELS)
+    if unknown:
+        raise ValueError("Unknown degradation model(s): %s, please choose "
+                         "from: %s" % (", ".join(sorted(unknown)),
+                                       ", ".join(DEGRADATION_MODELS)))
+
+    # Scenarios as columns, years as rows
+    lid = scenarios["lid"].values.astype(float)[:, None]
+    rate = scenarios["rate"].values.astype(float)[:, None]
+    rate_2 = (scenarios["rate_2"].fillna(0).values.astype(float)[:, None]
+              if "rate_2" in scenarios else np.zeros_like(rate))
+    knee = (scenarios["knee"].fillna(years).values.astype(float)[:, None]
+            if "knee" in scenarios else np.full_like(rate, years))
+    elapsed = np.arange(years, dtype=float)[None, :]
+    models = models.values[:, None]
+
+    linear = 1 - rate * elapsed
+    compound = (1 - rate) ** elapsed
+    # Years after the knee with the second rate
+    two_step = (1 - rate * np.minimum(elapsed, knee - 1)
+                - rate_2 * np.maximum(elapsed - (knee - 1), 0))
+    factors = (1 - lid) * np.select(
+        [models == "linear", models == "compound", models == "two-step"],
+        [linear, compound, two_step])
+    return pd.DataFrame(np.clip(factors, 0, None), index=scenarios.index,
+                        columns=pd.RangeIndex(1, years + 1, name="year"))
+
+
+def get_first_year_energy(cser, irradiation, pnom):
+    """
+    This function gives the energy of the simulated standard year from the
+    CSER (Equation 20 from IEC61853-3), the inverse of "get_cser" in utils.py.
+
+    Parameters
+    ----------
+    cser : Float or array_like
+        Climate Specific Energy Rating.
+    irradiation : Float or array_like
+        Annual irradiation in the plane of array in Wh/m².
+    pnom : Float or array_like
+        Module's nominal power in kW.
+
+    Returns
+    -------
+    energy : Float or array_like
+        Annual energy of the module in kWh.
+    """
+    return (np.asarray(cser) * np.asarray(irradiation) / 1000
+            * np.asarray(pnom))
+
+
+def project_lifetime(first_year, factors):
+    """
+    This function projects the energy of the standard year over the lifetime
+    for every scenario and module (or module and climate).
+
+    Parameters
+    ----------
+    first_year : Pandas Series
+        Energy of the simulated standard year, without degradation, e.g. in
+        kWh. The index identifies the module (and climate).
+    factors : Pandas DataFrame
+        Degradation factors, please check "get_degradation_factors".
+
+    Returns
+    -------
+    annual : Pandas DataFrame
+        Energy of each scenario and year (rows, MultiIndex) and module
+        (columns).
+    """
+    # scenarios x years x modules in one broadcast
+    energy = (factors.values[:, :, None]
+              * np.asarray(first_year, dtype=float)[None, None, :])
+    index = pd.MultiIndex.from_product([factors.index, factors.columns],
+                                       names=[factors.index.name or
+                                              "scenario", "year"])
+    return pd.DataFrame(energy.reshape(-1, len(first_year)), index=index,
+                        columns=first_year.index)
+
+
+def get_lifetime_energy(first_year, factors, discount_rate=None):
+    """
+    This function gives the total energy over the lifetime for every
+    scenario and module, optionally discounted (e.g. for the LCOE).
+
+    Parameters
+    ----------
+    first_year : Pandas Series
+        Energy of the simulated standard year, please check
+        "project_lifetime".
+    factors : Pandas DataFrame
+        Degradation factors, please check "get_degradation_factors".
+    discount_rate : Float, optional
+        Annual discount rate, the energy of year n is divided by
+        (1 + discount_rate) ** n. The default is None (no discount).
+
+    Returns
+    -------
+    total : Pandas DataFrame
+        Lifetime energy of each scenario (rows) and module (columns).
+    """
+    weights = factors.values
+    if discount_rate is not None:
+        weights = weights / (1 + discount_rate) ** factors.columns.values
+    # Sum over the years first, then one outer product
+    total = np.outer(weights.sum(axis=1), np.asarray(first_year, dtype=float))
+    return pd.DataFrame(total, index=factors.index, columns=first_year.index)
@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the multi-site Energy Rating: the CSER of a set of
+modules over many sites (e.g. a grid of locations for a map), each site
+given by an hourly climate file with the same columns as the standard
+climate files enra_*.csv from IEC61853-4 [1].
+
+    - Site index: CSV file with one row per site and the columns "site_id",
+        "file", "lat", "lon" and optionally "ele" and "pv_tilt". The climate
+        files are relative to the folder of the index. The orientation of
+        the modules is the one of the in-plane irradiance and incident angle
+        of each climate file, so there is no azimuth in the index.
+    - Module characterisation (ETA interpolation, nominal power, ...) done
+        once per module and shared by all the sites.
+    - Sites processed in chunks by a pool of worker processes, with a
+        bounded number of chunks in memory at the same time. The number of
+        workers and the chunk size can be chosen from a memory budget,
+        please check scheduler.py.
+    - Or by a pool of threads sharing the modules, for environments where
+        worker processes are too heavy: the simulation does not change its
+        inputs, the working directory or any global state, and the NumPy
+        operations and the fused kernel run without the GIL.
+    - Site x module CSER table.
+
+    References
+    ----------
+    .. [1] Energy Rating Standard IEC61853-4.
+
+@author: mriveraa
+"""
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                wait, FIRST_COMPLETED)
+from os.path import basename, dirname, join
+import os
+import warnings
+import pandas as pd
+# Importing the Steps Function
+import sim_steps
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+# Importing read functions
+import read_functions
+# Importing the dense ETA lookup
+import eta_lookup
+# Importing the analytic efficiency models
+import efficiency_models
+# Importing execution functions
+import utils
+# Importing the fused kernel
+import fused_kernel
+# Importing the batch scheduler
+import scheduler
+# Importing the profiling mode
+import profiling
+# Importing the daylight-only representation
+import daylight
+
+# Modules of the worker process, please check "_init_worker"
+_modules = []
+
+
+def read_site_index(path):
+    """
+    This function reads the site index.
+
+    Parameters
+    ----------
+    path : String
+        Path like. Path to the CSV file with the sites.
+
+    Returns
+    -------
+    sites : Pandas DataFrame
+        One row per site with the absolute path of its climate file in
+        "file" and the tilt of the modules (default 20 as in the standard).
+        A "pv_azimuth" column is left out with a warning, the in-plane
+        columns of the climate files give the orientation.
+    """
+    sites = pd.read_csv(path)
+    missing = {"site_id", "file", "lat", "lon"} - set(sites.columns)
+    if missing:
+        raise ValueError("Missing columns in the site index: %s"
+                         % ", ".join(sorted(missing)))
+    sites["file"] = [join(dirname(os.path.abspath(path)), file)
+                     for file in sites["file"]]
+    if sites["site_id"].duplicated().any():
+        raise ValueError("Repeated site_id in the site index: %s" % ", ".join(
+            sites["site_id"][sites["site_id"].duplicated()].astype(str)))
+    if "pv_tilt" not in sites:
+        sites["pv_tilt"] = 20
+    if "pv_azimuth" in sites:
+        warnings.warn("The column pv_azimuth of the site index is not used: "
+                      "the orientation of the modules is given by the "
+                      "in-plane irradiance and incident angle of the "
+                      "climate files")
+        sites = sites.drop(columns="pv_azimuth")
+    return sites
+
+
+def get_module_characterisation(path, lookup_steps=None, eta_model=None,
+                                bifaciality=None, albedo=0.2):
+    """
+    This function reads a CalLab file and gets everything the simulation
+    needs from the module, so it is done only once for all the sites.
+
+    Parameters
+    ----------
+    path : String
+        The path to the CalLab file.
+    lookup_steps, eta_model : optional
+        Please check the function "get_ini_data" in run_main.py.
+    bifaciality : Float, optional
+        Bifaciality factor of the module, used when the CalLab file has no
+        "Bifaciality" in [Module parameters]. The default is None
+        (monofacial).
+    albedo : Float, optional
+        Reflectance of the ground for the bifacial rating. The default is
+        0.2.
+
+    Returns
+    -------
+    module : Dictionary
+        "int_id", "tech", "pnom", "module_area", "eta_interpolated", "u0",
+        "u1", "a_r", "spec_resp", "power_matrix", "mod_parameters",
+        "bifaciality" and "albedo" of the module.
+    """
+    (mod_parameters, spec_resp, power_matrix, ar,
+     u0, u1, module_area, tech, int_id) = \
+        read_functions.read_callab_stdfile(path=path)
+    bifaciality = read_functions.get_bifaciality(mod_parameters,
+                                                 bifaciality=bifaciality)
+    eta_interpolated, pnom, eta_matrix =\
+        energy_rating.get_eta_interpolation(module_df=power_matrix,
+                                            module_area=module_area,
+                                            eta_calc=False)
+    power_matrix = energy_rating.prepare_power_matrix(module_df=power_matrix,
+                                                      module_area=module_area)
+    if eta_model is not None:
+        eta_interpolated = efficiency_models.fit_efficiency_model(
+            power_matrix=power_matrix,
+            model=eta_model)
+    elif lookup_steps is not None:
+        eta_interpolated = eta_lookup.get_eta_lookup(
+            eta_matrix=eta_matrix,
+            g_step=lookup_steps[0],
+            t_step=lookup_steps[1])
+    return {"int_id": int_id, "tech": tech, "pnom": pnom,
+            "module_area": module_area, "eta_interpolated": eta_interpolated,
+            "u0": u0, "u1": u1, "a_r": ar, "spec_resp": spec_resp,
+            "power_matrix": power_matrix, "mod_parameters": mod_parameters,
+            "bifaciality": bifaciality, "albedo": albedo}
+
+
+def check_modules(modules, callab_files):
+    """
+    This function checks that every module has its own Internal_ID, since
+    the results of the sites are given by Internal_ID. It raises a
+    ValueError with the CalLab files of the repeated ones.
+
+    Parameters
+    ----------
+    modules : List
+        Module characterisations, please check "get_module_characterisation".
+    callab_files : List
+        Paths to the CalLab files of "modules".
+    """
+    files = {}
+    for module, path in zip(modules, callab_files):
+        files.setdefault(module["int_id"], []).append(path)
+    repeated = {int_id: paths for int_id, paths in files.items()
+                if len(paths) > 1}
+    if repeated:
+        raise ValueError("The same Internal_ID is in more than one CalLab "
+                         "file, please rate them separately: %s"
+                         % "; ".join("%s (%s)" % (int_id, ", ".join(paths))
+                                     for int_id, paths in repeated.items()))
+    return
+
+
+def rate_site(site, modules, tau=None, fused=False, resolution=None,
+              profile_dir=None):
+    """
+    This function runs the Energy Rating of all the modules in one site.
+
+    Parameters
+    ----------
+    site : Dictionary or Pandas Series
+        One row of the site index, please check "read_site_index".
+    modules : List
+        Module characterisations, please check "get_module_characterisation".
+    tau : Float, optional
+        Thermal time constant of the modules in seconds for the transient
+        module temperature. The default is None (steady-state temperature).
+    fused : Boolean, optional
+        If True the CSER is computed with the fused kernel, please check
+        fused_kernel.py. The default is False.
+    resolution : String, optional
+        Resolution of the climate data for the simulation, please check the
+        function "resample_climate" in read_functions.py. The default is
+        None (resolution of the climate file).
+    profile_dir : String, optional
+        Path like. Folder where the cProfile dump of each module is written
+        (and of the reading of the climate, as module "climate"), please
+        check profiling.py. The default is None (no profiling).
+
+    Returns
+    -------
+    rows : List
+        One tuple (site_id, Internal_ID, CSER, average ETA) per module.
+    """
+    def get_profile_path(module_id):
+        if profile_dir is None:
+            return None
+        return profiling.get_profile_path(profile_dir, module_id,
+                                          site["site_id"])
+
+    with profiling.profile(get_profile_path("climate")):
+        climate_data = read_functions.change_names_climate_df(
+            read_functions.read_climate_locs(
+                folder_locations=dirname(site["file"]),
+                loc_name=basename(site["file"])))
+        if resolution is not None:
+            climate_data = read_functions.resample_climate(
+                climate_df=climate_data,
+                resolution=resolution)
+        # The climate arrays of the fused kernel or the daylight time steps
+        # are shared by the modules
+        if fused:
+            inputs = fused_kernel.get_kernel_inputs(
+                climate_data, tau=tau,
+                rear=any(module["bifaciality"] is not None
+                         for module in modules))
+        else:
+            climate_daylight = daylight.compact_climate(climate_data)
+    rows = []
+    for module in modules:
+        with profiling.profile(get_profile_path(module["int_id"])):
+            if fused:
+                cser, eta_avg = fused_kernel.ersim_dc_fused(
+                    climate_data=climate_data,
+                    eta_interpolated=module["eta_interpolated"],
+                    pnom=module["pnom"],
+                    mod_area=module["module_area"],
+                    u0=module["u0"],
+                    u1=module["u1"],
+                    a_r=module["a_r"],
+                    power_matrix=module["power_matrix"],
+                    pv_tilt=site["pv_tilt"],
+                    spec_resp_factor=module["spec_resp"],
+                    tau=tau,
+                    inputs=inputs,
+                    bifaciality=module["bifaciality"],
+                    albedo=module["albedo"])
+            else:
+                cser, eta_avg, _ = sim_steps.ersim_dc_daylight(
+                    climate_data=climate_data,
+                    eta_interpolated=module["eta_interpolated"],
+                    pnom=module["pnom"],
+                    mod_area=module["module_area"],
+                    u0=module["u0"],
+                    u1=module["u1"],
+                    a_r=module["a_r"],
+                    power_matrix=module["power_matrix"],
+                    pv_tilt=site["pv_tilt"],
+                    spec_resp_factor=module["spec_resp"],
+                    tau=tau,
+                    bifaciality=module["bifaciality"],
+                    albedo=module["albedo"],
+                    daylight=climate_daylight)
+        rows.append((site["site_id"], module["int_id"], cser, eta_avg))
+    return rows
+
+
+def _init_worker(modules):
+    # The modules are sent once to each worker process
+    global _modules
+    _modules = modules
+
+
+def _rate_chunk(sites, tau, fused, resolution, profile_dir, modules=None):
+    # The worker processes take the modules of "_init_worker", the threads
+    # get them directly
+    if modules is None:
+        modules = _modules
+    rows = []
+    for site in sites:
+        rows.extend(rate_site(site, modules, tau=tau, fused=fused,
+                              resolution=resolution,
+                              profile_dir=profile_dir))
+    return rows
+
+
+def rate_sites(sites, callab_files, workers=None, chunk_size=50,
+               lookup_steps=None, eta_model=None, tau=None, fused=False,
+               resolution=None, memory_budget=None, profile_dir=None,
+               threads=False, bifaciality=None, albedo=0.2):
+    """
+    This function runs the Energy Rating of the modules in all the sites.
+    The sites are split in chunks of "chunk_size" sites, each worker reads
+    and simulates one climate at a time and at most two chunks per worker
+    are waiting, so the memory does not grow with the number of sites.
+
+    Parameters
+    ----------
+    sites : Pandas DataFrame
+        Site index, please check "read_site_index".
+    callab_files : List
+        Paths to the CalLab files of the modules.
+    workers : Integer, optional
+        Number of worker processes (or threads). With 1 the sites are rated
+        in this process. The default is None (number of CPUs).
+    chunk_size : Integer, optional
+        Number of sites sent to a worker at once. The default is 50.
+    lookup_steps, eta_model, tau : optional
+        Please check the function "simulation_er" in run_main.py.
+    fused : Boolean, optional
+        If True the CSER is computed with the fused kernel. The default is
+        False.
+    resolution : String, optional
+        Resolution of the climate data, please check "rate_site". The
+        default is None.
+    memory_budget : Float, optional
+        Memory available for the batch in bytes. When given, the number of
+        workers (up to "workers") and the chunk size are chosen by the
+        scheduler from the size of the first climate file, please check
+        "plan_batch" in scheduler.py. The default is None.
+    profile_dir : String, optional
+        Path like. Folder of the cProfile dumps of each module and site,
+        please check "rate_site". The default is None (no profiling).
+    threads : Boolean, optional
+        If True the workers are threads of this process, they share the
+        modules instead of receiving a copy. The default is False (worker
+        processes).
+    bifaciality, albedo : optional
+        Please check the function "get_module_characterisation".
+
+    Returns
+    -------
+    results : Pandas DataFrame
+        One row per site and module with "site_id", "Internal_ID", "cser"
+        and "eta_avg". A ValueError is raised before rating anything if two
+        CalLab files have the same Internal_ID, please check
+        "check_modules".
+    """
+    modules = [get_module_characterisation(path, lookup_steps=lookup_steps,
+                                           eta_model=eta_model,
+                                           bifaciality=bifaciality,
+                                           albedo=albedo)
+               for path in callab_files]
+    check_modules(modules, callab_files)
+    records = sites.to_dict("records")
+    if memory_budget is not None:
+        n_steps, n_bands = scheduler.get_climate_size(records[0]["file"])
+        plan = scheduler.plan_batch(
+            n_modules=len(modules), n_climates=len(records),
+            n_steps=n_steps, memory_budget=memory_budget, n_bands=n_bands,
+            outputs=["profile"] if profile_dir is not None else [],
+            max_workers=workers, fused=fused,
+            module_bytes=(scheduler.MODULE_BYTES if lookup_steps is None
+                          else scheduler.MODULE_BYTES
+                          + modules[0]["eta_interpolated"].nbytes))
+        workers, chunk_size = plan["workers"], plan["chunk_size"]
+    chunks = [records[i:i + chunk_size]
+              for i in range(0, len(records), chunk_size)]
+    workers = workers or os.cpu_count()
+
+    rows = []
+    if workers == 1:
+        for site in records:
+            rows.extend(rate_site(site, modules, tau=tau, fused=fused,
+                                  resolution=resolution,
+                                  profile_dir=profile_dir))
+    else:
+        if threads:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            shared = modules
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           initializer=_init_worker,
+                                           initargs=(modules,))
+            shared = None
+        with executor:
+            pending = set()
+            for chunk in chunks:
+                pending.add(executor.submit(_rate_chunk, chunk, tau, fused,
+                                            resolution, profile_dir, shared))
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rows.extend(future.result())
+            for future in pending:
+                rows.extend(future.result())
+    return pd.DataFrame(rows, columns=["site_id", "Internal_ID", "cser",
+                                       "eta_avg"])
+
+
+def get_site_table(results, sites):
+    """
+    This function gives the site x module CSER table.
+
+    Parameters
+    ----------
+    results : Pandas DataFrame
+        Results from "rate_sites".
+    sites : Pandas DataFrame
+        Site index, please check "read_site_index".
+
+    Returns
+    -------
+    site_table : Pandas DataFrame
+        One row per site with its "lat" and "lon" and one column
+        "cser_Module-name" per module.
+    """
+    repeated = results.duplicated(["site_id", "Internal_ID"])
+    if repeated.any():
+        raise ValueError("More than one result of the same Internal_ID in a "
+                         "site: %s" % ", ".join(
+                             results.loc[repeated, "Internal_ID"].astype(
+                                 str).unique()))
+    cser = results.pivot(index="site_id", columns="Internal_ID",
+                         values="cser").add_prefix("cser_")
+    return sites.set_index("site_id")[["lat", "lon"]].join(cser)
+
+
+def simulation_sites(site_index, callab_files, res_folder, workers=None,
+                     chunk_size=50, lookup_steps=None, eta_model=None,
+                     tau=None, fused=False, maps=False, resolution=None,
+                     memory_budget=None, profile_dir=None, threads=False,
+                     bifaciality=None, albedo=0.2):
+    """
+    This function runs the multi-site Energy Rating and saves the site x
+    module CSER table and, optionally, one CSER map per module.
+
+    Parameters
+    ----------
+    site_index : String
+        Path like. Path to the CSV file with the sites.
+    callab_files : List
+        Paths to the CalLab files of the modules.
+    res_folder : String
+        Path to folder where results want to be saved.
+    workers, chunk_size, lookup_steps, eta_model, tau, fused, resolution,
+    memory_budget, profile_dir, threads, bifaciality, albedo : optional
+        Please check the function "rate_sites".
+    maps : Boolean, optional
+        If True a map with the CSER of each site is plotted for each module.
+        The default is False.
+
+    Returns
+    -------
+    site_table : Pandas DataFrame
+        Site x module CSER table, also saved as results_sites_cser.csv.
+    """
+    sites = read_site_index(site_index)
+    results = rate_sites(sites, callab_files, workers=workers,
+                         chunk_size=chunk_size, lookup_steps=lookup_steps,
+                         eta_model=eta_model, tau=tau, fused=fused,
+                         resolution=resolution, memory_budget=memory_budget,
+                         profile_dir=profile_dir, threads=threads,
+                         bifaciality=bifaciality, albedo=albedo)
+    site_table = get_site_table(results, sites)
+    os.makedirs(res_folder, exist_ok=True)
+    utils.write_site_table(df=site_table, folder=res_folder)
+    if maps:
+        # Importing the plots only when needed
+        import plotting
+        for int_id in results["Internal_ID"].unique():
+            plotting.plot_site_map(df=site_table, module_id=int_id,
+                                   res_folder=res_folder)
+    return site_table
@@ -5,12 +5,117 @@ Created on Mon May 17 17:57:25 2021
 @author: mriveraa
 """
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from os.path import join
+import threading
 import numpy as np
 import seaborn as sns
 import matplotlib.dates as mdates
 sns.set_theme(style="whitegrid")
 
+# Number of ETA bins of the "binned" plot mode (the time bins are days)
+ETA_BINS = 150
+# Figure templates of the "binned" plot mode, one set per thread
+_templates = threading.local()
+
+
+def _get_template(name, nrows, ncols, figsize):
+    """
+    Returns the figure template "name": a figure with its axes and one image
+    per axes, created only the first time so it is reused for all modules.
+    The figure is not registered in pyplot, it is kept until
+    "clear_templates" is called.
+    """
+    if not hasattr(_templates, "figures"):
+        _templates.figures = {}
+    if name not in _templates.figures:
+        fig = Figure(figsize=figsize, dpi=300)
+        axlist = np.atleast_1d(fig.subplots(nrows, ncols, sharey=True))
+        images = []
+        for ax in axlist.flat:
+            image = ax.imshow(np.zeros((1, 1, 4), dtype=np.uint8),
+                              aspect='auto', origin='lower',
+                              interpolation='nearest')
+            ax.xaxis_date()
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%b'))
+            ax.grid(True)
+            images.append(image)
+        # The layout is fitted when the figure is saved for the first time
+        _templates.figures[name] = (fig, axlist, images, False)
+    return _templates.figures[name][:3]
+
+
+def _save_template(name, path):
+    """
+    Saves the figure template "name", the layout is fitted only the first
+    time since every module gives the same subplots.
+    """
+    fig, axlist, images, fitted = _templates.figures[name]
+    if not fitted:
+        fig.tight_layout()
+        _templates.figures[name] = (fig, axlist, images, True)
+    fig.savefig(path, pil_kwargs={"compress_level": 1})
+
+
+def clear_templates():
+    """
+    This function releases the figure templates of the "binned" plot mode
+    created by the current thread, to be called at the end of a batch.
+    """
+    figures = getattr(_templates, "figures", {})
+    for fig, _, _, _ in figures.values():
+        fig.clear()
+    figures.clear()
+
+
+def _set_binned(ax, image, x, y, y_range):
+    """
+    Puts the 2-D histogram of the points (time, ETA) in the image: one bin
+    per day and "ETA_BINS" bins of ETA, the color is the number of hours.
+    The colors are given to the bins here, so the image is drawn as RGBA
+    without normalizing it again at the resolution of the figure.
+    """
+    x = mdates.date2num(x)
+    valid = ~np.isnan(y)
+    x, y = x[valid], np.asarray(y)[valid]
+    if len(x) == 0:
+        image.set_data(np.zeros((1, 1, 4), dtype=np.uint8))
+        return
+    x_range = (np.floor(x.min()), np.floor(x.max()) + 1)
+    counts, _, _ = np.histogram2d(
+        x, y, bins=(int(x_range[1] - x_range[0]), ETA_BINS),
+        range=(x_range, y_range))
+    counts = counts.T
+    # Empty bins are transparent, the others from light to dark blue
+    rgba = plt.get_cmap('Blues')(
+        0.3 + 0.7 * counts / max(counts.max(), 1), bytes=True)
+    rgba[counts == 0] = 0
+    image.set_data(rgba)
+    image.set_extent((x_range[0], x_range[1], y_range[0], y_range[1]))
+    # First day of every other month as ticks
+    months = mdates.num2date(x_range[0]).replace(day=1, hour=0, minute=0,
+                                                  second=0, microsecond=0)
+    ticks = mdates.date2num(
+        [months.replace(year=months.year + (months.month + k - 1) // 12,
+                        month=(months.month + k - 1) % 12 + 1)
+         for k in range(0, int((x_range[1] - x_range[0]) / 28) + 2, 2)])
+    ax.set_xticks(ticks[(ticks >= x_range[0]) & (ticks <= x_range[1])])
+    ax.set_xlim(x_range)
+    ax.set_ylim(y_range)
+
+
+def _get_eta_range(values):
+    """
+    Range of the ETA axis of the binned plots, the range of the values plus a
+    margin of 5 % on each side as in the scatter plots.
+    """
+    values = np.concatenate([np.asarray(v, dtype=float) for v in values])
+    if np.isnan(values).all():
+        return (0.0, 1.0)
+    y_min, y_max = np.nanmin(values), np.nanmax(values)
+    margin = max(0.05 * (y_max - y_min), 1e-3)
+    return (float(y_min - margin), float(y_max + margin))
+
 
 def round_robin_plot(df, module_id, res_folder):
     """
@@ -70,12 +175,17 @@ def round_robin_plot(df, module_id, res_folder):
 
     return
 
-def eta_all_sites(df, module_id, res_folder):
+def eta_all_sites(df, module_id, res_folder, plot_mode="scatter"):
     """
     This function generates a figure of 6 subplots (for each standard climate)
     with the hourly ETA values of a module from the whole year of data given
     by the standard IEC61853-4.
 
+    With plot_mode="binned" the hours are not drawn one by one: each subplot
+    is a 2-D histogram (one bin per day and ETA level, the color is the
+    number of hours) and the same figure is reused for all the modules, which
+    is much faster and lighter for large batches.
+
     Parameters
     ----------
     df: Dictionary
@@ -85,12 +195,31 @@ def eta_all_sites(df, module_id, res_folder):
         Name or ID of the module
     res_folder: String/Path
         Path where figure should be saved
+    plot_mode: String, optional
+        "scatter" (every hour is a point) or "binned" (2-D histogram). The
+        default is "scatter".
     """
 
     climate = ['Tropical humid', 'Subtropical arid (desert)',
            'Subtropical coastal', 'Temperate coastal',
            'High elevation (above 3 000 m)', 'Temperate continental']
 
+    if plot_mode == "binned":
+        _, axlist, images = _get_template("eta_all_sites", 2, 3, (14, 10))
+        y_range = _get_eta_range([df[c]["eta"].values for c in climate])
+        for ax, image, c in zip(axlist.flat, images, climate):
+            _set_binned(ax, image, df[c].index, df[c]["eta"].values, y_range)
+            ax.set_xlabel('Time of the year', fontsize=9)
+            ax.set_ylabel('Efficiency ETA', fontsize=9,
+                          horizontalalignment='center')
+            ax.set_title("Module %s in %s" %(module_id, c), fontsize=9)
+        path = "ETA_Standard_Climates_%s.png" % (module_id)
+        _save_template("eta_all_sites", join(res_folder, path))
+        return
+    elif plot_mode != "scatter":
+        raise ValueError("Unknown plot mode '%s', please choose 'scatter' "
+                         "or 'binned'" % (plot_mode))
+
     #  Categorical Data
     a = 2  # number of rows
     b = 3  # number of columns
@@ -201,12 +330,15 @@ def plot_summary_eta(df, res_folder):
 
     return
 
-def plot_eta(df, res_folder, module_id, location):
+def plot_eta(df, res_folder, module_id, location, plot_mode="scatter"):
     """
     This function generates a figure with the hourly ETA values of a module in
     an specific climate. The data frame is given by the standard IEC61853-4
     and the 'eta' is calculated by the simulation.
 
+    With plot_mode="binned" the figure is a 2-D histogram of the hours,
+    please check the function "eta_all_sites".
+
     Parameters
     ----------
     df: Pandas DataFrame
@@ -219,8 +351,28 @@ def plot_eta(df, res_folder, module_id, location):
     location: Dictionary
         Dictionary with information from the module taken by the
         'read_standard_locations' function
+    plot_mode: String, optional
+        "scatter" (every hour is a point) or "binned" (2-D histogram). The
+        default is "scatter".
     """
 
+    if plot_mode == "binned":
+        _, axlist, images = _get_template("plot_eta", 1, 1, (6.5, 5))
+        ax = axlist[0]
+        _set_binned(ax, images[0], df.index, df["eta"].values,
+                    _get_eta_range([df["eta"].values]))
+        ax.set_xlabel('Time of the year', fontsize=9)
+        ax.set_ylabel('Efficiency ETA', fontsize=9,
+                      horizontalalignment='center')
+        ax.set_title("Efficiency ETA in Standard Site: %s"
+                     %(location["site_name"]), fontsize=9)
+        path = "ETA_%s_%s.png" % (module_id, location["site_name"])
+        _save_template("plot_eta", join(res_folder, path))
+        return
+    elif plot_mode != "scatter":
+        raise ValueError("Unknown plot mode '%s', please choose 'scatter' "
+                         "or 'binned'" % (plot_mode))
+
     fig, ax = plt.subplots(figsize=(6.5, 5), dpi=300)
     ax.set_xlabel('Time of the year', fontsize=9)
     ax.set_ylabel('Efficiency ETA', fontsize=9,
@@ -298,3 +450,93 @@ def plot_cser(df, res_folder, module_id):
     plt.savefig(path)
     return
 
+
+def plot_loss_waterfall(df, module_id, res_folder):
+    """
+    This function generates a figure of 6 subplots (for each standard climate)
+    with the annual loss waterfall of a module: from the energy at STC
+    efficiency (100 %) through the AOI loss, the bifacial gain and the
+    spectral, low irradiance and thermal losses to the DC energy.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame
+        Data frame with the relative losses and gain ('loss_aoi_rel',
+        'gain_bifacial_rel', 'loss_spectral_rel', 'loss_irradiance_rel',
+        'loss_thermal_rel') of the module (rows: standard climates). Please check the function
+        "get_waterfall_table" in aggregates.py.
+    module_id: String
+        Name or ID of the module
+    res_folder: String/Path
+        Path where figure should be saved
+    """
+    steps = ['loss_aoi_rel', 'gain_bifacial_rel', 'loss_spectral_rel',
+             'loss_irradiance_rel', 'loss_thermal_rel']
+    labels = ['STC', 'AOI', 'Bifacial', 'Spectral', 'Irradiance', 'Thermal',
+              'DC']
+
+    fig, axlist = plt.subplots(2, 3, figsize=(14, 10), dpi=300, sharey=True)
+    for ax, climate in zip(axlist.flat, df.index):
+        losses = df.loc[climate, steps].values.astype(float) * 100
+        # The bifacial gain as a negative loss
+        losses[1] = -losses[1]
+        # Level after each loss
+        levels = 100 - np.cumsum(losses)
+        bottoms = np.r_[0, np.minimum(levels, levels + losses), 0]
+        heights = np.r_[100, np.abs(losses), levels[-1]]
+        colors = (['tab:blue']
+                  + ['tab:red' if loss > 0 else 'tab:green'
+                     for loss in losses]
+                  + ['tab:blue'])
+        ax.bar(labels, heights, bottom=bottoms, color=colors, width=0.6)
+        for x, (b, h) in enumerate(zip(bottoms, heights)):
+            ax.annotate("{:.1f}".format(h), (x, b + h),
+                        textcoords="offset points", xytext=(0, 2),
+                        ha='center', fontsize=7)
+
+        ax.set_ylim([min(80, levels.min() - 5), max(102, levels.max() + 2)])
+        ax.set_ylabel('Energy relative to STC efficiency (%)', fontsize=9)
+        ax.set_title("Module %s in %s" %(module_id, climate), fontsize=9)
+
+    plt.tight_layout()
+    # Save image
+    path = "Losses_%s.png" % (module_id)
+    path = join(res_folder, path)
+    plt.savefig(path)
+    plt.close(fig)
+    return
+
+
+def plot_site_map(df, module_id, res_folder):
+    """
+    This function generates a map with the CSER of a module in each site of
+    the multi-site rating, as a scatter plot of longitude and latitude.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame
+        Data frame with 'lat', 'lon' and the CSER of the module
+        ('cser_Module-name') for each site. Please check the function
+        "get_site_table" in multi_site.py.
+    module_id: String
+        Name or ID of the module
+    res_folder: String/Path
+        Path where figure should be saved
+    """
+    fig, ax = plt.subplots(figsize=(10, 5.5), dpi=300)
+    points = ax.scatter(df['lon'], df['lat'], c=df["cser_%s"%(module_id)],
+                        s=8, cmap='viridis', marker='s', linewidths=0)
+    cbar = fig.colorbar(points, ax=ax)
+    cbar.set_label('Climate Specific Energy Rating', fontsize=9)
+    ax.set_xlabel('Longitude (°)', fontsize=9)
+    ax.set_ylabel('Latitude (°)', fontsize=9)
+    ax.set_title("CSER map - module: %s" %(module_id), fontsize=9)
+    ax.set_aspect('equal', adjustable='datalim')
+
+    plt.tight_layout()
+    # Save image
+    path = "CSER_map_%s.png" % (module_id)
+    path = join(res_folder, path)
+    plt.savefig(path)
+    plt.close(fig)
+    return
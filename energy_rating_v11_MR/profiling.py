@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the profiling mode of the batch Energy Rating. With a
+profile folder the workers (serial or in parallel) write one cProfile dump
+per module and climate, named after the Internal ID of the module, the
+climate and the worker:
+
+    <Internal_ID>__<climate>__<worker>.prof
+
+The dumps of any number of workers and nodes are then merged into:
+
+    - hot_functions.txt: functions sorted by their own time, with the
+        package they belong to (pandas, numpy, scipy, pvpltools, matplotlib,
+        er for this code, ...) and the time of each package.
+    - profile.collapsed: collapsed stacks ("a;b;c <microseconds>" per line)
+        for flame graph tools (flamegraph.pl, speedscope, ...).
+    - merged.prof: merged pstats dump (snakeviz, pstats, ...).
+
+cProfile only keeps the callers of each function, so the collapsed stacks
+split the time of a function between its callers in proportion to the time
+of each call, as the flame graphs made from pstats files.
+
+@author: mriveraa
+"""
+import cProfile
+import glob
+import os
+import pstats
+import re
+import socket
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from os.path import basename, dirname, join
+import pandas as pd
+
+# Packages of the hot function report, by folder name in the file path
+PACKAGES = ["pandas", "numpy", "scipy", "numba", "pvpltools", "matplotlib",
+            "openpyxl", "xlsxwriter", "sqlite3"]
+# Folder of the Energy Rating code
+_ER_FOLDER = dirname(os.path.abspath(__file__))
+
+# Deepest stack of the collapsed stacks
+MAX_DEPTH = 60
+# Calls shorter than this (seconds) in a stack are kept in their caller, so
+# the stacks of dense call graphs (pandas) stay few
+MIN_TIME = 1e-5
+
+
+def get_profile_path(profile_dir, module_id, climate, worker=None):
+    """
+    This function gives the path of the dump of a module in a climate.
+
+    Parameters
+    ----------
+    profile_dir : String
+        Path like. Folder of the dumps.
+    module_id : String
+        Internal ID of the module.
+    climate : String
+        Name of the climate (or site id).
+    worker : String, optional
+        Name of the worker. The default is None (host name, process id and
+        thread id out of the main thread).
+
+    Returns
+    -------
+    path : String
+        Path of the dump.
+    """
+    if worker is None:
+        worker = "%s-%d" % (socket.gethostname(), os.getpid())
+        if threading.current_thread() is not threading.main_thread():
+            worker += "-%d" % threading.get_ident()
+    name = "__".join(re.sub(r"[^\w.-]+", "_", str(part))
+                     for part in (module_id, climate, worker))
+    return join(profile_dir, name + ".prof")
+
+
+@contextmanager
+def profile(path):
+    """
+    Context manager that profiles its block with cProfile and writes the
+    dump to "path". Nothing is profiled when "path" is None.
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(dirname(path) or ".", exist_ok=True)
+        profiler.dump_stats(path)
+
+
+def merge_profiles(paths):
+    """
+    This function merges cProfile dumps.
+
+    Parameters
+    ----------
+    paths : List
+        Paths of the dumps.
+
+    Returns
+    -------
+    stats : pstats.Stats
+        Merged statistics.
+    """
+    if not paths:
+        raise ValueError("No profile dumps to merge")
+    stats = pstats.Stats(paths[0])
+    for path in paths[1:]:
+        stats.add(path)
+    return stats
+
+
+def get_package(function):
+    """
+    Returns the package of a function of the statistics: from its source
+    file, or from its name for the built-in functions and methods (e.g.
+    "<method 'copy' of 'numpy.ndarray' objects>"). "er" is this code,
+    "builtin" the other built-in functions and "other" the rest.
+    """
+    filename, _, name = function
+    if filename == "~" or filename.startswith("<"):
+        for package in PACKAGES:
+            if re.search(r"\b%s\." % package, name):
+                return package
+        return "builtin"
+    parts = re.split(r"[\\/]", filename)
+    for package in PACKAGES:
+        if package in parts or package + ".py" in parts:
+            return package
+    if os.path.abspath(filename).startswith(_ER_FOLDER):
+        return "er"
+    return "other"
+
+
+def _get_label(function):
+    filename, line, name = function
+    if filename == "~":
+        return name
+    return "%s:%d(%s)" % (basename(filename), line, name)
+
+
+def get_hot_functions(stats, n=40):
+    """
+    This function gives the functions with the largest own time.
+
+    Parameters
+    ----------
+    stats : pstats.Stats
+        Statistics, please check "merge_profiles".
+    n : Integer, optional
+        Number of functions. The default is 40.
+
+    Returns
+    -------
+    hot_functions : Pandas DataFrame
+        One row per function with "function", "package", "ncalls",
+        "tottime" (own time in seconds), "percall" and "cumtime" (with the
+        functions it calls), sorted by "tottime".
+    packages : Pandas Series
+        Own time of all the functions of each package, sorted.
+    """
+    rows = [{"function": _get_label(function),
+             "package": get_package(function),
+             "ncalls": nc, "tottime": tt,
+             "percall": tt / nc if nc else 0.0, "cumtime": ct}
+            for function, (cc, nc, tt, ct, _) in stats.stats.items()]
+    table = pd.DataFrame(rows).sort_values("tottime", ascending=False)
+    packages = table.groupby("package")["tottime"].sum().sort_values(
+        ascending=False)
+    return table.head(n).reset_index(drop=True), packages
+
+
+def get_collapsed_stacks(stats, max_depth=MAX_DEPTH, min_time=MIN_TIME):
+    """
+    This function builds the collapsed stacks of the statistics: the own
+    time of each function is split between the stacks that lead to it in
+    proportion to the time of each call.
+
+    Parameters
+    ----------
+    stats : pstats.Stats
+        Statistics, please check "merge_profiles".
+    max_depth : Integer, optional
+        Deepest stack, the time of deeper calls stays in their caller. The
+        default is MAX_DEPTH.
+    min_time : Float, optional
+        Shortest call in a stack in seconds, the time of shorter calls stays
+        in their caller. The default is MIN_TIME.
+
+    Returns
+    -------
+    stacks : Dictionary
+        Time in microseconds of each stack ("a;b;c").
+    """
+    callees = defaultdict(dict)
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, ct) in callers.items():
+            callees[caller][function] = ct
+    stacks = defaultdict(float)
+
+    def add(function, stack, share, path):
+        tt, ct = stats.stats[function][2:4]
+        stack = stack + [_get_label(function).replace(";", ":")]
+        stacks[";".join(stack)] += share * tt
+        for callee, edge_ct in callees[function].items():
+            callee_ct = stats.stats[callee][3]
+            if not callee_ct or callee in path:
+                continue
+            if len(stack) >= max_depth or share * edge_ct < min_time:
+                # Deeper calls are kept in this function
+                stacks[";".join(stack)] += share * edge_ct
+                continue
+            path.add(callee)
+            add(callee, stack, share * edge_ct / callee_ct, path)
+            path.discard(callee)
+
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            add(function, [], 1.0, {function})
+    return {stack: int(round(time * 1e6)) for stack, time in stacks.items()
+            if time * 1e6 >= 0.5}
+
+
+def write_profile_report(profile_dir, n=40):
+    """
+    This function merges all the dumps of a profile folder and writes the
+    hot function report, the collapsed stacks and the merged dump in it.
+
+    Parameters
+    ----------
+    profile_dir : String
+        Path like. Folder of the dumps.
+    n : Integer, optional
+        Number of functions of the report. The default is 40.
+
+    Returns
+    -------
+    hot_functions : Pandas DataFrame
+        Please check "get_hot_functions".
+    """
+    paths = sorted(path for path in glob.glob(join(profile_dir, "*.prof"))
+                   if basename(path) != "merged.prof")
+    stats = merge_profiles(paths)
+    hot_functions, packages = get_hot_functions(stats, n=n)
+    modules = {basename(path).split("__")[0] for path in paths} - {"climate"}
+    with open(join(profile_dir, "hot_functions.txt"), "w",
+              encoding="utf-8") as file:
+        file.write("%d dumps, %d modules, %.2f s\n\n"
+                   % (len(paths), len(modules), stats.total_tt))
+        file.write("Own time by package (s)\n%s\n\n" % packages.to_string())
+        file.write("Hot functions (s)\n%s\n"
+                   % hot_functions.to_string(index=False))
+    with open(join(profile_dir, "profile.collapsed"), "w",
+              encoding="utf-8") as file:
+        for stack, time in sorted(get_collapsed_stacks(stats).items()):
+            file.write("%s %d\n" % (stack, time))
+    stats.dump_stats(join(profile_dir, "merged.prof"))
+    return hot_functions
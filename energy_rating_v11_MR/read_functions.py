@@ -7,7 +7,9 @@ PVsim for Callab results.
 @modified: mriveraa
 """
 # Importing libraries
+from concurrent.futures import ProcessPoolExecutor
 from os.path import join, dirname
+import os
 import pandas as pd
 import numpy as np
 from io import StringIO
@@ -161,6 +163,175 @@ def read_callab_stdfile(path):
     return mod_parameters, spec_resp, power_matrix, ar, u0, u1, module_area, tech, int_id
 
 
+def get_bifaciality(mod_parameters, bifaciality=None):
+    """
+    This function gets the bifaciality factor of a module: "Bifaciality" in
+    [Module parameters] of its CalLab file when it is given there, otherwise
+    "bifaciality".
+
+    Parameters
+    ----------
+    mod_parameters : Pandas DataFrame
+        Module parameters, please check "read_callab_stdfile".
+    bifaciality : Float, optional
+        Bifaciality factor of the modules without one in their file. The
+        default is None (monofacial).
+
+    Returns
+    -------
+    bifaciality : Float
+        Bifaciality factor of the module (None for a monofacial module).
+    """
+    if "Bifaciality" in mod_parameters:
+        return float(mod_parameters["Bifaciality"].iloc[0])
+    return bifaciality
+
+
+# Columns of the summary workbook of CalLab used for the module specs
+CALLAB_SUMMARY_COLUMNS = ["Measurement_ID_tk", "TK_Pmpp_rel", "Technology_tk",
+                          "Module_Area_tk"]
+# Columns of the measurement table of the customer files. The efficiency of
+# CalLab is kept as "eta_callab", the Power Rating Matrix of the modules has
+# the columns of "read_callab_stdfile" so ETA is calculated from the power
+CUSTOMER_COLUMNS = ["temp", "isc", "uoc", "impp", "umpp", "pmpp", "ff",
+                    "eta_callab", "gmean", "tmod", "hyst"]
+POWER_MATRIX_COLUMNS = ["gmean", "temp", "pmpp"]
+# Lines before the header of the measurement table of the customer files
+CUSTOMER_SKIPROWS = 10
+
+
+def read_callab_customer(path):
+    """
+    This function reads the measurement table of a CalLab customer file
+    ("<Measurement_ID_tk>_customer.txt"): the header after the first
+    CUSTOMER_SKIPROWS lines and then the rows with all the columns, up to the
+    first row that is not part of the table (e.g. a blank line or the notes
+    at the end of the file).
+
+    Parameters
+    ----------
+    path : String
+        Path like. Path to the customer file.
+
+    Returns
+    -------
+    mod_file : Pandas DataFrame
+        Measurements with the columns of CUSTOMER_COLUMNS, the temperature
+        ('temp') in °C as a number.
+    """
+    with open(path, encoding="ISO-8859-1") as file:
+        lines = file.read().splitlines()[CUSTOMER_SKIPROWS + 1:]
+    rows = []
+    for line in lines:
+        fields = line.split("\t")
+        if len(fields) != len(CUSTOMER_COLUMNS) or not fields[0].strip():
+            break
+        rows.append(fields)
+    if not rows:
+        raise ValueError("No measurement table in %s" % path)
+    mod_file = pd.DataFrame(rows, columns=CUSTOMER_COLUMNS)
+    mod_file["temp"] = mod_file["temp"].str.strip().str.rstrip(" °C")
+    # Malformed values raise a ValueError
+    mod_file = mod_file.apply(pd.to_numeric)
+    return mod_file
+
+
+def _read_customer_entry(entry):
+    # Reads one customer file of "read_callab_bulk" (in a worker process),
+    # the errors are returned for the summary
+    module_id, path = entry
+    if path is None:
+        return module_id, None, "missing", "No customer file"
+    try:
+        return module_id, read_callab_customer(path), "ok", ""
+    except (OSError, ValueError, UnicodeDecodeError) as error:
+        return module_id, None, "malformed", str(error)
+
+
+def read_callab_bulk(path, folder_modules, data_file, workers=None):
+    """
+    This function reads the data of all the modules of the CalLab results:
+    the summary workbook is read once, the customer file of each
+    "Measurement_ID_tk" is found in the folder of the modules and the files
+    are read in parallel. The modules with a missing or malformed customer
+    file are left out and given in the summary.
+
+    Parameters
+    ----------
+    path : String
+        Path to where the Callab list is.
+    folder_modules : String
+        Name of folder where all the Callab results are.
+    data_file : String
+        Name of the file with the Callab results summary.
+    workers : Integer, optional
+        Number of worker processes, 1 reads the files in this process. The
+        default is None (number of CPUs).
+
+    Returns
+    -------
+    modules : List
+        One dictionary per module read: "alpha" (temperature coefficient of
+        the power in 1/°C), "tech", "module_id_callab", "mod_area" (as
+        "read_callab_data" in the first version of the code), "file",
+        "measurements" (all the columns of the customer file, please check
+        "read_callab_customer") and "power_matrix" (its 'gmean', 'temp' and
+        'pmpp', as "read_callab_stdfile").
+    summary : Pandas DataFrame
+        One row per row of the workbook with "Measurement_ID_tk", "file",
+        "status" ("ok", "missing", "malformed" or "duplicate") and "error".
+    """
+    list_callab = pd.read_excel(join(path, data_file))
+    missing = set(CALLAB_SUMMARY_COLUMNS) - set(list_callab.columns)
+    if missing:
+        raise ValueError("Missing columns in the CalLab summary: %s"
+                         % ", ".join(sorted(missing)))
+    ids = list_callab["Measurement_ID_tk"].astype(str).str.strip()
+
+    # Customer files of the folder, listed once
+    path_to = join(path, folder_modules)
+    files = {name: join(path_to, name) for name in os.listdir(path_to)
+             if name.endswith("_customer.txt")}
+    duplicate = ids.duplicated().values
+    entries = [(module_id, files.get("%s_customer.txt" % module_id))
+               for module_id in ids[~duplicate]]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(entries) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                _read_customer_entry, entries,
+                chunksize=max(1, len(entries) // (4 * workers))))
+    else:
+        results = [_read_customer_entry(entry) for entry in entries]
+    results = {result[0]: result[1:] for result in results}
+
+    modules = []
+    rows = []
+    for i, module_id in enumerate(ids):
+        file = files.get("%s_customer.txt" % module_id)
+        if duplicate[i]:
+            rows.append((module_id, file, "duplicate",
+                         "Measurement ID already in the summary"))
+            continue
+        mod_file, status, error = results[module_id]
+        rows.append((module_id, file, status, error))
+        if status != "ok":
+            continue
+        module_callab = list_callab.iloc[i]
+        modules.append({"alpha": module_callab.TK_Pmpp_rel / 100,
+                        "tech": module_callab.Technology_tk,
+                        "module_id_callab": module_id,
+                        "mod_area": module_callab.Module_Area_tk,
+                        "file": file,
+                        "measurements": mod_file,
+                        "power_matrix": mod_file[POWER_MATRIX_COLUMNS]})
+    summary = pd.DataFrame(rows, columns=["Measurement_ID_tk", "file",
+                                          "status", "error"])
+    return modules, summary
+
+
 def read_climate_locs(folder_locations, loc_name):
     """
     This function reads the climate locations from the standard based on the
@@ -230,8 +401,46 @@ def change_names_climate_df(climate_df):
                    'B (W/m2)': 'I_tlt',
                    'Wind speed (m/s)': "wind",
                    'Sun incidence angle (ø)': "IncidentAngle"}
-    climate_df.rename(columns=translation, inplace=True)
+    climate_df = climate_df.rename(columns=translation)
     # Adding additional columns for the simulation
     climate_df["dhor"] = climate_df["ghor"] - climate_df["ihor"]
     climate_df["D_tlt"] = climate_df["G_tlt"] - climate_df["I_tlt"]
     return climate_df
+
+
+def resample_climate(climate_df, resolution="1h"):
+    """
+    This function resamples sub-hourly climate data (e.g. 1-minute or
+    10-minute measurements) to a coarser resolution before the simulation,
+    to reduce the number of time steps when the full resolution is not
+    needed. The irradiances, temperature and wind are averaged in each
+    interval; the angle of incidence is averaged weighted by the direct
+    irradiance in POA, so the AOI correction of the direct irradiance is
+    kept.
+
+    Parameters
+    ----------
+    climate_df : Pandas DataFrame
+        DataFrame with Datetime index and the column names for the
+        simulation, please check "change_names_climate_df".
+    resolution : String, optional
+        Target resolution as a pandas offset alias, e.g. "10min" or "1h".
+        The default is "1h".
+
+    Returns
+    -------
+    ret_df : Pandas DataFrame
+        Climate data with one time step per interval (labelled by its start),
+        the intervals without data are left out.
+    """
+    ret_df = climate_df.resample(resolution).mean()
+    if "IncidentAngle" in climate_df and "I_tlt" in climate_df:
+        # Average of cos(AOI) weighted by the direct irradiance in POA
+        direct = climate_df["I_tlt"].clip(lower=0)
+        cos_aoi = np.cos(np.radians(climate_df["IncidentAngle"]))
+        direct_sum = direct.resample(resolution).sum()
+        cos_avg = (direct * cos_aoi).resample(resolution).sum() / direct_sum
+        ret_df["IncidentAngle"] = np.degrees(
+            np.arccos(cos_avg.clip(-1, 1))).where(direct_sum > 0,
+                                                  ret_df["IncidentAngle"])
+    return ret_df.dropna(how="all")
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the results database of the Energy Rating simulation. The
+CSER and average ETA of every module in every standard climate are kept in
+an indexed SQLite file (one row per module and climate) instead of one
+column per module in the excel file:
+
+    - Module metadata from the [Module parameters] section of the CalLab
+        file.
+    - Results with the engine version and the hash of the input file and
+        of the settings of the rating (please check "get_rating_settings"),
+        so a module can be rated again without losing its history and the
+        ratings with other settings are kept apart.
+    - Query helpers: top modules per climate, distribution per technology
+        and history of one Internal_ID.
+
+Several processes can write to the same file: the database is opened in WAL
+mode and each writer waits for the lock up to "TIMEOUT" seconds.
+
+@author: mriveraa
+"""
+import hashlib
+import sqlite3
+from datetime import datetime
+import pandas as pd
+# Importing execution functions
+import utils
+
+# Seconds a writer waits for the database lock
+TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS modules (
+    internal_id TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    order_id TEXT,
+    producer TEXT,
+    module_type TEXT,
+    technology TEXT,
+    serial_number TEXT,
+    number_of_cells INTEGER,
+    module_area REAL,
+    settings TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (internal_id, input_hash)
+);
+CREATE TABLE IF NOT EXISTS results (
+    internal_id TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    climate TEXT NOT NULL,
+    cser REAL,
+    eta_avg REAL,
+    engine_version TEXT NOT NULL,
+    created TEXT NOT NULL,
+    UNIQUE (internal_id, climate, engine_version, input_hash)
+);
+CREATE INDEX IF NOT EXISTS results_ranking
+    ON results (climate, engine_version, cser DESC);
+CREATE INDEX IF NOT EXISTS results_module
+    ON results (internal_id, created);
+CREATE INDEX IF NOT EXISTS modules_technology
+    ON modules (technology);
+"""
+
+# [Module parameters] of the CalLab file: column in the modules table
+_MODULE_COLUMNS = {"Order_ID": "order_id",
+                   "Producer": "producer",
+                   "Module_Type": "module_type",
+                   "Technology": "technology",
+                   "Serial_Number": "serial_number",
+                   "Number_of_cells": "number_of_cells",
+                   "Module_Area_[m2]": "module_area"}
+
+
+def connect(db_path):
+    """
+    This function opens the results database, creating the tables and
+    indices if they do not exist yet.
+
+    Parameters
+    ----------
+    db_path : String
+        Path like. Path to the SQLite file.
+
+    Returns
+    -------
+    con : sqlite3.Connection
+        Connection to the database.
+    """
+    con = sqlite3.connect(db_path, timeout=TIMEOUT)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript(_SCHEMA)
+    columns = [row[1] for row in con.execute("PRAGMA table_info(modules)")]
+    if "settings" not in columns:
+        # Files written before the settings were stored: their ratings are
+        # reference ratings
+        con.execute("ALTER TABLE modules "
+                    "ADD COLUMN settings TEXT NOT NULL DEFAULT ''")
+    return con
+
+
+def get_rating_settings(engine="steps", eta_model=None, lookup_steps=None,
+                        tau=None, resolution=None, bifaciality=None,
+                        albedo=0.2):
+    """
+    This function gives the settings of a rating that change its numbers as
+    text, e.g. "eta_model=hey;tau=420.0". The reference rating (NumPy steps,
+    bilinear interpolation of the ETA, steady-state temperature, resolution
+    of the climate file and monofacial) gives "".
+
+    Parameters
+    ----------
+    engine : String, optional
+        "steps" (also the daylight and stage graph engines, with the same
+        numbers), "fused" or "binned". The default is "steps".
+    eta_model, lookup_steps, tau, resolution, bifaciality, albedo : optional
+        Please check the function "simulation_er" in run_main.py. The
+        analytic efficiency model is used instead of the lookup table when
+        both are given, as in "get_ini_data".
+
+    Returns
+    -------
+    settings : String
+        Settings separated by ";".
+    """
+    settings = []
+    if engine != "steps":
+        settings.append("engine=%s" % engine)
+    if eta_model is not None:
+        settings.append("eta_model=%s" % eta_model)
+    elif lookup_steps is not None:
+        settings.append("lookup_steps=%r,%r" % tuple(
+            float(step) for step in lookup_steps))
+    if tau is not None:
+        settings.append("tau=%r" % float(tau))
+    if resolution is not None:
+        settings.append("resolution=%s" % resolution)
+    if bifaciality is not None:
+        settings.append("bifaciality=%r;albedo=%r"
+                        % (float(bifaciality), float(albedo)))
+    return ";".join(settings)
+
+
+def get_input_hash(path, settings=""):
+    """
+    Returns the SHA-1 hash of the content of a CalLab file and of the
+    settings of the rating (please check "get_rating_settings"), so the
+    results of other settings do not replace each other. The reference
+    rating gives the hash of the file only.
+    """
+    with open(path, "rb") as file:
+        sha1 = hashlib.sha1(file.read())
+    if settings:
+        sha1.update(settings.encode())
+    return sha1.hexdigest()
+
+
+def write_module_results(db_path, mod_parameters, climates, cser, eta_avg,
+                         input_hash, engine_version=utils.ENGINE_VERSION,
+                         settings=""):
+    """
+    This function stores the results of one module in the six standard
+    climates. All the rows are written in one transaction; rating again the
+    same input with the same engine version replaces the previous rows.
+
+    Parameters
+    ----------
+    db_path : String
+        Path like. Path to the SQLite file.
+    mod_parameters : Pandas DataFrame
+        Information about the measured module, as given by
+        "read_callab_stdfile".
+    climates : List
+        Names of the standard climates.
+    cser, eta_avg : List
+        CSER and average ETA in each climate of "climates".
+    input_hash : String
+        Hash of the CalLab file and the settings, please check
+        "get_input_hash".
+    engine_version : String, optional
+        Version of the simulation. The default is utils.ENGINE_VERSION.
+    settings : String, optional
+        Settings of the rating, please check "get_rating_settings". The
+        default is "" (reference rating).
+    """
+    int_id = str(mod_parameters["Internal_ID"].iloc[0])
+    module = {column: mod_parameters[name].iloc[0]
+              for name, column in _MODULE_COLUMNS.items()
+              if name in mod_parameters}
+    if "number_of_cells" in module:
+        module["number_of_cells"] = int(module["number_of_cells"])
+    if "module_area" in module:
+        module["module_area"] = float(module["module_area"])
+    module["settings"] = settings
+    created = datetime.now().isoformat(timespec="seconds")
+    rows = [(int_id, input_hash, climate, float(c), float(e),
+             engine_version, created)
+            for climate, c, e in zip(climates, cser, eta_avg)]
+
+    con = connect(db_path)
+    try:
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO modules "
+                "(internal_id, input_hash, %s) VALUES (?, ?, %s)"
+                % (", ".join(module), ", ".join("?" * len(module))),
+                [int_id, input_hash] + list(module.values()))
+            con.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows)
+    finally:
+        con.close()
+    return
+
+
+def get_top_modules(db_path, climate, k=10,
+                    engine_version=utils.ENGINE_VERSION, settings=""):
+    """
+    This function returns the "k" modules with the highest CSER in a
+    standard climate, among the ratings with the same settings (please
+    check "get_rating_settings", "" for the reference rating). For modules
+    rated more than once the best result of the engine version is taken.
+
+    Returns
+    -------
+    top : Pandas DataFrame
+        Internal_ID, technology, CSER and average ETA, highest CSER first.
+    """
+    # The ranking index gives the rows from the highest CSER, so only the
+    # first rows are read until "k" different modules are found
+    query = """
+        SELECT r.internal_id, m.technology, r.cser, r.eta_avg
+        FROM results AS r INDEXED BY results_ranking
+        JOIN modules AS m
+            ON m.internal_id = r.internal_id AND m.input_hash = r.input_hash
+        WHERE r.climate = ? AND r.engine_version = ? AND m.settings = ?
+        ORDER BY r.cser DESC"""
+    rows = {}
+    con = connect(db_path)
+    try:
+        for row in con.execute(query, (climate, engine_version, settings)):
+            if len(rows) >= k:
+                break
+            rows.setdefault(row[0], row)
+    finally:
+        con.close()
+    return pd.DataFrame(list(rows.values()),
+                        columns=["internal_id", "technology", "cser",
+                                 "eta_avg"])
+
+
+def get_technology_distribution(db_path, climate=None,
+                                engine_version=utils.ENGINE_VERSION,
+                                settings=""):
+    """
+    This function returns the distribution of the CSER for each technology
+    (and climate, if "climate" is None), among the ratings with the same
+    settings (please check "get_rating_settings").
+
+    Returns
+    -------
+    distribution : Pandas DataFrame
+        Count, mean, standard deviation, minimum, quartiles and maximum of
+        the CSER.
+    """
+    query = """
+        SELECT r.climate, m.technology, r.cser
+        FROM results AS r
+        JOIN modules AS m
+            ON m.internal_id = r.internal_id AND m.input_hash = r.input_hash
+        WHERE r.engine_version = ? AND m.settings = ?"""
+    params = [engine_version, settings]
+    if climate is not None:
+        query += " AND r.climate = ?"
+        params.append(climate)
+    con = connect(db_path)
+    try:
+        df = pd.read_sql_query(query, con, params=params)
+    finally:
+        con.close()
+    by = ["technology"] if climate is not None else ["climate", "technology"]
+    return df.groupby(by)["cser"].describe()
+
+
+def get_module_history(db_path, internal_id):
+    """
+    This function returns all the results stored for one Internal_ID, for
+    every engine version, input file and settings, oldest first.
+
+    Returns
+    -------
+    history : Pandas DataFrame
+        One row per rating and climate.
+    """
+    query = """
+        SELECT r.climate, r.cser, r.eta_avg, r.engine_version, m.settings,
+            r.input_hash, r.created
+        FROM results AS r
+        LEFT JOIN modules AS m
+            ON m.internal_id = r.internal_id AND m.input_hash = r.input_hash
+        WHERE r.internal_id = ?
+        ORDER BY r.created, r.climate"""
+    con = connect(db_path)
+    try:
+        return pd.read_sql_query(query, con, params=(internal_id,))
+    finally:
+        con.close()
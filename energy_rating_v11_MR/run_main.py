@@ -11,16 +11,41 @@ import sim_steps
 import energy_rating_functions as energy_rating
 # Importing read functions
 import read_functions
+import numpy as np
 import pandas as pd
 # Importing execution functions
 import utils
 import plotting
+# Importing the dense ETA lookup
+import eta_lookup
+# Importing the analytic efficiency models
+import efficiency_models
+# Importing the climate store
+import climate_store
+# Importing the aggregates
+import aggregates
+# Importing the results database
+import results_db
+# Importing the AC stage
+import ac_stage
+# Importing the batch scheduler
+import scheduler
+# Importing the lifetime energy projection
+import lifetime as lifetime_energy
 # Import Module
+from concurrent.futures import ProcessPoolExecutor
 import os
 
+# Folder with the standard's files (next to this code)
+FOLDER_LOCATIONS = "the_standard"
+# Names of the six standard climates
+CLIMATES = ['Tropical humid', 'Subtropical arid (desert)',
+            'Subtropical coastal', 'Temperate coastal',
+            'High elevation (above 3 000 m)', 'Temperate continental']
 
 
-def get_ini_data(module_df, eta, module_area, folder_locations, site_name):
+def get_ini_data(module_df, eta, module_area, folder_locations, site_name,
+                 lookup_steps=None, eta_model=None, resolution=None):
     """
     This function reads/gets the initial dataframe from the standard climate
     files.
@@ -41,6 +66,22 @@ def get_ini_data(module_df, eta, module_area, folder_locations, site_name):
         files.
     site_name: String
         Name of the standard climate data file to read.
+    lookup_steps: Tuple, optional
+        Irradiance (W/m²) and temperature (°C) resolution of the dense ETA
+        lookup table, e.g. (5, 0.5). When given, "eta_interpolated" is the
+        lookup table instead of the bilinear interpolation object, please
+        check the function "get_eta_lookup" in eta_lookup.py. The default is
+        None.
+    eta_model: String, optional
+        Name of the analytic efficiency model ("hey", "mpm5", "mpm6" or
+        "pvgis") fitted to the power matrix. When given, "eta_interpolated"
+        is the fitted model instead of the bilinear interpolation object,
+        please check the function "fit_efficiency_model" in
+        efficiency_models.py. The default is None.
+    resolution: String, optional
+        Resolution of the climate data for the simulation, e.g. "10min" or
+        "1h", please check the function "resample_climate" in
+        read_functions.py. The default is None (resolution of the file).
 
     Returns
     -------
@@ -63,21 +104,37 @@ def get_ini_data(module_df, eta, module_area, folder_locations, site_name):
         energy_rating.get_eta_interpolation(module_df= module_df,
                                             module_area= module_area,
                                             eta_calc= eta)
+    if eta_model is not None:
+        module_df = energy_rating.prepare_power_matrix(module_df=module_df,
+                                                       module_area=module_area,
+                                                       eta_calc=eta)
+        # Analytic efficiency model fitted to the power matrix
+        eta_interpolated = efficiency_models.fit_efficiency_model(
+            power_matrix=module_df,
+            model=eta_model)
+    elif lookup_steps is not None:
+        # Dense ETA lookup table (built once per module, then cached)
+        eta_interpolated = eta_lookup.get_eta_lookup(
+            eta_matrix=eta_matrix,
+            g_step=lookup_steps[0],
+            t_step=lookup_steps[1])
 
-    # Reading standard climate data
-    climate_data = read_functions.read_climate_locs(
+    # Reading standard climate data (with the names for the simulation), the
+    # file is read only once and kept in the climate store
+    climate_data = climate_store.get_climate(
         folder_locations=folder_locations,
         loc_name=site_name)
-    
-    # Changing names to climate dataframe for simulation
-    climate_data = read_functions.change_names_climate_df(
-        climate_df=climate_data)
+    if resolution is not None:
+        climate_data = read_functions.resample_climate(
+            climate_df=climate_data,
+            resolution=resolution)
     return (eta_interpolated, pnom, eta_matrix, climate_data)
 
 
 def get_simulation(climate_data, lat, lon, ele, tech, pnom, mod_area,
                    eta_interpolated, u0, u1, a_r, power_matrix, eta_matrix,
-                   pv_azimuth=180, pv_tilt=20, spec_resp_factor=1.0):
+                   pv_azimuth=180, pv_tilt=20, spec_resp_factor=1.0, tau=None,
+                   bifaciality=None, albedo=0.2):
     """
     This function calls for the Energy Rating steps.
     Please check the function ersim_dc_steps() in sim_steps.py
@@ -85,7 +142,7 @@ def get_simulation(climate_data, lat, lon, ele, tech, pnom, mod_area,
     """
 
     cser_er, eta_avg_er, sim_er_df = sim_steps.ersim_dc_steps(
-        climate_data=climate_data.copy(),
+        climate_data=climate_data,
         pv_tilt=pv_tilt,
         eta_interpolated=eta_interpolated,
         pnom=pnom,
@@ -95,7 +152,10 @@ def get_simulation(climate_data, lat, lon, ele, tech, pnom, mod_area,
         a_r=a_r,
         spec_resp_factor=spec_resp_factor,
         power_matrix= power_matrix,
-        eta_matrix=eta_matrix)
+        eta_matrix=eta_matrix,
+        tau=tau,
+        bifaciality=bifaciality,
+        albedo=albedo)
     # Creating a DataFrame with results
     ret_df = pd.DataFrame(columns=["cser_ER", "eta_avg_ER"])
     ret_df.at[0, "cser_ER"] = cser_er
@@ -103,12 +163,282 @@ def get_simulation(climate_data, lat, lon, ele, tech, pnom, mod_area,
     return sim_er_df, ret_df
 
 
-def simulation_er(folder):
+def simulate_module(file_path, res_folder, lookup_steps=None,
+                    eta_model=None, tau=None, tables=False, losses=False,
+                    plot_mode="scatter", bifaciality=None, albedo=0.2,
+                    dc_ac_ratios=None, inverter_curve=None, resolution=None,
+                    lifetime=False):
+    """
+    This function runs the simulation of one CalLab file in the six standard
+    climates and saves its figures (and tables). Please check the function
+    "simulation_er" for the parameters.
+
+    Parameters
+    ----------
+    file_path: String/path
+        Path to the CalLab file.
+    res_folder: String/path
+        Folder of the results, the figures are saved in its "plots" folder.
+    lifetime: Boolean, optional
+        If True, the energy of the simulated year in each standard climate
+        is also given. The default is False.
+
+    Returns
+    -------
+    module : Dictionary
+        "int_id", "file_path", "mod_parameters", "bifaciality", "cser" and
+        "eta" (lists, one value per standard climate), "waterfalls" (the
+        waterfall Series of each standard climate when "losses" is True),
+        "ac_table" (None without "dc_ac_ratios") and "first_year" (energy
+        in kWh of each standard climate when "lifetime" is True).
+    """
+    plots_folder = os.path.join(res_folder, "plots")
+    (mod_parameters, spec_resp, power_matrix, ar,
+     u0, u1, module_area, tech, int_id) = read_functions.read_callab_stdfile(path = file_path)
+    # Power matrix with ETA for the simulation (the one read is not
+    # changed)
+    power_matrix = energy_rating.prepare_power_matrix(
+        module_df=power_matrix,
+        module_area=module_area)
+    # Bifaciality factor of the module (from its file when given)
+    module_bifaciality = read_functions.get_bifaciality(
+        mod_parameters, bifaciality=bifaciality)
+    print('Module: ', int_id)
+    cser = []
+    eta = []
+    eta_dataframes = {}
+    energy_tables = {}
+    waterfalls = {}
+    first_year = {}
+
+    for location in range(6):
+        print("Location #", location)
+        std_location = read_functions.read_standard_locations(location)
+        # Getting initial data
+        (eta_interpolated, pnom, eta_matrix,
+         climate_data) = get_ini_data(
+                    module_df = power_matrix,
+                    eta= False,
+                    module_area = module_area,
+                    folder_locations=FOLDER_LOCATIONS,
+                    site_name=std_location["loc"],
+                    lookup_steps=lookup_steps,
+                    eta_model=eta_model,
+                    resolution=resolution)
+                    
+        if tables or losses:
+            # Rating and tables from the same simulation, the group
+            # indices of the hourly climate are kept in the climate
+            # store
+            if resolution is None:
+                groups = climate_store.get_climate_groups(
+                    folder_locations=FOLDER_LOCATIONS,
+                    loc_name=std_location["loc"])
+            else:
+                groups = None
+            (cser_er, eta_avg_er, site_tables,
+             sim_er_df) = sim_steps.ersim_dc_tables(
+                climate_data=climate_data,
+                eta_interpolated=eta_interpolated,
+                pnom=pnom,
+                mod_area=module_area,
+                u0=u0,
+                u1=u1,
+                a_r=ar,
+                power_matrix=power_matrix,
+                pv_tilt=std_location["pv_tilt"],
+                spec_resp_factor=spec_resp,
+                tau=tau,
+                groups=groups,
+                bifaciality=module_bifaciality,
+                albedo=albedo,
+                full_output=True)
+            energy_tables[std_location["site_name"]] = site_tables
+            if losses:
+                waterfalls[std_location["site_name"]] = \
+                    site_tables["waterfall"]
+        else:
+            # Running simulations
+            sim_er_df, ret_df = get_simulation(
+                climate_data=climate_data,
+                lat=std_location["site_lat"],
+                lon=std_location["site_lon"],
+                ele=std_location["site_ele"],
+                tech=tech,
+                pnom=pnom,
+                mod_area=module_area,
+                eta_interpolated=eta_interpolated,
+                u0=u0,
+                u1=u1,
+                pv_azimuth=std_location["pv_azimuth"],
+                pv_tilt=std_location["pv_tilt"],
+                a_r=ar,
+                spec_resp_factor=spec_resp,
+                power_matrix= power_matrix,
+                eta_matrix=eta_matrix,
+                tau=tau,
+                bifaciality=module_bifaciality,
+                albedo=albedo)
+            cser_er = float(ret_df["cser_ER"])
+            eta_avg_er = float(ret_df["eta_avg_ER"])
+
+        # Results
+        cser.append(cser_er)
+        eta.append(eta_avg_er)
+
+        if lifetime:
+            # Energy of the simulated year (kWh) from the CSER
+            irradiation = sim_er_df["G_tlt"]
+            if "time_step" in sim_er_df:
+                irradiation = irradiation * sim_er_df["time_step"]
+            first_year[std_location["site_name"]] = \
+                lifetime_energy.get_first_year_energy(
+                    cser=cser_er,
+                    irradiation=irradiation.sum(),
+                    pnom=pnom)
+
+        # Plot ETA
+        plotting.plot_eta(df = sim_er_df,
+                          res_folder= plots_folder,
+                          module_id = int_id,
+                          location = std_location,
+                          plot_mode = plot_mode)
+        
+        # Only the columns of the ETA figures and the AC stage are
+        # kept for all the climates of the module
+        eta_dataframes[std_location["site_name"]] = sim_er_df[
+            [column for column in ["eta", "Pout", "time_step"]
+             if column in sim_er_df]]
+
+    results_df_cser = pd.DataFrame({"Std_climate": CLIMATES,
+                                    "cser_%s"%(int_id): cser})
+
+    # Plot CSER
+    plotting.plot_cser(df = results_df_cser,
+                      res_folder= plots_folder,
+                      module_id = int_id)
+    
+    # Round Robin comparision plot 
+    # (other format of plotting.plot_cser())
+    plotting.round_robin_plot(df=results_df_cser,
+                      module_id=int_id,
+                      res_folder=res_folder)
+
+    #Plot ETA from all the standard sites
+    plotting.eta_all_sites(df = eta_dataframes,
+                       module_id = int_id,
+                       res_folder= plots_folder,
+                       plot_mode = plot_mode)
+
+    ac_table = None
+    if dc_ac_ratios is not None:
+        # AC energy and clipping for all the DC/AC ratios at once
+        ac_table = ac_stage.get_ac_table(
+            sim_results=eta_dataframes,
+            pnom=pnom,
+            dc_ac_ratios=dc_ac_ratios,
+            curve=inverter_curve)
+
+    if tables:
+        # Excel file with the tables of the module
+        utils.write_tables(tables=energy_tables,
+                           module_id=int_id,
+                           folder=res_folder)
+
+    return {"int_id": int_id, "file_path": file_path,
+            "mod_parameters": mod_parameters,
+            "bifaciality": module_bifaciality, "cser": cser, "eta": eta,
+            "waterfalls": waterfalls, "ac_table": ac_table,
+            "first_year": first_year}
+
+
+def _simulate_chunk(module_files, kwargs):
+    # Simulation of a chunk of CalLab files (in a worker process)
+    modules = [simulate_module(file_path, **kwargs)
+               for file_path in module_files]
+    return modules
+
+
+def simulation_er(folder, lookup_steps=None, eta_model=None, tau=None,
+                  tables=False, losses=False, db_path=None,
+                  plot_mode="scatter", bifaciality=None, albedo=0.2,
+                  dc_ac_ratios=None, inverter_curve=None, resolution=None,
+                  memory_budget=None, max_workers=None, degradation=None,
+                  lifetime_years=25):
     """
     This function calls for the simulation that follow the method in the
     Energy rating standard IEC61853-3, it takes a given data file(s) with
     measurements done by Callab.
-    
+
+    Parameters
+    ----------
+    folder: String/path
+        Folder with the CalLab data files.
+    lookup_steps: Tuple, optional
+        Irradiance (W/m²) and temperature (°C) resolution of the dense ETA
+        lookup table used instead of the bilinear interpolation, e.g. (5, 0.5).
+        The default is None (bilinear interpolation).
+    eta_model: String, optional
+        Name of the analytic efficiency model ("hey", "mpm5", "mpm6" or
+        "pvgis") used instead of the bilinear interpolation. The default is
+        None (bilinear interpolation).
+    tau: Float, optional
+        Thermal time constant of the modules in seconds for the transient
+        module temperature. The default is None (steady-state temperature).
+    tables: Boolean, optional
+        If True, the monthly, daily and hour of the day x month loss tables
+        of each module are saved in an excel file. The default is False.
+    losses: Boolean, optional
+        If True, the annual loss waterfall (AOI, spectral, irradiance and
+        thermal) of each module in each standard climate is saved in an
+        excel file and plotted. The default is False.
+    db_path: String/path, optional
+        SQLite file where the CSER and ETA of each module are also stored,
+        please check results_db.py. The default is None (only excel file).
+    plot_mode: String, optional
+        "scatter" draws every hour of the ETA figures, "binned" draws them as
+        2-D histograms reusing the same figure for all the modules (faster
+        for large batches). The default is "scatter".
+    bifaciality: Float, optional
+        Bifaciality factor of the modules (rear to front efficiency ratio).
+        When given, the modules are rated as bifacial with the ground
+        reflected and rear side irradiance. A "Bifaciality" in [Module
+        parameters] of a CalLab file is used for that module instead. The
+        default is None (monofacial).
+    albedo: Float, optional
+        Reflectance of the ground for the bifacial rating. The default is
+        0.2.
+    dc_ac_ratios: Float or List, optional
+        DC/AC ratio(s) of the optional AC stage: the DC power of each module
+        goes through an inverter sized as the nominal power over the ratio,
+        please check ac_stage.py. The default is None (no AC stage).
+    inverter_curve: Pandas Series, optional
+        Inverter efficiency against the relative DC input power of the AC
+        stage. The default is None (ac_stage.DEFAULT_INVERTER_CURVE).
+    resolution: String, optional
+        Resolution of the climate data for the simulation, e.g. "1h" for
+        sub-hourly climate files. The energy of each time step uses its
+        duration, so sub-hourly and irregular data can be used directly.
+        The default is None (resolution of the climate files).
+    memory_budget: Float, optional
+        Memory available for the simulation in bytes. When given, the CalLab
+        files are simulated in chunks by as many worker processes as fit in
+        the budget, chosen from the peak memory estimated before anything is
+        simulated, and a ValueError is raised if not even one worker fits,
+        please check "plan_batch" in scheduler.py. The default is None (the
+        CalLab files are simulated one after the other in this process).
+    max_workers: Integer, optional
+        Largest number of worker processes with "memory_budget". The default
+        is None (number of CPUs).
+    degradation: Pandas DataFrame, optional
+        Degradation scenarios of the lifetime energy projection, e.g. one
+        row per scenario with "lid" and "rate", please check the function
+        "get_degradation_factors" in lifetime.py. When given, the energy of
+        the simulated year of each module and standard climate is projected
+        over its lifetime. The default is None (no projection).
+    lifetime_years: Integer, optional
+        Lifetime of the projection in years. The default is 25.
+
     Returns
     -------
     Figures:
@@ -126,112 +456,161 @@ def simulation_er(folder):
         ETA and CSER values of all standard climates for each module input
         data, e.g:
             results_cser_eta.xlsx
+        Monthly, daily and hour of the day x month loss tables of each
+        module in all standard climates (when "tables" is True), e.g:
+            tables_Module-name.xlsx
+        Annual loss waterfall of all modules in all standard climates (when
+        "losses" is True), e.g:
+            results_losses.xlsx
+            Losses_Module-name.png
+        AC energy, inverter and clipping losses of all modules in all
+        standard climates for each DC/AC ratio (when "dc_ac_ratios" is
+        given), e.g:
+            results_ac.xlsx
+        Annual and lifetime energy (kWh) of all modules in all standard
+        climates for each degradation scenario (when "degradation" is
+        given), e.g:
+            results_lifetime.xlsx
+    Database:
+        CSER and ETA of each module in each standard climate (when "db_path"
+        is given).
     """
     # =======================================================================
     # Folder and paths info
     # =======================================================================
-    # Folder with the standard's files
-    folder_locations = "the_standard"
-    # Change the directory
-    os.chdir(folder)
+    # Results folders, the paths are built from "folder" so the working
+    # directory is not changed
+    res_folder = os.path.join(folder, "results")
+    plots_folder = os.path.join(res_folder, "plots")
     #Creating directory
-    os.makedirs('results/plots', exist_ok=True)
+    os.makedirs(plots_folder, exist_ok=True)
     
     #Create data frame for results
-    climate = ['Tropical humid', 'Subtropical arid (desert)',
-               'Subtropical coastal', 'Temperate coastal',
-               'High elevation (above 3 000 m)', 'Temperate continental']
-    results_df_cser = pd.DataFrame({"Std_climate": climate})
-    results_df_eta = pd.DataFrame({"Std_climate": climate})
+    results_df_cser = pd.DataFrame({"Std_climate": CLIMATES})
+    results_df_eta = pd.DataFrame({"Std_climate": CLIMATES})
+    waterfalls = {}
+    ac_tables = {}
+    first_year = {}
+
+    # CalLab files of the folder
+    module_files = [os.path.join(folder, file)
+                    for file in os.listdir(folder) if file.endswith(".txt")]
+    kwargs = {"res_folder": res_folder, "lookup_steps": lookup_steps,
+              "eta_model": eta_model, "tau": tau, "tables": tables,
+              "losses": losses, "plot_mode": plot_mode,
+              "bifaciality": bifaciality, "albedo": albedo,
+              "dc_ac_ratios": dc_ac_ratios, "inverter_curve": inverter_curve,
+              "resolution": resolution,
+              "lifetime": degradation is not None}
+
+    workers, chunk_size = 1, len(module_files)
+    if memory_budget is not None and module_files:
+        # Pre-flight memory estimate: each worker simulates one module at a
+        # time, keeping the climates in the climate store and the ETA and
+        # power of the six climates of the module
+        n_steps, n_bands = scheduler.get_climate_size(os.path.join(
+            FOLDER_LOCATIONS,
+            read_functions.read_standard_locations(0)["loc"]))
+        outputs = ["frames", "plots"]
+        if tables or losses:
+            outputs.append("tables")
+        if dc_ac_ratios is not None:
+            outputs.append("ac")
+        plan = scheduler.plan_batch(
+            n_modules=1, n_climates=len(CLIMATES), n_steps=n_steps,
+            memory_budget=memory_budget, outputs=outputs, n_bands=n_bands,
+            cached_climates=len(CLIMATES),
+            n_ratios=len(np.atleast_1d(dc_ac_ratios)),
+            max_workers=max_workers, n_tasks=len(module_files))
+        workers, chunk_size = plan["workers"], plan["chunk_size"]
 
     # =======================================================================
     # Simulation for the 6 standard climates
     # =======================================================================
+    if workers == 1:
+        modules = _simulate_chunk(module_files, kwargs)
+    else:
+        # Chunks of CalLab files in worker processes, the results are kept
+        # in the order of the files
+        chunks = [module_files[i:i + chunk_size]
+                  for i in range(0, len(module_files), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            modules = [module for results in executor.map(
+                _simulate_chunk, chunks, [kwargs] * len(chunks))
+                for module in results]
 
-    # iterate through all file
-    for file in os.listdir():
-        # Check whether file is in text format or not
-        if file.endswith(".txt"):
-            file_path = f"{folder}\{file}"
-    
-            (mod_parameters, spec_resp, power_matrix, ar,
-             u0, u1, module_area, tech, int_id) = read_functions.read_callab_stdfile(path = file_path)
-            print('Module: ', int_id)
-            cser = []
-            eta = []
-            eta_dataframes = {}
-
-            for location in range(6):
-                print("Location #", location)
-                std_location = read_functions.read_standard_locations(location)
-                # Getting initial data
-                (eta_interpolated, pnom, eta_matrix,
-                 climate_data) = get_ini_data(
-                            module_df = power_matrix,
-                            eta= False,
-                            module_area = module_area,
-                            folder_locations=folder_locations,
-                            site_name=std_location["loc"])
-                            
-                # Running simulations
-                sim_er_df, ret_df = get_simulation(
-                    climate_data=climate_data,
-                    lat=std_location["site_lat"],
-                    lon=std_location["site_lon"],
-                    ele=std_location["site_ele"],
-                    tech=tech,
-                    pnom=pnom,
-                    mod_area=module_area,
-                    eta_interpolated=eta_interpolated,
-                    u0=u0,
-                    u1=u1,
-                    pv_azimuth=std_location["pv_azimuth"],
-                    pv_tilt=std_location["pv_tilt"],
-                    a_r=ar,
-                    spec_resp_factor=spec_resp,
-                    power_matrix= power_matrix,
-                    eta_matrix=eta_matrix)
-                
-                # Results
-                cser.append(float(ret_df["cser_ER"]))
-                eta.append(float(ret_df["eta_avg_ER"]))
-    
-                # Plot ETA
-                plotting.plot_eta(df = sim_er_df,
-                                  res_folder= rf'{folder}\results\plots',
-                                  module_id = int_id,
-                                  location = std_location)
-                
-                eta_dataframes[std_location["site_name"]] = sim_er_df
-
-            results_df_cser["cser_%s"%(int_id)] = cser
-            results_df_eta["eta_%s"%(int_id)] = eta
-            
-            # Plot CSER
-            plotting.plot_cser(df = results_df_cser,
-                              res_folder= rf'{folder}\results\plots',
-                              module_id = int_id)
-            
-            # Round Robin comparision plot 
-            # (other format of plotting.plot_cser())
-            plotting.round_robin_plot(df=results_df_cser,
-                              module_id=int_id,
-                              res_folder=rf'{folder}\results')
-    
-            #Plot ETA from all the standard sites
-            plotting.eta_all_sites(df = eta_dataframes,
-                               module_id = int_id,
-                               res_folder= rf'{folder}\results\plots')
+    for module in modules:
+        int_id = module["int_id"]
+        results_df_cser["cser_%s"%(int_id)] = module["cser"]
+        results_df_eta["eta_%s"%(int_id)] = module["eta"]
+        for site_name, waterfall in module["waterfalls"].items():
+            waterfalls[(int_id, site_name)] = waterfall
+        for site_name, energy in module["first_year"].items():
+            first_year[(int_id, site_name)] = energy
+        if module["ac_table"] is not None:
+            ac_tables[int_id] = module["ac_table"]
+
+        if db_path is not None:
+            # Indexed results database, the settings that change the
+            # numbers are part of the key
+            settings = results_db.get_rating_settings(
+                eta_model=eta_model, lookup_steps=lookup_steps, tau=tau,
+                resolution=resolution, bifaciality=module["bifaciality"],
+                albedo=albedo)
+            results_db.write_module_results(
+                db_path=db_path,
+                mod_parameters=module["mod_parameters"],
+                climates=CLIMATES,
+                cser=module["cser"],
+                eta_avg=module["eta"],
+                input_hash=results_db.get_input_hash(
+                    module["file_path"], settings=settings),
+                settings=settings)
 
     # Excel file
     utils.write_results(df_1 = results_df_cser,
                         df_2 = results_df_eta,
-                        folder= rf'{folder}\results')
+                        folder= res_folder)
+
+    if losses:
+        # Loss waterfall of all the modules, built once
+        waterfall_table = aggregates.get_waterfall_table(waterfalls)
+        # Excel file with the loss waterfall
+        utils.write_waterfall(df=waterfall_table,
+                              folder=res_folder)
+        # Loss waterfall of each module in all the standard sites
+        for int_id, module_waterfall in waterfall_table.groupby(
+                level="Internal_ID", sort=False):
+            plotting.plot_loss_waterfall(
+                df=module_waterfall.droplevel("Internal_ID"),
+                module_id=int_id,
+                res_folder=plots_folder)
+
+    if dc_ac_ratios is not None:
+        # Excel file with the AC stage
+        utils.write_ac_table(df=pd.concat(ac_tables, names=["Module"]),
+                             folder=res_folder)
+
+    if degradation is not None:
+        # Lifetime energy of all the modules and climates at once
+        first_year = pd.Series(first_year)
+        first_year.index.names = ["Internal_ID", "Std_climate"]
+        factors = lifetime_energy.get_degradation_factors(
+            scenarios=degradation,
+            years=lifetime_years)
+        utils.write_lifetime(
+            annual=lifetime_energy.project_lifetime(first_year=first_year,
+                                                    factors=factors),
+            total=lifetime_energy.get_lifetime_energy(first_year=first_year,
+                                                      factors=factors),
+            folder=res_folder)
 
     # Summary plot
     plotting.plot_summary_cser(df= results_df_cser,
-                               res_folder= rf'{folder}\results')
+                               res_folder= res_folder)
     plotting.plot_summary_eta(df= results_df_eta,
-                              res_folder= rf'{folder}\results')
+                              res_folder= res_folder)
+    # Figure templates of the "binned" plot mode of this batch
+    plotting.clear_templates()
 
-    return
\ No newline at end of file
+    return
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the pre-flight memory estimate and the batch scheduler
+of the Energy Rating simulation:
+
+    - Peak memory of a batch from the number of modules, climates, time
+        steps and the outputs requested, before anything is simulated.
+    - Number of worker processes and chunk size that keep the batch within
+        a memory budget with the highest throughput: as many workers as
+        CPUs fit in the budget and chunks small enough to balance the load
+        between them.
+    - Number of items claimed at once by a worker of the work queue
+        within its memory budget.
+
+The memory of one (module, climate) simulation is mostly the climate
+DataFrame (spectral bands and climate columns) and the columns added by the
+simulation, times the number of copies alive at the peak (the copy of the
+climate, the result of each correction step and the "dropna"). The
+constants below were measured with tracemalloc and the resident memory of
+a worker with the standard climates (8760 time steps, 29 bands).
+
+@author: mriveraa
+"""
+import math
+import os
+import pandas as pd
+
+# Bytes of each value of the DataFrames (float64)
+VALUE_BYTES = 8
+# Climate columns besides the spectral bands, after "change_names_climate_df"
+CLIMATE_COLUMNS = 10
+# Columns added by the simulation (AOI, bifacial, spectral, thermal, power)
+SIM_COLUMNS = 12
+# Copies of the DataFrame alive at the peak of one simulation, with the
+# monthly, daily and hour of the day tables and with the fused kernel (the
+# reading of the climate and the arrays of the kernel)
+PEAK_COPIES = 4
+TABLES_COPIES = 5
+FUSED_COPIES = 3
+# Columns of the simulation DataFrames kept for the ETA figures and the AC
+# stage ('eta', 'Pout' and 'time_step')
+FRAME_COLUMNS = 3
+# Memory of a worker process after importing the simulation (numpy, pandas,
+# scipy, pvpltools) and extra memory of matplotlib when plotting
+PROCESS_BYTES = 200e6
+PLOT_BYTES = 60e6
+# Module characterisation (power matrix, ETA interpolation, responsivity)
+MODULE_BYTES = 12e3
+# One row of results (identifiers, CSER and ETA)
+RESULT_BYTES = 200
+# cProfile statistics of one module and climate
+PROFILE_BYTES = 1e6
+
+# Outputs that change the memory of a batch
+OUTPUTS = ["frames", "plots", "tables", "ac", "profile"]
+
+# Chunks per worker, so the workers finishing early get more work
+TASKS_PER_WORKER = 4
+
+
+def get_frame_bytes(n_steps, n_bands=29):
+    """
+    This function gives the memory of the DataFrame of one simulation
+    (climate columns and columns added by the simulation).
+
+    Parameters
+    ----------
+    n_steps : Integer
+        Number of time steps of the climate.
+    n_bands : Integer, optional
+        Number of spectral bands. The default is 29.
+
+    Returns
+    -------
+    frame_bytes : Float
+        Memory in bytes.
+    """
+    return n_steps * (n_bands + CLIMATE_COLUMNS + SIM_COLUMNS) * VALUE_BYTES
+
+
+def get_climate_size(path):
+    """
+    This function gets the number of time steps and spectral bands of a
+    climate file without reading its data.
+
+    Parameters
+    ----------
+    path : String
+        Path like. Path to a climate file with the format of the standard
+        climate files (enra_*.csv).
+
+    Returns
+    -------
+    n_steps : Integer
+        Number of time steps.
+    n_bands : Integer
+        Number of spectral bands (columns in nm).
+    """
+    columns = pd.read_csv(path, nrows=0, encoding="ISO-8859-1").columns
+    with open(path, "rb") as file:
+        n_steps = sum(1 for _ in file) - 1
+    return n_steps, sum("nm" in column for column in columns)
+
+
+def estimate_memory(n_modules, n_climates, n_steps, outputs=(), n_bands=29,
+                    workers=1, chunk_size=1, cached_climates=1, n_ratios=1,
+                    module_bytes=MODULE_BYTES, fused=False):
+    """
+    This function estimates the peak memory of a batch.
+
+    Parameters
+    ----------
+    n_modules : Integer
+        Number of modules.
+    n_climates : Integer
+        Number of climates (standard climates or sites).
+    n_steps : Integer
+        Number of time steps of each climate.
+    outputs : List, optional
+        Outputs requested, from OUTPUTS:
+            "frames": the columns of the simulation DataFrames of all the
+                climates of a module used by the ETA figures and the AC
+                stage of "simulation_er" are kept.
+            "plots": figures are drawn.
+            "tables": monthly, daily and hour of the day tables.
+            "ac": AC stage with "n_ratios" DC/AC ratios.
+            "profile": cProfile of each module and climate.
+        The default is ().
+    n_bands : Integer, optional
+        Number of spectral bands. The default is 29.
+    workers : Integer, optional
+        Number of worker processes. The default is 1.
+    chunk_size : Integer, optional
+        Climates (or tasks, please check "plan_batch") sent to a worker at
+        once. The default is 1.
+    cached_climates : Integer, optional
+        Climates kept in memory by each worker (all of them in
+        "simulation_er", one in the multi-site rating). The default is 1.
+    n_ratios : Integer, optional
+        Number of DC/AC ratios of the AC stage. The default is 1.
+    module_bytes : Float, optional
+        Memory of one module characterisation, larger with the dense ETA
+        lookup. The default is MODULE_BYTES.
+    fused : Boolean, optional
+        If True the CSER is computed with the fused kernel, without the
+        columns of the simulation. The default is False.
+
+    Returns
+    -------
+    memory : Pandas Series
+        Memory in bytes of each part of a worker ("process", "modules",
+        "climates", "simulation", "outputs" and "results"), of one worker
+        ("worker") and of the batch ("total", all the workers and the main
+        process with the results waiting; with one worker the batch runs in
+        the main process).
+    """
+    unknown = set(outputs) - set(OUTPUTS)
+    if unknown:
+        raise ValueError("Unknown output(s): %s, please choose from: %s"
+                         % (", ".join(sorted(unknown)), ", ".join(OUTPUTS)))
+    frame = get_frame_bytes(n_steps, n_bands=n_bands)
+    climate = n_steps * (n_bands + CLIMATE_COLUMNS) * VALUE_BYTES
+    if fused:
+        copies = FUSED_COPIES
+    elif "tables" in outputs:
+        copies = TABLES_COPIES
+    else:
+        copies = PEAK_COPIES
+
+    memory = pd.Series({
+        "process": PROCESS_BYTES + (PLOT_BYTES if "plots" in outputs else 0),
+        "modules": n_modules * module_bytes,
+        "climates": min(cached_climates, n_climates) * climate,
+        "simulation": copies * frame,
+        "outputs": ((n_climates * n_steps * FRAME_COLUMNS * VALUE_BYTES
+                     if "frames" in outputs else 0)
+                    + (4 * n_ratios * n_steps * VALUE_BYTES
+                       if "ac" in outputs else 0)
+                    + (PROFILE_BYTES if "profile" in outputs else 0)),
+        "results": chunk_size * n_modules * RESULT_BYTES})
+    memory["worker"] = memory.sum()
+    if workers == 1:
+        memory["total"] = memory["worker"]
+    else:
+        # Results of two chunks per worker waiting in the main process
+        memory["total"] = (workers * memory["worker"] + PROCESS_BYTES
+                           + 2 * workers * memory["results"])
+    return memory
+
+
+def plan_batch(n_modules, n_climates, n_steps, memory_budget, outputs=(),
+               n_bands=29, max_workers=None, cached_climates=1, n_ratios=1,
+               module_bytes=MODULE_BYTES, fused=False, n_tasks=None):
+    """
+    This function chooses the number of workers and the chunk size of a
+    batch within a memory budget. The batch runs with as many workers as
+    fit in the budget (up to "max_workers") and the tasks (the climates of
+    the multi-site rating) are split in about TASKS_PER_WORKER chunks per
+    worker, or smaller chunks when their results do not fit in the budget.
+
+    Parameters
+    ----------
+    n_modules, n_climates, n_steps, outputs, n_bands, cached_climates,
+    n_ratios, module_bytes, fused :
+        Please check the function "estimate_memory".
+    memory_budget : Float
+        Memory available for the batch in bytes.
+    max_workers : Integer, optional
+        Largest number of workers. The default is None (number of CPUs).
+    n_tasks : Integer, optional
+        Number of tasks split in chunks, e.g. the CalLab files of
+        "simulation_er" in run_main.py, where each worker simulates one
+        module ("n_modules" is 1) in all the climates at a time. The
+        default is None (the climates).
+
+    Returns
+    -------
+    plan : Dictionary
+        "workers", "chunk_size" and "memory" (estimate of the plan, please
+        check "estimate_memory").
+    """
+    n_tasks = n_climates if n_tasks is None else n_tasks
+    max_workers = max(1, min(max_workers or os.cpu_count(), n_tasks))
+    kwargs = {"n_modules": n_modules, "n_climates": n_climates,
+              "n_steps": n_steps, "outputs": outputs, "n_bands": n_bands,
+              "cached_climates": cached_climates, "n_ratios": n_ratios,
+              "module_bytes": module_bytes, "fused": fused}
+    for workers in range(max_workers, 0, -1):
+        chunk_size = max(1, math.ceil(n_tasks
+                                      / (workers * TASKS_PER_WORKER)))
+        # Smaller chunks when their results do not fit (many modules)
+        while True:
+            memory = estimate_memory(workers=workers, chunk_size=chunk_size,
+                                     **kwargs)
+            if memory["total"] <= memory_budget:
+                return {"workers": workers, "chunk_size": chunk_size,
+                        "memory": memory}
+            if chunk_size == 1:
+                break
+            chunk_size = math.ceil(chunk_size / 2)
+    raise ValueError("The memory budget (%.0f MB) is too small for one "
+                     "worker, at least %.0f MB are needed"
+                     % (memory_budget / 1e6, memory["total"] / 1e6))
+
+
+def get_batch_size(n_steps, memory_budget, max_batch, outputs=(), n_bands=29,
+                   module_bytes=MODULE_BYTES, fused=False):
+    """
+    This function chooses the number of items claimed at once by a worker
+    of the work queue (please check "run_worker" in work_queue.py) within
+    its memory budget. The worker keeps the modules of the items it has
+    claimed and simulates one climate at a time.
+
+    Parameters
+    ----------
+    n_steps, outputs, n_bands, module_bytes, fused :
+        Please check the function "estimate_memory".
+    memory_budget : Float
+        Memory available for the worker in bytes.
+    max_batch : Integer
+        Largest number of items claimed at once.
+
+    Returns
+    -------
+    batch : Integer
+        Number of items claimed at once.
+    """
+    batch = max(1, max_batch)
+    while True:
+        memory = estimate_memory(n_modules=batch, n_climates=1,
+                                 n_steps=n_steps, outputs=outputs,
+                                 n_bands=n_bands, module_bytes=module_bytes,
+                                 fused=fused)
+        if memory["total"] <= memory_budget:
+            return batch
+        if batch == 1:
+            raise ValueError("The memory budget (%.0f MB) is too small for "
+                             "one worker, at least %.0f MB are needed"
+                             % (memory_budget / 1e6, memory["total"] / 1e6))
+        batch = math.ceil(batch / 2)
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the two-tier screening of large catalogues of modules,
+to find the best modules of a climate (e.g. the top 20 out of 50,000)
+without the full simulation of all of them:
+
+    - Surrogate: closed-form estimate of the CSER of each module from the
+        quantities of its Power Rating Matrix (efficiency at STC, power
+        temperature coefficient "alpha" from a linear regression as the
+        top-level "get_eta_interpolation", and the relative efficiency at
+        25 °C over irradiance) and statistics of the climate computed once
+        (irradiation by irradiance class with its mean ambient temperature
+        and wind speed, direct irradiation by angle of incidence and the
+        mean spectrum weighted by the irradiation).
+    - Bounds: the exact CSER of each module is taken to be within a
+        relative margin of its surrogate (after a bias), both found with
+        "calibrate_margin" on a sample of modules.
+    - Contenders: a module can only be in the top "n_top" if its upper
+        bound reaches the "n_top"-th largest lower bound (cutoff). The
+        modules without the measurements of the surrogate in their Power
+        Rating Matrix (1000 W/m² at 25 °C and another temperature) have no
+        bounds and are always contenders. Only the contenders are simulated
+        (please check "rate_site" in multi_site.py) and ranked by their
+        exact CSER.
+
+When the exact CSER of every module is within the margin, the ranking is
+the same as the ranking of the full simulation of all the modules. The
+contenders are checked against their bounds, a warning is given when one of
+them is out (then the margin is too small).
+
+@author: mriveraa
+"""
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.stats import linregress
+# Importing the IEC91853 standard's code
+import pvpltools_python.pvpltools.iec61853 as std
+# Importing the Steps Function
+import sim_steps
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+# Importing utils
+import utils
+# Importing the spectral engine
+import spectral_bands
+# Importing the daylight-only representation
+import daylight
+# Importing the fused kernel
+import fused_kernel
+
+# Width of the irradiance classes of the climate statistics (W/m²) and of
+# the angle of incidence classes (°)
+G_WIDTH = 100.0
+AOI_WIDTH = 1.0
+# Irradiances of the relative efficiency curve at 25 °C of the modules
+G_NODES = np.arange(0.0, 1501.0, 50.0)
+
+# Relative margin of the bounds when it is not calibrated
+MARGIN = 0.01
+
+
+def get_climate_statistics(climate_data):
+    """
+    This function calculates the statistics of a climate used by the
+    surrogate, once for all the modules.
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        Climate data with the column names for the simulation.
+
+    Returns
+    -------
+    stats : Dictionary
+        "classes" (DataFrame with one row per irradiance class: "share" of
+        the irradiation in POA, irradiation-weighted mean "g", "t_amb" and
+        "wind"), "direct" and "diffuse" (share of the direct and diffuse
+        irradiation in POA), "aoi" and "aoi_share" (angles of incidence and
+        share of the direct irradiation), "spectrum" (mean spectral
+        irradiance of the bands, weighted by the irradiation and relative to
+        it) and "layout" (spectral bands).
+    """
+    time_steps = utils.get_time_steps(climate_data.index)
+    hours = (np.ones(len(climate_data)) if time_steps is None
+             else time_steps.values)
+    mask = daylight.get_daylight_mask(climate_data)
+    climate_df = climate_data[mask].fillna(0)
+    hours = hours[mask]
+    g_tlt = climate_df["G_tlt"].values
+    irradiation = g_tlt * hours
+    total = irradiation.sum()
+    if total <= 0:
+        raise ValueError("The climate has no irradiation in POA")
+
+    # Irradiance classes
+    codes = np.floor(g_tlt / G_WIDTH).astype(int)
+    classes = pd.DataFrame({"code": codes, "irradiation": irradiation,
+                            "g": g_tlt * irradiation,
+                            "t_amb": climate_df["T_amb"].values * irradiation,
+                            "wind": climate_df["wind"].values * irradiation})
+    classes = classes[classes["irradiation"] > 0].groupby("code").sum()
+    for column in ["g", "t_amb", "wind"]:
+        classes[column] = classes[column] / classes["irradiation"]
+    classes["share"] = classes["irradiation"] / total
+    classes = classes[["share", "g", "t_amb", "wind"]].reset_index(drop=True)
+
+    # Direct irradiation by angle of incidence
+    direct = climate_df["I_tlt"].values * hours
+    aoi = climate_df["IncidentAngle"].values
+    aoi_codes = np.floor(np.clip(aoi, 0, 180) / AOI_WIDTH).astype(int)
+    aoi_direct = np.bincount(aoi_codes, weights=direct)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        aoi_mean = np.bincount(aoi_codes, weights=direct * aoi) / aoi_direct
+    used = aoi_direct > 0
+
+    # Mean spectrum, each time step weighted by its irradiation over the
+    # total of its bands (as the spectral factor of "spec_correction")
+    layout = spectral_bands.get_climate_bands(climate_df.columns)
+    bands = climate_df[list(layout[0])].values
+    band_sum = bands.sum(axis=1)
+    weights = np.divide(irradiation, band_sum, out=np.zeros(len(band_sum)),
+                        where=band_sum != 0)
+    return {"classes": classes,
+            "direct": direct.sum() / total,
+            "diffuse": (climate_df["D_tlt"].values * hours).sum() / total,
+            "aoi": aoi_mean[used],
+            "aoi_share": aoi_direct[used] / max(direct.sum(), 1e-300),
+            "spectrum": weights @ bands / total,
+            "layout": layout}
+
+
+def get_temperature_coefficient(power_matrix):
+    """
+    This function calculates the power temperature coefficient of a module
+    from the linear regression of the power over the temperature of the
+    measurements at 1000 W/m² of its Power Rating Matrix, relative to the
+    power at STC.
+
+    Parameters
+    ----------
+    power_matrix : Pandas DataFrame
+        Power Rating Matrix with "gmean", "temp" and "pmpp".
+
+    Returns
+    -------
+    alpha : Float
+        Power temperature coefficient in 1/°C.
+    """
+    g_round = power_matrix["gmean"].round(decimals=-2)
+    t_round = 5 * (power_matrix["temp"].round() / 5).round()
+    stc = power_matrix[(g_round == 1000) & (t_round == 25)]
+    measurements = power_matrix[g_round == 1000]
+    if stc.empty or measurements["temp"].nunique() < 2:
+        raise ValueError("The Power Rating Matrix needs measurements at "
+                         "1000 W/m² and at least two temperatures, with "
+                         "one at 25 °C")
+    slope = linregress(measurements["temp"], measurements["pmpp"])[0]
+    return float(slope / stc["pmpp"].values[0])
+
+
+def get_surrogate_parameters(module):
+    """
+    This function gets the quantities of the Power Rating Matrix of a module
+    used by the surrogate, once for all the climates.
+
+    Parameters
+    ----------
+    module : Dictionary
+        Module characterisation, please check "get_module_characterisation"
+        in multi_site.py.
+
+    Returns
+    -------
+    parameters : Dictionary
+        "alpha" (please check "get_temperature_coefficient"), "eta_stc"
+        (efficiency at STC), "stc_ratio" (efficiency at STC times the area
+        over the nominal power, 1 when the STC measurement is at exactly
+        1000 W/m²) and "low_light" (relative efficiency at 25 °C at the
+        irradiances of G_NODES).
+    """
+    power_matrix = module["power_matrix"]
+    # Also checks the measurement at STC
+    alpha = get_temperature_coefficient(power_matrix)
+    g_round = power_matrix["gmean"].round(decimals=-2)
+    t_round = 5 * (power_matrix["temp"].round() / 5).round()
+    stc = power_matrix[(g_round == 1000) & (t_round == 25)].iloc[0]
+    eta_stc = stc["pmpp"] / module["module_area"] / stc["gmean"]
+    low_light = np.asarray(module["eta_interpolated"](
+        G_NODES, np.full(len(G_NODES), 25.0)), dtype=float)
+    return {"alpha": alpha,
+            "eta_stc": float(eta_stc),
+            "stc_ratio": float(eta_stc * module["module_area"]
+                               / module["pnom"]),
+            "low_light": np.nan_to_num(low_light)}
+
+
+def get_surrogate_cser(stats, module, parameters=None, pv_tilt=20):
+    """
+    This function estimates the CSER of a module in a climate in closed
+    form: AOI and spectral factors of the irradiation, and the relative
+    efficiency at the mean irradiance of each irradiance class corrected to
+    its steady-state module temperature with the temperature coefficient.
+    The rear side of the bifacial modules is not in the estimate, their
+    gain is taken by the bias and the margin of "calibrate_margin" when the
+    calibration modules are bifacial too.
+
+    Parameters
+    ----------
+    stats : Dictionary
+        Climate statistics, please check "get_climate_statistics".
+    module : Dictionary
+        Module characterisation, please check "get_module_characterisation"
+        in multi_site.py.
+    parameters : Dictionary, optional
+        Please check "get_surrogate_parameters". The default is None
+        (calculated).
+    pv_tilt : Float, optional
+        PV tilt angle. The default is 20.
+
+    Returns
+    -------
+    cser : Float
+        Estimated Climate Specific Energy Rating.
+    """
+    if parameters is None:
+        parameters = get_surrogate_parameters(module)
+    a_r = module["a_r"]
+    # AOI factor of the irradiation
+    b_mod = np.asarray(std.martin_ruiz(aoi=stats["aoi"], a_r=a_r))
+    d_mod_sky, _ = std.martin_ruiz_diffuse(surface_tilt=pv_tilt, a_r=a_r,
+                                           c1=0.4244, c2=None)
+    aoi_factor = (stats["direct"] * (stats["aoi_share"] @ b_mod)
+                  + stats["diffuse"] * float(d_mod_sky))
+    # Spectral factor of the irradiation
+    fsr = np.asarray(energy_rating.get_banded_responsivity(
+        module["spec_resp"], bands=stats["layout"]), dtype=float)
+    uf_am15 = float(spectral_bands.get_banded_reference(stats["layout"])
+                    @ fsr / spectral_bands.AM15G_TOTAL)
+    spec_factor = float(stats["spectrum"] @ fsr) / uf_am15
+
+    classes = stats["classes"]
+    g_aoi = classes["g"].values * aoi_factor
+    t_mod = (classes["t_amb"].values
+             + g_aoi / (module["u0"] + module["u1"] * classes["wind"].values))
+    eta_rel = (np.interp(g_aoi * spec_factor, G_NODES,
+                         parameters["low_light"])
+               * (1 + parameters["alpha"] * (t_mod - 25)))
+    return float(parameters["stc_ratio"] * aoi_factor * spec_factor
+                 * (classes["share"].values @ eta_rel))
+
+
+def _rate_exact(climate_data, module, pv_tilt, tau, fused, shared):
+    # Full simulation of a module, as "rate_site" in multi_site.py
+    kwargs = {"climate_data": climate_data,
+              "eta_interpolated": module["eta_interpolated"],
+              "pnom": module["pnom"],
+              "mod_area": module["module_area"],
+              "u0": module["u0"],
+              "u1": module["u1"],
+              "a_r": module["a_r"],
+              "power_matrix": module["power_matrix"],
+              "pv_tilt": pv_tilt,
+              "spec_resp_factor": module["spec_resp"],
+              "tau": tau,
+              "bifaciality": module["bifaciality"],
+              "albedo": module["albedo"]}
+    if fused:
+        if "inputs" not in shared:
+            shared["inputs"] = fused_kernel.get_kernel_inputs(climate_data,
+                                                              tau=tau,
+                                                              rear=True)
+        return fused_kernel.ersim_dc_fused(inputs=shared["inputs"], **kwargs)
+    if "daylight" not in shared:
+        shared["daylight"] = daylight.compact_climate(climate_data)
+    cser, eta_avg, _ = sim_steps.ersim_dc_daylight(
+        daylight=shared["daylight"], **kwargs)
+    return cser, eta_avg
+
+
+def _get_parameters(modules, parameters=None):
+    # Surrogate parameters of each module, None for the modules without the
+    # measurements of the surrogate in their Power Rating Matrix (with their
+    # error in "missing")
+    if parameters is None:
+        parameters = [None] * len(modules)
+    parameters = list(parameters)
+    missing = []
+    for i, module in enumerate(modules):
+        if parameters[i] is None:
+            try:
+                parameters[i] = get_surrogate_parameters(module)
+            except ValueError as error:
+                missing.append({"Internal_ID": module["int_id"],
+                                "error": str(error)})
+    return parameters, pd.DataFrame(missing, columns=["Internal_ID",
+                                                      "error"])
+
+
+def calibrate_margin(climate_data, modules, stats=None, pv_tilt=20,
+                     tau=None, fused=False, safety=1.5):
+    """
+    This function measures the error of the surrogate against the full
+    simulation for a sample of modules (e.g. a few hundred modules drawn at
+    random from the catalogue) and gives the bias and the margin of the
+    bounds of "screen".
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        Climate data with the column names for the simulation.
+    modules : List
+        Module characterisations of the sample, please check
+        "get_module_characterisation" in multi_site.py.
+    stats : Dictionary, optional
+        Please check "get_climate_statistics". The default is None
+        (calculated).
+    pv_tilt, tau, fused : optional
+        Please check "screen".
+    safety : Float, optional
+        Factor on the largest error of the sample. The default is 1.5.
+
+    Returns
+    -------
+    calibration : Dictionary
+        "bias" (median relative error of the surrogate), "margin" (largest
+        relative error around the bias times "safety"), "errors"
+        (DataFrame with the "cser", "cser_surrogate" and "error" of each
+        module) and "skipped" (DataFrame with the "Internal_ID" and "error"
+        of the modules left out, without the measurements of the surrogate
+        in their Power Rating Matrix).
+    """
+    if stats is None:
+        stats = get_climate_statistics(climate_data)
+    parameters, skipped = _get_parameters(modules)
+    if not skipped.empty:
+        warnings.warn("%d module(s) without the measurements of the "
+                      "surrogate are left out of the calibration: %s"
+                      % (len(skipped), ", ".join(
+                          skipped["Internal_ID"].astype(str))))
+    shared = {}
+    rows = []
+    for module, module_parameters in zip(modules, parameters):
+        if module_parameters is None:
+            continue
+        cser, _ = _rate_exact(climate_data, module, pv_tilt, tau, fused,
+                              shared)
+        surrogate = get_surrogate_cser(stats, module,
+                                       parameters=module_parameters,
+                                       pv_tilt=pv_tilt)
+        rows.append({"Internal_ID": module["int_id"], "cser": cser,
+                     "cser_surrogate": surrogate,
+                     "error": cser / surrogate - 1})
+    if not rows:
+        raise ValueError("None of the modules has the measurements of the "
+                         "surrogate")
+    errors = pd.DataFrame(rows)
+    bias = float(errors["error"].median())
+    margin = float((errors["error"] - bias).abs().max() * safety)
+    return {"bias": bias, "margin": margin, "errors": errors,
+            "skipped": skipped}
+
+
+def screen(climate_data, modules, n_top=20, margin=MARGIN, bias=0.0,
+           pv_tilt=20, tau=None, fused=False, stats=None, parameters=None):
+    """
+    This function finds the "n_top" modules with the largest CSER of a
+    climate, with the full simulation of the contenders only.
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        Climate data with the column names for the simulation.
+    modules : List
+        Module characterisations, please check "get_module_characterisation"
+        in multi_site.py.
+    n_top : Integer, optional
+        Number of modules of the ranking. The default is 20.
+    margin : Float, optional
+        Relative margin of the bounds of the exact CSER around the
+        surrogate, please check "calibrate_margin". The default is MARGIN.
+    bias : Float, optional
+        Relative bias of the surrogate, please check "calibrate_margin".
+        The default is 0.0.
+    pv_tilt : Float, optional
+        PV tilt angle. The default is 20.
+    tau : Float, optional
+        Thermal time constant of the modules in seconds for the full
+        simulation. The default is None (steady-state temperature).
+    fused : Boolean, optional
+        If True the full simulation is done with the fused kernel, please
+        check fused_kernel.py. The default is False.
+    stats : Dictionary, optional
+        Please check "get_climate_statistics". The default is None
+        (calculated).
+    parameters : List, optional
+        Surrogate parameters of each module (e.g. shared by several
+        climates), please check "get_surrogate_parameters". The default is
+        None (calculated).
+
+    Returns
+    -------
+    screening : Dictionary
+        "ranking" (DataFrame with the "Internal_ID", "cser", "eta_avg" and
+        "cser_surrogate" of the top modules, sorted), "surrogate" (DataFrame
+        with the "cser_surrogate", "lower" and "upper" bounds and
+        "contender" of all the modules, NaN bounds for the modules without
+        the measurements of the surrogate), "cutoff", "n_simulated",
+        "violations" (number of contenders with the exact CSER out of their
+        bounds) and "unbounded" (DataFrame with the "Internal_ID" and
+        "error" of the modules without the measurements of the surrogate in
+        their Power Rating Matrix, always simulated).
+    """
+    if n_top < 1:
+        raise ValueError("n_top must be at least 1, got %s" % n_top)
+    if margin < 0:
+        raise ValueError("The margin must be positive, got %s" % margin)
+    if stats is None:
+        stats = get_climate_statistics(climate_data)
+    parameters, unbounded = _get_parameters(modules, parameters=parameters)
+
+    surrogate = pd.DataFrame(
+        {"Internal_ID": [module["int_id"] for module in modules],
+         "cser_surrogate": [np.nan if p is None else
+                            get_surrogate_cser(stats, module, parameters=p,
+                                               pv_tilt=pv_tilt)
+                            for module, p in zip(modules, parameters)]})
+    centre = surrogate["cser_surrogate"] * (1 + bias)
+    surrogate["lower"] = centre * (1 - margin)
+    surrogate["upper"] = centre * (1 + margin)
+    # The modules without bounds are always contenders, the cutoff is the
+    # "n_top"-th largest lower bound of the others
+    lower = np.sort(surrogate["lower"].dropna().values)[::-1]
+    cutoff = float(lower[n_top - 1]) if len(lower) >= n_top else -np.inf
+    surrogate["contender"] = ((surrogate["upper"] >= cutoff)
+                              | surrogate["cser_surrogate"].isna())
+
+    shared = {}
+    rows = []
+    for i in np.flatnonzero(surrogate["contender"].values):
+        cser, eta_avg = _rate_exact(climate_data, modules[i], pv_tilt, tau,
+                                    fused, shared)
+        rows.append({"Internal_ID": modules[i]["int_id"], "cser": cser,
+                     "eta_avg": eta_avg,
+                     "cser_surrogate": surrogate["cser_surrogate"].values[i],
+                     "lower": surrogate["lower"].values[i],
+                     "upper": surrogate["upper"].values[i]})
+    contenders = pd.DataFrame(rows)
+    out = ((contenders["cser"] < contenders["lower"])
+           | (contenders["cser"] > contenders["upper"]))
+    if out.any():
+        warnings.warn("The CSER of %d contender(s) is out of the margin of "
+                      "the surrogate (%.2f%%), the ranking may differ from "
+                      "the full simulation. Please calibrate the margin."
+                      % (out.sum(), margin * 100))
+    ranking = (contenders.sort_values("cser", ascending=False)
+               .head(n_top)
+               .drop(columns=["lower", "upper"])
+               .reset_index(drop=True))
+    ranking.index = ranking.index + 1
+    ranking.index.name = "rank"
+    return {"ranking": ranking, "surrogate": surrogate, "cutoff": cutoff,
+            "n_simulated": len(contenders), "violations": int(out.sum()),
+            "unbounded": unbounded}
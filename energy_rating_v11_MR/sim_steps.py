@@ -9,17 +9,22 @@ This file contains the simulation steps for the Energy rating standard.
 import energy_rating_functions as energy_rating
 # Importing utils
 import utils
+# Importing the aggregates
+import aggregates
+# Importing the daylight-only representation
+import daylight as daylight_steps
 
 
 def ersim_dc_steps(climate_data, eta_interpolated, pnom, mod_area, u0, u1, a_r,
-                   power_matrix, eta_matrix, pv_tilt=20, spec_resp_factor=1.0):
+                   power_matrix, eta_matrix, pv_tilt=20, spec_resp_factor=1.0,
+                   tau=None, bifaciality=None, albedo=0.2):
     """
     This function has the steps for Energy Rating.
 
     Parameters
     ----------
     climate_data : Pandas DataFrame
-        Climate data.
+        Climate data. It is not changed.
     eta_interpolated: Object.
         This object gets the ETA if a irradiance and temperature are given.
         Please check the function "get_eta_interpolation".
@@ -36,7 +41,8 @@ def ersim_dc_steps(climate_data, eta_interpolated, pnom, mod_area, u0, u1, a_r,
     a_r : Float, optional
         Angular response factor. The default is 0.16.
     power_matrix : Pandas DataFrame
-        Power Matrix measured by Callab containing also the calcualted 'eta'
+        Power Matrix measured by Callab containing also the calcualted 'eta',
+        please check "prepare_power_matrix" in energy_rating_functions.py.
     eta_matrix: Pandas DataFrame
         Power Matrix with ETA values as pivot, irradiances as index and
         temperatures as columns.
@@ -44,6 +50,16 @@ def ersim_dc_steps(climate_data, eta_interpolated, pnom, mod_area, u0, u1, a_r,
         PV tilt angle. The default is 20.
     spec_resp_factor : float, optional
         Spectral response from the module. The default is 1.0.
+    tau : Float, optional
+        Thermal time constant of the module in seconds for the transient
+        module temperature. The default is None (steady-state temperature).
+    bifaciality : Float, optional
+        Bifaciality factor of the module. When given, the rear side
+        irradiance is added to the AOI corrected irradiance, please check
+        the function "bifacial_correction". The default is None (monofacial).
+    albedo : Float, optional
+        Reflectance of the ground for the bifacial modules. The default is
+        0.2.
 
     Returns
     -------
@@ -54,14 +70,130 @@ def ersim_dc_steps(climate_data, eta_interpolated, pnom, mod_area, u0, u1, a_r,
     climate_data : Pandas DataFrame
         DataFrame from the standard climate file including the columns
         calculated from the simulation: 'ghor', 'D_tlt', 'b_aoi', 'g_aoi',
-        'spectral_modifier', 'g_spec', 'T_mod', 'eta_rel', 'eta' & 'Pout'.
+        'spectral_modifier', 'g_spec', 'T_mod', 'eta_rel', 'eta' & 'Pout'
+        (and 'time_step' when the data are not hourly).
 
     """
+    # AOI, spectral and temperature corrections and module power
+    climate_data = get_dc_power(
+        climate_data=climate_data,
+        eta_interpolated=eta_interpolated,
+        mod_area=mod_area,
+        u0=u0, u1=u1, a_r=a_r,
+        power_matrix=power_matrix,
+        pv_tilt=pv_tilt,
+        spec_resp_factor=spec_resp_factor,
+        tau=tau,
+        bifaciality=bifaciality,
+        albedo=albedo)
+
+    # Calculating Climate Specific Energy Rating (CSER)
+    cser, eta_avg, climate_data = get_results(climate_data=climate_data,
+                                              pnom=pnom,
+                                              mod_area=mod_area)
+
+    return cser, eta_avg, climate_data
+
+
+
+def ersim_dc_tables(climate_data, eta_interpolated, pnom, mod_area, u0, u1,
+                    a_r, power_matrix, pv_tilt=20, spec_resp_factor=1.0,
+                    tau=None, groups=None, bifaciality=None, albedo=0.2,
+                    full_output=False):
+    """
+    This function has the steps for Energy Rating, like "ersim_dc_steps",
+    but instead of the hourly DataFrame it returns compact tables with the
+    monthly and daily energy and the hour of the day x month loss breakdown.
+    Please check the function "get_energy_tables" in aggregates.py.
+
+    Parameters
+    ----------
+    climate_data, eta_interpolated, pnom, mod_area, u0, u1, a_r, power_matrix,
+    pv_tilt, spec_resp_factor, tau, bifaciality, albedo :
+        Please check the function "ersim_dc_steps".
+    groups : Dictionary, optional
+        Group indices of the time steps of the climate, e.g. from
+        "get_climate_groups" in climate_store.py. When None they are computed
+        from the index of "climate_data". The default is None.
+    full_output : Boolean, optional
+        If True, the DataFrame of the simulation (as in "ersim_dc_steps") is
+        also returned. The default is False.
+
+    Returns
+    -------
+    cser : Float
+        Climate Specific Energy Rating.
+    eta_avg : Float
+        Average ETA.
+    tables : Dictionary
+        "monthly", "daily" and "hour_month" DataFrames and "waterfall"
+        Series.
+    climate_data : Pandas DataFrame
+        Only when "full_output" is True. DataFrame from the standard climate
+        file including the columns calculated from the simulation.
+    """
+    # AOI, spectral and temperature corrections and module power
+    climate_data = get_dc_power(
+        climate_data=climate_data,
+        eta_interpolated=eta_interpolated,
+        mod_area=mod_area,
+        u0=u0, u1=u1, a_r=a_r,
+        power_matrix=power_matrix,
+        pv_tilt=pv_tilt,
+        spec_resp_factor=spec_resp_factor,
+        tau=tau,
+        bifaciality=bifaciality,
+        albedo=albedo)
+
+    # Monthly, daily and hour of the day tables
+    tables = aggregates.get_energy_tables(
+        climate_data=climate_data,
+        eta_interpolated=eta_interpolated,
+        power_matrix=power_matrix,
+        module_area=mod_area,
+        pnom=pnom,
+        groups=groups)
+
+    # Calculating Climate Specific Energy Rating (CSER)
+    cser, eta_avg, climate_data = get_results(climate_data=climate_data,
+                                              pnom=pnom,
+                                              mod_area=mod_area)
+
+    if full_output:
+        return cser, eta_avg, tables, climate_data
+    return cser, eta_avg, tables
+
+
+def get_dc_power(climate_data, eta_interpolated, mod_area, u0, u1, a_r,
+                 power_matrix, pv_tilt=20, spec_resp_factor=1.0, tau=None,
+                 bifaciality=None, albedo=0.2):
+    """
+    This function runs the correction steps of the Energy Rating (AOI,
+    spectral and module temperature) and calculates the instantaneous
+    module power. Please check the function "ersim_dc_steps" for the
+    parameters.
+
+    Returns
+    -------
+    climate_data : Pandas DataFrame
+        DataFrame from the standard climate file including the columns
+        calculated from the simulation, the time steps with NaN values are
+        kept. The given climate data is not changed.
+    """
     # AOI correction (Martin & Ruiz correction)
     climate_data = energy_rating.aoi_correction(
         climate_df=climate_data,
         a_r=a_r,
         pv_tilt=pv_tilt)
+
+    if bifaciality is not None:
+        # Ground-reflected and rear side irradiance
+        climate_data = energy_rating.bifacial_correction(
+            climate_df=climate_data,
+            a_r=a_r,
+            albedo=albedo,
+            bifaciality=bifaciality,
+            pv_tilt=pv_tilt)
     
     #Spectral correction
     climate_data = energy_rating.spec_correction(
@@ -71,7 +203,7 @@ def ersim_dc_steps(climate_data, eta_interpolated, pnom, mod_area, u0, u1, a_r,
     # Module Temperature
     climate_data = energy_rating.temp_correction(
         climate_df=climate_data,
-        u0=u0, u1=u1)
+        u0=u0, u1=u1, tau=tau)
 
     # Instantaneous Module power
     climate_data = energy_rating.module_power_er(
@@ -80,12 +212,125 @@ def ersim_dc_steps(climate_data, eta_interpolated, pnom, mod_area, u0, u1, a_r,
         power_matrix=power_matrix,
         module_area = mod_area)
 
-    # Calculating Climate Specific Energy Rating (CSER)
+    # Duration of the time steps of sub-hourly or irregular data
+    time_steps = utils.get_time_steps(climate_data.index)
+    if time_steps is not None:
+        climate_data["time_step"] = time_steps
+
+    return climate_data
+
+
+def ersim_dc_daylight(climate_data, eta_interpolated, pnom, mod_area, u0, u1,
+                      a_r, power_matrix, pv_tilt=20, spec_resp_factor=1.0,
+                      tau=None, bifaciality=None, albedo=0.2, daylight=None,
+                      full_output=False):
+    """
+    This function has the steps for Energy Rating like "ersim_dc_steps", but
+    the correction steps and the ETA interpolation are run only on the
+    daylight time steps, please check daylight.py. "climate_data" is not
+    changed.
+
+    Parameters
+    ----------
+    climate_data, eta_interpolated, pnom, mod_area, u0, u1, a_r, power_matrix,
+    pv_tilt, spec_resp_factor, tau, bifaciality, albedo :
+        Please check the function "ersim_dc_steps".
+    daylight : Dictionary, optional
+        Daylight-only representation of "climate_data" from
+        "compact_climate" in daylight.py, to reuse it between modules. The
+        default is None.
+    full_output : Boolean, optional
+        If True the DataFrame has all the time steps, as "ersim_dc_steps"
+        gives it, otherwise only the daylight time steps. The default is
+        False.
+
+    Returns
+    -------
+    cser : Float
+        Climate Specific Energy Rating.
+    eta_avg : Float
+        Average ETA.
+    climate_data : Pandas DataFrame
+        DataFrame with the columns of the simulation, without the time
+        steps with NaN values.
+    """
+    if daylight is None:
+        daylight = daylight_steps.compact_climate(climate_data)
+    sim_df = daylight["climate_data"]
+
+    # AOI correction (Martin & Ruiz correction)
+    sim_df = energy_rating.aoi_correction(climate_df=sim_df, a_r=a_r,
+                                          pv_tilt=pv_tilt)
+    if bifaciality is not None:
+        # Ground-reflected and rear side irradiance
+        sim_df = energy_rating.bifacial_correction(
+            climate_df=sim_df, a_r=a_r, albedo=albedo,
+            bifaciality=bifaciality, pv_tilt=pv_tilt)
+
+    #Spectral correction
+    sim_df = energy_rating.spec_correction(climate_df=sim_df,
+                                           spec_resp_factor=spec_resp_factor)
+
+    # Module Temperature (through the night with thermal inertia)
+    sim_df, temp_mod = daylight_steps.temp_correction(
+        daylight=daylight, climate_df=sim_df, u0=u0, u1=u1, tau=tau)
+
+    # Instantaneous Module power
+    sim_df = energy_rating.module_power_er(climate_df=sim_df,
+                                           eta_interpolated=eta_interpolated,
+                                           power_matrix=power_matrix,
+                                           module_area=mod_area)
+
+    # Duration of the time steps (from all the time steps)
+    if daylight["time_steps"] is not None:
+        sim_df["time_step"] = daylight["time_steps"].values[daylight["mask"]]
+
+    if full_output:
+        sim_df = daylight_steps.scatter(daylight=daylight, climate_df=sim_df,
+                                        climate_data=climate_data,
+                                        temp_mod=temp_mod,
+                                        eta_interpolated=eta_interpolated,
+                                        power_matrix=power_matrix,
+                                        module_area=mod_area)
+    return get_results(climate_data=sim_df, pnom=pnom, mod_area=mod_area)
+
+
+def get_results(climate_data, pnom, mod_area):
+    """
+    This function calculates the CSER and the average ETA from the
+    instantaneous module power, with the duration of the time steps when
+    the climate data are not hourly. The time steps with NaN values are left
+    out, please check the function "get_excluded_share" in utils.py.
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        DataFrame from "get_dc_power".
+    pnom : Float
+        Module's nominal power in kW.
+    mod_area : Float
+        Module's area in m².
+
+    Returns
+    -------
+    cser : Float
+        Climate Specific Energy Rating.
+    eta_avg : Float
+        Average ETA.
+    climate_data : Pandas DataFrame
+        "climate_data" without the time steps with NaN values.
+    """
+    excluded_share = utils.get_excluded_share(climate_data)
     # Droping NaN values
     climate_data = climate_data.dropna()
+    climate_data.attrs["excluded_share"] = excluded_share
+    time_steps = climate_data.get("time_step")
     cser = utils.get_cser(power_series=climate_data["Pout"],
                           gpoa_series=climate_data["G_tlt"],
-                          pnom=pnom)
-    eta_avg = ((climate_data.Pout / mod_area ) / climate_data.G_tlt).mean()
-
+                          pnom=pnom,
+                          time_steps=time_steps)
+    eta_avg = utils.get_eta_avg(power_series=climate_data["Pout"],
+                                gpoa_series=climate_data["G_tlt"],
+                                mod_area=mod_area,
+                                time_steps=time_steps)
     return cser, eta_avg, climate_data
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the spectral engine of the Energy Rating simulation, for
+any layout of spectral bands (the 29 bands of IEC61853-4 [1] or finer
+ones):
+
+    - Band layout read from the column names of the climate data, e.g.
+        "327.8-362.5nm" (lower and upper edge of the band).
+    - Sparse integration matrix from a sampled spectrum (spectral
+        responsivity or spectral irradiance) to the bands, built once per
+        band layout and wavelengths and then cached.
+    - Banded spectral responsivity, banded AM1.5G reference and spectral
+        factor (Equation 6 of IEC61853-3 [2]) as sparse and matrix products.
+    - Fine spectral climate data (one column per wavelength, e.g. "350nm",
+        in W/m²/nm) integrated into bands.
+
+The integration matrix gives the integral (or the mean) of the linear
+interpolation of the samples over each band, only where there are samples,
+the same as "convert_to_banded" in iec61853.py for the 29 standard bands.
+
+    References
+    ----------
+    .. [1] Energy Rating Standard IEC61853-4.
+    .. [2] Energy Rating Standard IEC61853-3.
+
+@author: mriveraa
+"""
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from scipy import sparse
+# Importing the IEC91853 standard's code
+import pvpltools_python.pvpltools.iec61853 as std
+
+# Band columns ("<lower>-<upper>nm", with optional text before) and
+# wavelength columns ("<wavelength>nm") of the climate data
+_BAND_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(?:nm)?\s*-\s*(\d+(?:\.\d+)?)"
+                           r"\s*nm\s*$")
+_WAVELENGTH_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*nm\s*$")
+
+# Integral of the reference spectrum AM1.5G used in the spectral factor
+AM15G_TOTAL = 1000.
+# Upper edge of the AM1.5G value of the last standard band (3991-4000nm)
+AM15G_LIMIT = 4000.
+
+
+@lru_cache(maxsize=None)
+def _parse_bands(columns):
+    names, lower, upper = [], [], []
+    for column in columns:
+        match = _BAND_PATTERN.search(str(column))
+        if match:
+            names.append(column)
+            lower.append(float(match.group(1)))
+            upper.append(float(match.group(2)))
+    if not names:
+        raise ValueError("No spectral band columns (e.g. '327.8-362.5nm') "
+                         "found in the climate data")
+    return tuple(names), tuple(lower), tuple(upper)
+
+
+def get_climate_bands(columns):
+    """
+    This function reads the band layout from the column names of the
+    climate data (in the order of the columns).
+
+    Parameters
+    ----------
+    columns : List or Pandas Index
+        Column names of the climate data.
+
+    Returns
+    -------
+    bands : Tuple
+        (columns, lower edges, upper edges) of the spectral bands, as
+        tuples, so they can be used as key of the caches.
+    """
+    return _parse_bands(tuple(columns))
+
+
+# 29 bands of the standard climate files
+IEC_BANDS = (tuple("%s-%snm" % edges for edges in
+                   zip(std.SPECTRAL_BAND_EDGES[:-1],
+                       std.SPECTRAL_BAND_EDGES[1:])),
+             tuple(float(edge) for edge in std.SPECTRAL_BAND_EDGES[:-1]),
+             tuple(float(edge) for edge in std.SPECTRAL_BAND_EDGES[1:]))
+
+
+@lru_cache(maxsize=256)
+def _get_operator(lower, upper, wavelengths, mean):
+    wavelengths = np.asarray(wavelengths)
+    rows, cols, weights = [], [], []
+    for band, (left, right) in enumerate(zip(lower, upper)):
+        # Segments between samples that overlap the band
+        first = max(np.searchsorted(wavelengths, left, side="right") - 1, 0)
+        last = min(np.searchsorted(wavelengths, right, side="left"),
+                   len(wavelengths) - 1)
+        i = np.arange(first, last)
+        w_0, w_1 = wavelengths[i], wavelengths[i + 1]
+        a = np.maximum(w_0, left)
+        c = np.minimum(w_1, right)
+        keep = c > a
+        i, w_0, w_1, a, c = i[keep], w_0[keep], w_1[keep], a[keep], c[keep]
+        # Integral of the linear interpolation over [a, c]: weights of the
+        # samples at both ends of the segment
+        t_mid = ((a + c) / 2 - w_0) / (w_1 - w_0)
+        length = (c - a) / ((right - left) if mean else 1.0)
+        rows.append(np.full(2 * len(i), band))
+        cols.append(np.r_[i, i + 1])
+        weights.append(np.r_[length * (1 - t_mid), length * t_mid])
+    operator = sparse.csr_matrix(
+        (np.concatenate(weights), (np.concatenate(rows),
+                                   np.concatenate(cols))),
+        shape=(len(lower), len(wavelengths)))
+    operator.sum_duplicates()
+    return operator
+
+
+def get_band_operator(bands, wavelengths, mean=True):
+    """
+    This function gives the sparse integration matrix from the samples of a
+    spectrum at "wavelengths" to the bands. It is built once for each band
+    layout and wavelengths.
+
+    Parameters
+    ----------
+    bands : Tuple
+        Band layout, please check "get_climate_bands".
+    wavelengths : array_like
+        Wavelengths of the samples in nm, sorted and without repetitions.
+    mean : Boolean, optional
+        If True the matrix gives the mean of the spectrum in each band
+        (e.g. spectral responsivity), if False its integral (e.g. spectral
+        irradiance in W/m²/nm to W/m²). The default is True.
+
+    Returns
+    -------
+    operator : scipy.sparse.csr_matrix
+        Matrix with one row per band and one column per wavelength.
+    """
+    return _get_operator(bands[1], bands[2],
+                         tuple(float(w) for w in wavelengths), mean)
+
+
+def get_banded_responsivity(spec_resp_factor=None, bands=IEC_BANDS):
+    """
+    This function gives the mean spectral responsivity of the module in each
+    band. Negative values are taken as 0 and the responsivity is 0 outside
+    of its wavelengths.
+
+    Parameters
+    ----------
+    spec_resp_factor : Pandas Series or Float, optional
+        Spectral responsivity (wavelength in nm as index). A number or None
+        (1.0) is a flat responsivity from 200 to 5000nm. The default is
+        None.
+    bands : Tuple, optional
+        Band layout, please check "get_climate_bands". The default is
+        IEC_BANDS.
+
+    Returns
+    -------
+    fsr : Numpy array
+        Spectral responsivity of each band.
+    """
+    if spec_resp_factor is None or np.isscalar(spec_resp_factor):
+        value = 1.0 if spec_resp_factor is None else float(spec_resp_factor)
+        spec_resp_factor = pd.Series([value, value], [200, 5000])
+    sr = spec_resp_factor.dropna()
+    if not (sr.index.is_unique and sr.index.is_monotonic_increasing):
+        sr = sr.groupby(level=0).mean()
+    sr = sr.clip(lower=0)
+    return get_band_operator(bands, sr.index.values) @ sr.values
+
+
+@lru_cache(maxsize=None)
+def get_banded_reference(bands=IEC_BANDS):
+    """
+    This function gives the irradiance of the reference spectrum AM1.5G in
+    each band (W/m²). It is spread uniformly within each of the 29 standard
+    bands (BANDED_AM15G in iec61853.py), so it is exact for the standard
+    bands and for bands made of standard bands.
+
+    Parameters
+    ----------
+    bands : Tuple, optional
+        Band layout, please check "get_climate_bands". The default is
+        IEC_BANDS.
+
+    Returns
+    -------
+    reference : Numpy array
+        AM1.5G irradiance of each band (read only).
+    """
+    edges = np.array(std.SPECTRAL_BAND_EDGES, dtype=float)
+    edges[-1] = AM15G_LIMIT
+    density = np.asarray(std.BANDED_AM15G) / np.diff(edges)
+    lower = np.asarray(bands[1])[:, None]
+    upper = np.asarray(bands[2])[:, None]
+    overlap = np.clip(np.minimum(upper, edges[1:]) -
+                      np.maximum(lower, edges[:-1]), 0, None)
+    reference = np.where(overlap == np.diff(edges),
+                         np.asarray(std.BANDED_AM15G),
+                         overlap * density).sum(axis=1)
+    reference.flags.writeable = False
+    return reference
+
+
+def get_spectral_factor(spec_g, fsr, bands=IEC_BANDS):
+    """
+    This function calculates the spectral factor of each time step
+    (Equation 6 of IEC61853-3), as "calc_spectral_factor" in iec61853.py
+    but for any band layout.
+
+    Parameters
+    ----------
+    spec_g : 2-D array_like
+        Spectral irradiance in each band (W/m²), one row per time step.
+    fsr : array_like
+        Spectral responsivity of each band, please check
+        "get_banded_responsivity".
+    bands : Tuple, optional
+        Band layout, please check "get_climate_bands". The default is
+        IEC_BANDS.
+
+    Returns
+    -------
+    spectral_factor : Numpy array
+        Spectral factor of each time step, NaN without irradiance.
+    """
+    spec_g = np.asarray(spec_g, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        uf_real = (spec_g @ fsr) / spec_g.sum(axis=1)
+    uf_am15 = (get_banded_reference(bands) @ fsr) / AM15G_TOTAL
+    return uf_real / uf_am15
+
+
+def get_band_irradiance(climate_df, bands=IEC_BANDS):
+    """
+    This function integrates fine spectral climate data (one column per
+    wavelength, e.g. "350nm", with the spectral irradiance in W/m²/nm) into
+    bands, with one sparse product for all the time steps.
+
+    Parameters
+    ----------
+    climate_df : Pandas DataFrame
+        Climate data with the wavelength columns.
+    bands : Tuple, optional
+        Band layout, please check "get_climate_bands". The default is
+        IEC_BANDS.
+
+    Returns
+    -------
+    climate_df : Pandas DataFrame
+        A copy of "climate_df" with the band columns (W/m²) instead of the
+        wavelength columns.
+    """
+    columns = [column for column in climate_df.columns
+               if _WAVELENGTH_PATTERN.match(str(column))]
+    if not columns:
+        raise ValueError("No wavelength columns (e.g. '350nm') found in the "
+                         "climate data")
+    wavelengths = np.array([float(_WAVELENGTH_PATTERN.match(str(c)).group(1))
+                            for c in columns])
+    order = np.argsort(wavelengths)
+    spectra = climate_df[[columns[i] for i in order]].values
+    operator = get_band_operator(bands, wavelengths[order], mean=False)
+    banded = pd.DataFrame((operator @ spectra.T).T, index=climate_df.index,
+                          columns=list(bands[0]))
+    return pd.concat([climate_df.drop(columns=columns), banded], axis=1)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Energy Rating steps as a graph of stages with
+memoized outputs, for interactive work where one input is changed at a time
+(e.g. in the notebooks):
+
+    aoi       <- climate, a_r, pv_tilt, bifaciality, albedo
+    spectral  <- aoi, spec_resp_factor
+    thermal   <- spectral, u0, u1, tau
+    power     <- thermal, eta_interpolated, power_matrix, mod_area
+
+The output of each stage is stored with a key made of the key of the stage
+it depends on and the exact values of its own inputs. When an input
+changes, only its stage and the stages after it are run again: changing u0
+or u1 runs the thermal and power stages, changing the ETA interpolation
+runs only the power stage. The stages call the same functions as
+"ersim_dc_steps" in sim_steps.py, so the results are the same.
+
+@author: mriveraa
+"""
+import hashlib
+import pickle
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+# Importing the Steps Function
+import sim_steps
+# Importing utils
+import utils
+
+
+def _aoi(climate_df, a_r, pv_tilt, bifaciality, albedo):
+    climate_df = energy_rating.aoi_correction(climate_df=climate_df, a_r=a_r,
+                                              pv_tilt=pv_tilt)
+    if bifaciality is not None:
+        climate_df = energy_rating.bifacial_correction(
+            climate_df=climate_df, a_r=a_r, albedo=albedo,
+            bifaciality=bifaciality, pv_tilt=pv_tilt)
+    return climate_df
+
+
+def _spectral(climate_df, spec_resp_factor):
+    return energy_rating.spec_correction(climate_df=climate_df,
+                                         spec_resp_factor=spec_resp_factor)
+
+
+def _thermal(climate_df, u0, u1, tau):
+    return energy_rating.temp_correction(climate_df=climate_df, u0=u0, u1=u1,
+                                         tau=tau)
+
+
+def _power(climate_df, eta_interpolated, power_matrix, mod_area):
+    climate_df = energy_rating.module_power_er(
+        climate_df=climate_df, eta_interpolated=eta_interpolated,
+        power_matrix=power_matrix, module_area=mod_area)
+    # Duration of the time steps, as in "get_dc_power"
+    time_steps = utils.get_time_steps(climate_df.index)
+    if time_steps is not None:
+        climate_df["time_step"] = time_steps
+    return climate_df
+
+
+# Stages in order: name, stage it depends on, inputs and function
+STAGES = [("aoi", None, ("a_r", "pv_tilt", "bifaciality", "albedo"), _aoi),
+          ("spectral", "aoi", ("spec_resp_factor",), _spectral),
+          ("thermal", "spectral", ("u0", "u1", "tau"), _thermal),
+          ("power", "thermal", ("eta_interpolated", "power_matrix",
+                                "mod_area"), _power)]
+
+
+def get_input_hash(value):
+    """
+    This function gives a hash of the exact value of an input of a stage:
+    numbers and strings, arrays, Pandas objects (values and index) or any
+    other object that can be pickled (e.g. the ETA interpolation).
+    """
+    sha = hashlib.sha1()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        sha.update(pd.util.hash_pandas_object(value, index=True).values)
+        names = (value.columns if isinstance(value, pd.DataFrame)
+                 else [value.name])
+        sha.update(repr(list(names)).encode())
+    elif isinstance(value, np.ndarray):
+        sha.update(np.ascontiguousarray(value).tobytes())
+        sha.update(repr((value.dtype, value.shape)).encode())
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        sha.update(repr(value).encode())
+    else:
+        sha.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return sha.hexdigest()
+
+
+class StageGraph:
+    """
+    Energy Rating steps with memoized stage outputs. The last "max_entries"
+    stage outputs are kept in memory (each one is a DataFrame like the
+    climate data).
+
+    The number of times each stage was run and reused is kept in "runs" and
+    "hits".
+
+    Parameters
+    ----------
+    max_entries : Integer, optional
+        Number of stage outputs kept. The default is 32.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = int(max_entries)
+        self._outputs = OrderedDict()
+        self.runs = {name: 0 for name, _, _, _ in STAGES}
+        self.hits = {name: 0 for name, _, _, _ in STAGES}
+
+    def get_dc_power(self, climate_data, eta_interpolated, mod_area, u0, u1,
+                     a_r, power_matrix, pv_tilt=20, spec_resp_factor=1.0,
+                     tau=None, bifaciality=None, albedo=0.2):
+        """
+        This function runs the stages that are not memoized for these inputs
+        and returns the output of the power stage. Please check the function
+        "get_dc_power" in sim_steps.py.
+
+        Returns
+        -------
+        climate_data : Pandas DataFrame
+            Copy of the output of the power stage, as "get_dc_power".
+        """
+        inputs = {"a_r": a_r, "pv_tilt": pv_tilt, "bifaciality": bifaciality,
+                  "albedo": albedo, "spec_resp_factor": spec_resp_factor,
+                  "u0": u0, "u1": u1, "tau": tau,
+                  "eta_interpolated": eta_interpolated,
+                  "power_matrix": power_matrix, "mod_area": mod_area}
+        key = get_input_hash(climate_data)
+        output = climate_data
+        for name, _, stage_inputs, function in STAGES:
+            key = get_input_hash((name, key) + tuple(
+                get_input_hash(inputs[i]) for i in stage_inputs))
+            if key in self._outputs:
+                self._outputs.move_to_end(key)
+                output = self._outputs[key]
+                self.hits[name] += 1
+                continue
+            # The steps work on a copy, the stored outputs are not changed
+            output = function(output, *[inputs[i] for i in stage_inputs])
+            self._outputs[key] = output
+            self.runs[name] += 1
+            if len(self._outputs) > self.max_entries:
+                self._outputs.popitem(last=False)
+        return output.copy()
+
+    def ersim_dc_steps(self, climate_data, eta_interpolated, pnom, mod_area,
+                       u0, u1, a_r, power_matrix, pv_tilt=20,
+                       spec_resp_factor=1.0, tau=None, bifaciality=None,
+                       albedo=0.2):
+        """
+        This function has the steps for Energy Rating with the memoized
+        stages. Please check the function "ersim_dc_steps" in sim_steps.py.
+
+        Returns
+        -------
+        cser : Float
+            Climate Specific Energy Rating.
+        eta_avg : Float
+            Average ETA.
+        climate_data : Pandas DataFrame
+            DataFrame with the columns of the simulation, without the time
+            steps with NaN values.
+        """
+        climate_data = self.get_dc_power(
+            climate_data=climate_data, eta_interpolated=eta_interpolated,
+            mod_area=mod_area, u0=u0, u1=u1, a_r=a_r,
+            power_matrix=power_matrix, pv_tilt=pv_tilt,
+            spec_resp_factor=spec_resp_factor, tau=tau,
+            bifaciality=bifaciality, albedo=albedo)
+        return sim_steps.get_results(climate_data=climate_data, pnom=pnom,
+                                     mod_area=mod_area)
+
+    def clear(self):
+        """
+        Removes all the stored stage outputs.
+        """
+        self._outputs.clear()
+        return
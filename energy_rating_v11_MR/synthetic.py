@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the generator of synthetic input data for load and
+scaling tests of the Energy Rating simulation:
+
+    - CalLab "CSER input file" texts of realistic modules: the Power Rating
+        Matrix follows a low-irradiance efficiency curve and a temperature
+        coefficient with measurement noise, the spectral responsivity,
+        a_r and u0/u1 are perturbed around typical crystalline silicon
+        values.
+    - Multi-year hourly climates with the columns of the standard climate
+        files enra_*.csv from IEC61853-4 [1], built by resampling the days
+        of a standard climate.
+
+The generation is seedable: module number "i" of a given seed is always the
+same, no matter how many modules are generated or in which order.
+
+    References
+    ----------
+    .. [1] Energy Rating Standard IEC61853-4.
+
+@author: mriveraa
+"""
+from os.path import join
+import os
+import numpy as np
+import pandas as pd
+
+# Wavelengths (nm) and spectral responsivity of a crystalline silicon module
+SR_WAVELENGTHS = np.array([290, 350, 375, 401, 425, 453, 474, 500, 524, 552,
+                           574, 594, 625, 650, 700, 750, 771, 800, 827, 850,
+                           875, 900, 917, 950, 977, 1000, 1061, 1099, 1190])
+SR_SILICON = np.array([0.000, 0.298, 0.346, 0.389, 0.422, 0.453, 0.476,
+                       0.515, 0.536, 0.567, 0.590, 0.614, 0.643, 0.683,
+                       0.729, 0.779, 0.796, 0.828, 0.851, 0.874, 0.890,
+                       0.920, 0.941, 0.978, 0.988, 1.000, 0.889, 0.714,
+                       0.000])
+
+# Irradiance (W/m²) and temperature (°C) levels of the Power Rating Matrix
+MATRIX_POINTS = [(g, t) for t, gs in [(75, range(1100, 500, -100)),
+                                      (50, range(1100, 300, -100)),
+                                      (25, range(1100, 0, -100)),
+                                      (15, range(1000, 0, -100))]
+                 for g in gs]
+
+TECHNOLOGIES = ["mono-Si", "multi-Si", "HJT", "TOPCon", "PERC"]
+
+
+def _module_rng(seed, index):
+    # Independent stream for each module
+    return np.random.default_rng([index, seed if seed is not None else 0])
+
+
+def generate_module(index, seed=None):
+    """
+    This function generates the data of a synthetic module.
+
+    Parameters
+    ----------
+    index : Integer
+        Number of the module, it is part of its Internal_ID.
+    seed : Integer, optional
+        Seed of the generator. The default is None (seed 0).
+
+    Returns
+    -------
+    module : Dictionary
+        "parameters" (Dictionary with the [Module parameters]),
+        "spec_resp" (Series, wavelength as index), "power_matrix" (DataFrame
+        with 'gmean', 'temp' and 'pmpp'), "a_r", "u0" and "u1".
+    """
+    rng = _module_rng(seed, index)
+    tech = TECHNOLOGIES[rng.integers(len(TECHNOLOGIES))]
+    cells = int(rng.choice([60, 66, 72, 120, 132, 144]))
+    # Size of the module from the number of cells (half cells above 100)
+    cell_area = 0.0244 if cells < 100 else 0.0122
+    area = cells * cell_area * rng.uniform(1.08, 1.14)
+    width = int(rng.choice([992, 1000, 1045, 1134]))
+    length = int(round(area * 1e6 / width))
+    area = round(length * width * 1e-6, 3)
+
+    # Power Rating Matrix: efficiency at STC, low-irradiance curve (relative
+    # efficiency at 100 W/m²) and temperature coefficient
+    eta_stc = rng.uniform(0.17, 0.225)
+    eta_low = rng.uniform(0.93, 1.01)
+    gamma = rng.uniform(-0.0042, -0.0026)
+    g = np.array([p[0] for p in MATRIX_POINTS], dtype=float)
+    t = np.array([p[1] for p in MATRIX_POINTS], dtype=float)
+    eta_rel = 1 + (1 - eta_low) * np.log10(g / 1000)
+    pmpp = (eta_stc * area * g * eta_rel * (1 + gamma * (t - 25))
+            * (1 + rng.normal(0, 0.002, len(g))))
+    power_matrix = pd.DataFrame({"gmean": g, "temp": t,
+                                 "pmpp": np.round(pmpp, 2)})
+
+    # Spectral responsivity: red and blue response of the cell
+    blue = rng.uniform(0.85, 1.15)
+    red = rng.uniform(0.95, 1.05)
+    shape = np.where(SR_WAVELENGTHS < 600,
+                     SR_SILICON ** blue,
+                     SR_SILICON * red)
+    shape = np.clip(shape + rng.normal(0, 0.005, len(shape)), 0, None)
+    shape[[0, -1]] = 0
+    spec_resp = pd.Series(np.round(shape / shape.max(), 3),
+                          index=SR_WAVELENGTHS)
+
+    int_id = "Synthetic_%07d" % (index)
+    parameters = {"Order_ID": "SYN%08d" % (index),
+                  "Internal_ID": int_id,
+                  "Producer": "Synthetic",
+                  "Module_Type": "SYN-%d-%s" % (round(eta_stc * area * 1000),
+                                                tech),
+                  "Technology": tech,
+                  "Serial_Number": "-",
+                  "Number_of_cells": cells,
+                  "Module_Length[mm]": length,
+                  "Module_Width[mm]": width,
+                  "Module_Area_[m2]": area}
+    return {"parameters": parameters,
+            "spec_resp": spec_resp,
+            "power_matrix": power_matrix,
+            "a_r": round(rng.uniform(0.12, 0.18), 5),
+            "u0": round(rng.normal(29.0, 2.0), 1),
+            "u1": round(np.clip(rng.normal(4.5, 1.0), 1.0, 8.0), 1)}
+
+
+def module_to_text(module):
+    """
+    This function writes the data of a module in the format of the CalLab
+    "CSER input file", please check the function "read_callab_stdfile".
+
+    Parameters
+    ----------
+    module : Dictionary
+        Module data, please check "generate_module".
+
+    Returns
+    -------
+    text : String
+        Content of the CalLab file.
+    """
+    lines = ["[Module parameters]"]
+    lines += ["%s\t%s" % item for item in module["parameters"].items()]
+    lines += ["", "[Spectral responsivity]", "Wavelength [nm]\t s(λ)"]
+    lines += ["%d\t%.3f" % item for item in module["spec_resp"].items()]
+    lines += ["", "[Power Rating Matrix]", "G [W/m2]\tT [deg]\tPmpp [W]"]
+    lines += ["%g\t%g\t%.2f" % tuple(row)
+              for row in module["power_matrix"].values]
+    lines += ["", "[Angle of incidence]", "a_r\t%.5f" % (module["a_r"])]
+    lines += ["", "[Thermal coefficients]",
+              "Irradiance impact: u_0\t%.1f" % (module["u0"]),
+              "Wind impact: u_1\t%.1f" % (module["u1"])]
+    return "\n".join(lines)
+
+
+def write_modules(folder, n, seed=None, start=0):
+    """
+    This function writes the CalLab files of "n" synthetic modules, named
+    like the CalLab files: "CSER input file_Synthetic_0000000.txt".
+
+    Parameters
+    ----------
+    folder : String
+        Path to folder where the files are written.
+    n : Integer
+        Number of modules.
+    seed : Integer, optional
+        Seed of the generator. The default is None (seed 0).
+    start : Integer, optional
+        Number of the first module, so large sets can be written in parts.
+        The default is 0.
+
+    Returns
+    -------
+    paths : List
+        Paths of the files written.
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for index in range(start, start + n):
+        module = generate_module(index, seed=seed)
+        path = join(folder, "CSER input file_%s.txt"
+                    % (module["parameters"]["Internal_ID"]))
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(module_to_text(module))
+        paths.append(path)
+    return paths
+
+
+def generate_climate(template, years=1, start_year=2011, seed=None):
+    """
+    This function generates a multi-year hourly climate from a standard
+    climate. Each day takes the weather (irradiance, spectrum, temperature
+    and wind) of a random day up to a week apart in the template, keeping the
+    sun position of its own date. The irradiance of the day is scaled by a
+    random clearness factor and the temperature gets a yearly and a daily
+    offset.
+
+    Parameters
+    ----------
+    template : Pandas DataFrame
+        Standard climate as in the enra_*.csv files (columns "Year",
+        "Month", "Day", "Hour solar", ...), one year of 365 days.
+    years : Integer, optional
+        Number of years. The default is 1.
+    start_year : Integer, optional
+        Year of the first year. The default is 2011.
+    seed : Integer, optional
+        Seed of the generator. The default is None (seed 0).
+
+    Returns
+    -------
+    climate : Pandas DataFrame
+        Synthetic climate with the same columns as "template".
+    """
+    rng = np.random.default_rng(seed if seed is not None else 0)
+    hours = 24
+    days = len(template) // hours
+    values = template.values.reshape(days, hours, -1)
+    columns = list(template.columns)
+    irr = np.arange(columns.index("Gh (W/m2)"), len(columns))
+    temp = columns.index("Ambient temperature (øC)")
+    wind = columns.index("Wind speed (m/s)")
+    elev = columns.index("Sun elevation (ø)")
+
+    climate = []
+    for y in range(years):
+        # Source day of each day
+        source = np.clip(np.arange(days) + rng.integers(-7, 8, days),
+                         0, days - 1)
+        year = values.copy()
+        clearness = np.clip(rng.normal(1.0, 0.08, days), 0.6, 1.2)
+        year[:, :, irr] = values[source][:, :, irr] * clearness[:, None, None]
+        # No irradiance where the sun is below the horizon
+        year[:, :, irr] *= (values[:, :, elev] > 0)[:, :, None]
+        year[:, :, temp] = (values[source][:, :, temp]
+                            + rng.normal(0, 0.5)
+                            + rng.normal(0, 1.0, days)[:, None])
+        year[:, :, wind] = np.clip(
+            values[source][:, :, wind]
+            * rng.lognormal(0, 0.2, days)[:, None], 0, None)
+        year[:, :, columns.index("Year")] = start_year + y
+        climate.append(year.reshape(days * hours, -1))
+    climate = pd.DataFrame(np.concatenate(climate), columns=columns)
+    for column in ["Year", "Month", "Day"]:
+        climate[column] = climate[column].astype(int)
+    return climate
+
+
+def write_climate(template_path, path, years=1, start_year=2011, seed=None):
+    """
+    This function writes a synthetic multi-year climate file with the format
+    of the standard climate files. Please check "generate_climate".
+
+    Parameters
+    ----------
+    template_path : String
+        Path to a standard climate file (enra_*.csv).
+    path : String
+        Path of the file to be written.
+    years, start_year, seed : optional
+        Please check "generate_climate".
+    """
+    template = pd.read_csv(template_path, sep=",", encoding="ISO-8859-1")
+    climate = generate_climate(template, years=years,
+                               start_year=start_year, seed=seed)
+    climate.to_csv(path, index=False, encoding="ISO-8859-1",
+                   float_format="%.6g")
+    return
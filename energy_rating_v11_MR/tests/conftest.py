@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+Configuration of the tests: the modules of the Energy Rating are imported
+as in the scripts, from the folder of the package.
+
+@author: mriveraa
+"""
+import glob
+import sys
+from os.path import abspath, basename, dirname, join
+import pytest
+
+FOLDER = dirname(dirname(abspath(__file__)))
+if FOLDER not in sys.path:
+    sys.path.insert(0, FOLDER)
+EXAMPLE_FILES = sorted(glob.glob(join(FOLDER, "example_data", "*.txt")))
+
+
+@pytest.fixture(scope="session", params=EXAMPLE_FILES,
+                ids=lambda path: basename(path).split("_", 1)[1][:-4])
+def example_file(request):
+    """Path to each of the example CalLab files."""
+    return request.param
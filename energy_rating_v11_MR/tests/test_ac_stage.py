@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the AC stage (ac_stage.py).
+
+@author: mriveraa
+"""
+import numpy as np
+import pandas as pd
+import pytest
+# Importing the AC stage
+import ac_stage
+# Importing the equivalence harness
+import equivalence
+# Importing the multi-site Energy Rating
+import multi_site
+
+RATIOS = [0.8, 1.0, 1.2, 1.4, 1.6]
+
+
+@pytest.fixture(scope="module")
+def simulation(example_file):
+    module = multi_site.get_module_characterisation(example_file)
+    climate, pv_tilt, climate_data = equivalence.get_climates()[1]
+    sim_df = equivalence.run_steps(climate_data, module, pv_tilt, None)[2]
+    return module, sim_df
+
+
+def test_energy_balance(simulation):
+    module, sim_df = simulation
+    ac_table = ac_stage.get_ac_energy(sim_df["Pout"], module["pnom"],
+                                      dc_ac_ratios=RATIOS)
+    assert list(ac_table.index) == RATIOS
+    assert np.allclose(ac_table["energy_dc"], sim_df["Pout"].sum())
+    np.testing.assert_allclose(
+        ac_table["energy_dc"] - ac_table["loss_inverter"]
+        - ac_table["loss_clipping"], ac_table["energy_ac"], rtol=1e-12)
+    assert (ac_table["energy_ac"] <= ac_table["energy_dc"]).all()
+    assert (ac_table[["loss_inverter", "loss_clipping"]] >= 0).all().all()
+
+
+def test_clipping(simulation):
+    module, sim_df = simulation
+    ac_table = ac_stage.get_ac_energy(sim_df["Pout"], module["pnom"],
+                                      dc_ac_ratios=RATIOS)
+    # No clipping with an inverter larger than the module
+    assert ac_table.loc[0.8, "loss_clipping"] == 0
+    assert ac_table.loc[0.8, "clipping_hours"] == 0
+    # The clipping grows with the DC/AC ratio
+    assert (np.diff(ac_table["loss_clipping"]) >= 0).all()
+    assert (np.diff(ac_table["clipping_hours"]) >= 0).all()
+    assert ac_table.loc[1.6, "loss_clipping"] > 0
+    # The AC power never exceeds the rated AC power of the inverter
+    pac_rated = module["pnom"] * 1000 / 1.6
+    assert ac_table.loc[1.6, "energy_ac"] <= pac_rated * len(sim_df)
+
+
+def test_inverter_curve():
+    # Constant efficiency and a large inverter: only the inverter loss
+    curve = pd.Series([0.95, 0.95], index=[0.0, 1.0])
+    pout = pd.Series([0.0, 100.0, np.nan, 200.0])
+    ac_table = ac_stage.get_ac_energy(pout, pnom=0.4, dc_ac_ratios=1.0,
+                                      curve=curve)
+    assert np.isclose(ac_table.loc[1.0, "energy_dc"], 300.0)
+    assert np.isclose(ac_table.loc[1.0, "energy_ac"], 0.95 * 300.0)
+    # Time steps of 10 minutes
+    ac_10min = ac_stage.get_ac_energy(pout, pnom=0.4, dc_ac_ratios=1.0,
+                                      curve=curve,
+                                      time_steps=np.full(4, 1 / 6))
+    np.testing.assert_allclose(ac_10min.values, ac_table.values / 6)
+    # Clipping at the rated AC power: 400 W / 2 = 200 W
+    clipped = ac_stage.get_ac_energy(pd.Series([300.0]), pnom=0.4,
+                                     dc_ac_ratios=2.0, curve=curve)
+    assert np.isclose(clipped.loc[2.0, "energy_ac"], 200.0)
+    assert np.isclose(clipped.loc[2.0, "loss_clipping"], 0.95 * 300.0 - 200)
+
+
+def test_ac_table(simulation):
+    module, sim_df = simulation
+    sim_results = {"a": sim_df, "b": sim_df.iloc[: len(sim_df) // 2]}
+    ac_table = ac_stage.get_ac_table(sim_results, module["pnom"],
+                                     dc_ac_ratios=[1.0, 1.3])
+    assert list(ac_table.index.names) == ["Std_climate", "dc_ac_ratio"]
+    assert len(ac_table) == 4
+    np.testing.assert_allclose(
+        ac_table["energy_ac_rel"],
+        ac_table["energy_ac"] / ac_table["energy_dc"])
+    pd.testing.assert_frame_equal(
+        ac_table.loc["a"].iloc[:, :5],
+        ac_stage.get_ac_energy(sim_df["Pout"], module["pnom"],
+                               dc_ac_ratios=[1.0, 1.3]))
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the energy tables and loss waterfall (aggregates.py).
+
+@author: mriveraa
+"""
+import glob
+import numpy as np
+import pytest
+# Importing the aggregates
+import aggregates
+# Importing the equivalence harness
+import equivalence
+# Importing the fused kernel
+import fused_kernel
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the Steps Function
+import sim_steps
+
+# Sign of each column of LOSS_COLUMNS in the sum giving "energy_dc"
+SIGNS = np.array([1, -1, 1, -1, -1, -1])
+
+
+def _get_module(name, bifaciality=None):
+    path = glob.glob(equivalence.EXAMPLE_FOLDER + "/*%s*.txt" % name)[0]
+    return multi_site.get_module_characterisation(path,
+                                                  bifaciality=bifaciality)
+
+
+@pytest.fixture(scope="module",
+                params=[("Sunpower", None), ("Trinasolar", None),
+                        ("Trinasolar", 0.7)],
+                ids=["Sunpower", "Trinasolar", "Trinasolar-bifacial"])
+def tables(request):
+    module = _get_module(*request.param)
+    climate, pv_tilt, climate_data = equivalence.get_climates()[3]
+    sim_df = equivalence.run_steps(climate_data, module, pv_tilt, None)[2]
+    return sim_df, aggregates.get_energy_tables(
+        climate_data=sim_df,
+        eta_interpolated=module["eta_interpolated"],
+        power_matrix=module["power_matrix"],
+        module_area=module["module_area"],
+        pnom=module["pnom"])
+
+
+def test_waterfall_telescopes(tables):
+    sim_df, tables = tables
+    waterfall = tables["waterfall"]
+    assert np.isclose((waterfall.iloc[:-1] * SIGNS).sum(),
+                      waterfall["energy_dc"], rtol=1e-10)
+    # Each hour and month telescopes too
+    hour_month = tables["hour_month"]
+    np.testing.assert_allclose(
+        (hour_month.iloc[:, :-1] * SIGNS).sum(axis=1),
+        hour_month["energy_dc"], rtol=1e-9, atol=1e-6)
+    # The AOI loss is the one of the front side
+    assert waterfall["loss_aoi"] > 0
+    if "g_bifacial" in sim_df:
+        assert waterfall["gain_bifacial"] > 0
+    else:
+        assert waterfall["gain_bifacial"] == 0
+
+
+def test_tables_add_up(tables):
+    sim_df, tables = tables
+    energy = (sim_df["Pout"] * sim_df["time_step"]).sum() \
+        if "time_step" in sim_df else sim_df["Pout"].sum()
+    for name in ["monthly", "daily"]:
+        assert np.isclose(tables[name]["energy_dc"].sum(), energy,
+                          rtol=1e-10)
+    assert np.isclose(tables["hour_month"]["energy_dc"].sum(), energy,
+                      rtol=1e-10)
+
+
+def test_bifacial_zero():
+    # A bifaciality of 0 gives the monofacial rating and losses
+    climate, pv_tilt, climate_data = equivalence.get_climates()[0]
+    results = {}
+    for bifaciality in [None, 0.0]:
+        module = _get_module("Trinasolar", bifaciality)
+        results[bifaciality] = sim_steps.ersim_dc_tables(
+            climate_data=climate_data,
+            **equivalence._get_kwargs(module, pv_tilt, None))
+    assert np.isclose(results[0.0][0], results[None][0], rtol=1e-12)
+    assert np.isclose(results[0.0][1], results[None][1], rtol=1e-12)
+    np.testing.assert_allclose(results[0.0][2]["waterfall"],
+                               results[None][2]["waterfall"], rtol=1e-12)
+
+
+@pytest.mark.parametrize("bifaciality", [None, 0.7])
+def test_fused_waterfall(bifaciality):
+    module = _get_module("Trinasolar", bifaciality)
+    climate, pv_tilt, climate_data = equivalence.get_climates()[1]
+    kwargs = equivalence._get_kwargs(module, pv_tilt, 300.0)
+    waterfall = sim_steps.ersim_dc_tables(climate_data=climate_data,
+                                          **kwargs)[2]["waterfall"]
+    fused = fused_kernel.ersim_dc_fused(climate_data=climate_data,
+                                        losses=True, **kwargs)[2]
+    np.testing.assert_allclose(fused[aggregates.LOSS_COLUMNS],
+                               waterfall[aggregates.LOSS_COLUMNS],
+                               rtol=1e-8)
+
+
+def test_waterfall_table(tables):
+    sim_df, tables = tables
+    table = aggregates.get_waterfall_table({("module", "climate"):
+                                            tables["waterfall"]})
+    assert list(table.columns[:7]) == aggregates.LOSS_COLUMNS
+    assert np.isclose(table["gain_bifacial_rel"].iloc[0],
+                      tables["waterfall"]["gain_bifacial"]
+                      / tables["waterfall"]["energy_stc"])
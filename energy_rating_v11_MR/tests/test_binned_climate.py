@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the binned-climate mode (binned_climate.py).
+
+@author: mriveraa
+"""
+import numpy as np
+import pytest
+# Importing the binned-climate mode
+import binned_climate
+# Importing the fused kernel
+import fused_kernel
+# Importing the daylight-only representation
+import daylight
+# Importing the equivalence harness
+import equivalence
+# Importing the multi-site Energy Rating
+import multi_site
+from conftest import EXAMPLE_FILES
+
+
+def _get_kwargs(module, pv_tilt):
+    # Steady-state temperature only
+    kwargs = equivalence._get_kwargs(module, pv_tilt, None)
+    del kwargs["tau"]
+    return kwargs
+
+
+@pytest.fixture(scope="module")
+def climates():
+    return equivalence.get_climates()
+
+
+@pytest.fixture(scope="module")
+def modules():
+    return [multi_site.get_module_characterisation(path)
+            for path in EXAMPLE_FILES]
+
+
+def test_reduce(climates):
+    # From 553 to 2780 bins in the six standard climates
+    n_bins = [len(binned_climate.reduce_climate(climate_data)["bins"])
+              for climate, pv_tilt, climate_data in climates]
+    assert (min(n_bins), max(n_bins)) == (553, 2780)
+    climate, pv_tilt, climate_data = climates[3]
+    reduced = binned_climate.reduce_climate(climate_data)
+    bins = reduced["bins"]
+    assert reduced["n_steps"] == len(climate_data)
+    assert reduced["error_bound"] is None
+    # The bins keep the duration and the irradiation of the daylight steps
+    mask = daylight.get_daylight_mask(climate_data)
+    assert np.isclose(bins["weight"].sum(), mask.sum())
+    assert np.isclose((bins["G_tlt"] * bins["weight"]).sum(),
+                      climate_data.loc[mask, "G_tlt"].sum())
+    # Smaller bins give more bins
+    finer = binned_climate.reduce_climate(climate_data,
+                                          resolution={"G_tlt": 25.0})
+    assert finer["resolution"]["G_tlt"] == 25.0
+    assert finer["resolution"]["T_amb"] == binned_climate.RESOLUTION["T_amb"]
+    assert len(finer["bins"]) > len(bins)
+    with pytest.raises(ValueError):
+        binned_climate.reduce_climate(climate_data, resolution={"rh": 5.0})
+
+
+def test_calibrate(climates, modules):
+    # The error bound is the largest error of the calibration modules
+    # against "ersim_dc_steps"
+    for climate, pv_tilt, climate_data in climates:
+        reduced = binned_climate.reduce_climate(climate_data)
+        errors = binned_climate.calibrate(reduced, climate_data, modules,
+                                          pv_tilt=pv_tilt)
+        assert len(errors) == len(modules)
+        assert reduced["error_bound"] == errors["error_cser"].abs().max()
+        assert 0 < reduced["error_bound"] < 1e-3
+        for module in modules:
+            cser = equivalence.run_steps(climate_data, module, pv_tilt,
+                                         None)[0]
+            cser_binned = binned_climate.ersim_dc_binned(
+                reduced, **_get_kwargs(module, pv_tilt))[0]
+            assert abs(cser_binned / cser - 1) <= \
+                reduced["error_bound"] + 1e-12
+
+
+def test_numpy_steps(climates, modules, monkeypatch):
+    # The steps of energy_rating_functions.py give the CSER of the kernel
+    climate, pv_tilt, climate_data = climates[0]
+    reduced = binned_climate.reduce_climate(climate_data)
+    kwargs = _get_kwargs(modules[0], pv_tilt)
+    expected = binned_climate.ersim_dc_binned(reduced, **kwargs)
+    monkeypatch.setattr(fused_kernel, "HAS_NUMBA", False)
+    np.testing.assert_allclose(
+        binned_climate.ersim_dc_binned(reduced, **kwargs), expected,
+        rtol=1e-9)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the bulk reading of the CalLab results (read_callab_bulk in
+read_functions.py) and of their work items (enqueue_callab in
+work_queue.py).
+
+@author: mriveraa
+"""
+import os
+import numpy as np
+import pandas as pd
+import pytest
+# Importing read functions
+import read_functions
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+# Importing the synthetic data generator
+import synthetic
+# Importing the work queue
+import work_queue
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the batch runner
+import batch_run
+from conftest import EXAMPLE_FILES
+
+# Measurement IDs of the summary workbook and what their customer file is
+FILES = {"M001": "ok", "M002": "missing", "M003": "malformed",
+         "M004": "empty", "M005": "ok"}
+
+
+def _customer_text(power_matrix, area, value=None):
+    # Customer file: preamble, header and the measurement table (CalLab
+    # efficiency in %), then the notes
+    lines = ["CalLab PV Modules customer file"] + ["-"] * 9
+    lines.append("\t".join(["Temp", "Isc", "Uoc", "Impp", "Umpp", "Pmpp",
+                            "FF", "Eta", "Gmean", "Tmod", "Hyst"]))
+    for g, t, pmpp in power_matrix.values:
+        eta = 100 * pmpp / area / g
+        lines.append("\t".join(
+            ["%d °C" % t, "10.1", "45.2", "9.6", "38.4",
+             "%.2f" % pmpp if value is None else value, "78.1", "%.2f" % eta,
+             "%.1f" % g, "%.1f" % t, "0.1"]))
+    return "\n".join(lines + ["", "Notes: measured at CalLab"])
+
+
+@pytest.fixture(scope="module")
+def callab(tmp_path_factory):
+    # Summary workbook, customer files of the synthetic modules and a
+    # repeated Measurement ID
+    folder = tmp_path_factory.mktemp("callab")
+    os.makedirs(folder / "modules")
+    rows = []
+    for index, (module_id, kind) in enumerate(FILES.items()):
+        module = synthetic.generate_module(index, seed=2)
+        area = module["parameters"]["Module_Area_[m2]"]
+        rows.append({"Measurement_ID_tk": module_id,
+                     "TK_Pmpp_rel": -0.35, "Technology_tk": "mono-Si",
+                     "Module_Area_tk": area})
+        path = folder / "modules" / ("%s_customer.txt" % module_id)
+        if kind == "ok":
+            path.write_text(_customer_text(module["power_matrix"], area),
+                            encoding="ISO-8859-1")
+        elif kind == "malformed":
+            path.write_text(_customer_text(module["power_matrix"], area,
+                                           value="n/a"),
+                            encoding="ISO-8859-1")
+        elif kind == "empty":
+            path.write_text(_customer_text(module["power_matrix"].iloc[:0],
+                                           area), encoding="ISO-8859-1")
+    rows.append(dict(rows[0]))
+    pd.DataFrame(rows).to_excel(folder / "summary.xlsx", index=False)
+    return str(folder)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_read_bulk(callab, workers):
+    modules, summary = read_functions.read_callab_bulk(
+        callab, "modules", "summary.xlsx", workers=workers)
+    assert list(summary["Measurement_ID_tk"]) == list(FILES) + ["M001"]
+    assert list(summary["status"]) == ["ok", "missing", "malformed",
+                                       "malformed", "ok", "duplicate"]
+    assert summary["file"].isna().tolist() == [False, True, False, False,
+                                               False, False]
+    errors = summary.set_index("Measurement_ID_tk")["error"]
+    assert errors["M002"] == "No customer file"
+    assert "No measurement table" in errors["M004"]
+    assert errors.iloc[-1] == "Measurement ID already in the summary"
+    assert [module["module_id_callab"] for module in modules] == ["M001",
+                                                                  "M005"]
+    module = modules[0]
+    assert np.isclose(module["alpha"], -0.0035)
+    # Power Rating Matrix with the columns of "read_callab_stdfile", the
+    # efficiency of CalLab (in %) only in the measurements
+    expected = synthetic.generate_module(0, seed=2)["power_matrix"]
+    assert list(module["power_matrix"].columns) == ["gmean", "temp", "pmpp"]
+    np.testing.assert_allclose(module["power_matrix"].values,
+                               expected.values)
+    assert "eta_callab" in module["measurements"]
+    assert np.isclose(
+        energy_rating.get_eta_stc(power_matrix=module["power_matrix"],
+                                  module_area=module["mod_area"]),
+        expected["pmpp"][(expected["gmean"] == 1000)
+                         & (expected["temp"] == 25)].iloc[0]
+        / module["mod_area"] / 1000)
+
+
+def test_read_bulk_columns(callab, tmp_path):
+    pd.DataFrame({"Measurement_ID_tk": ["M001"]}).to_excel(
+        tmp_path / "summary.xlsx", index=False)
+    with pytest.raises(ValueError):
+        read_functions.read_callab_bulk(str(tmp_path), callab,
+                                        "summary.xlsx", workers=1)
+
+
+def test_enqueue_callab(callab, tmp_path):
+    queue = str(tmp_path / "queue.db")
+    added, summary = work_queue.enqueue_callab(
+        queue, callab, "modules", "summary.xlsx",
+        template_path=EXAMPLE_FILES[0], folder=str(tmp_path / "cser"),
+        workers=1)
+    # Two modules read in the six standard climates
+    assert added == 2 * 6
+    assert summary["module_file"].notna().tolist() == [
+        status == "ok" for status in summary["status"]]
+    template = multi_site.get_module_characterisation(EXAMPLE_FILES[0])
+    for module_file, index in zip(summary["module_file"].dropna(), [0, 4]):
+        module = multi_site.get_module_characterisation(module_file)
+        expected = synthetic.generate_module(index, seed=2)
+        assert module["int_id"] == list(FILES)[index]
+        assert np.isclose(module["module_area"],
+                          expected["parameters"]["Module_Area_[m2]"])
+        np.testing.assert_allclose(
+            module["power_matrix"][["gmean", "temp", "pmpp"]].values,
+            expected["power_matrix"].values)
+        np.testing.assert_allclose(module["spec_resp"].values,
+                                   template["spec_resp"].values)
+        assert (module["a_r"], module["u0"], module["u1"]) == \
+            (template["a_r"], template["u0"], template["u1"])
+    assert work_queue.get_status(queue)["pending"] == 12
+    # Again from the command line: the items are already in the queue
+    batch_run.main(["enqueue", queue, "--modules",
+                    os.path.join(callab, "modules"), "--callab",
+                    os.path.join(callab, "summary.xlsx"), "--template",
+                    EXAMPLE_FILES[0], "--callab-files",
+                    str(tmp_path / "cser"), "--workers", "1"])
+    assert work_queue.get_status(queue)["pending"] == 12
+    with pytest.raises(ValueError):
+        batch_run.main(["enqueue", queue, "--modules", callab, "--callab",
+                        os.path.join(callab, "summary.xlsx")])
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the analytic efficiency models (efficiency_models.py).
+
+@author: mriveraa
+"""
+import numpy as np
+import pandas as pd
+import pytest
+# Importing the analytic efficiency models
+import efficiency_models
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the equivalence harness
+import equivalence
+
+
+def _get_power_matrix(eta_model, eta_stc=0.2):
+    # Measurements of an exact model, relative to its value at STC
+    g, t = [values.ravel() for values in np.meshgrid(
+        [100., 200., 400., 600., 800., 1000., 1100.], [15., 25., 50., 75.])]
+    eta = eta_stc * eta_model(g, t) / eta_model(1000., 25.)
+    return pd.DataFrame({"gmean": g, "temp": t, "eta": eta,
+                         "g_round": g, "t_round": t})
+
+
+@pytest.mark.parametrize("model, params", [
+    ("hey", [1.2e-4, -0.14, -1.9, -0.004]),
+    ("mpm5", [1.0, -0.004, 0.02, -0.01]),
+    ("mpm6", [1.0, -0.004, 0.02, -0.01, 0.001]),
+    ("pvgis", [-0.01, -0.02, -0.004, 1e-4, 1e-5, 1e-6])])
+def test_model_recovered(model, params):
+    exact = efficiency_models.EfficiencyModel(model, params)
+    eta_model = efficiency_models.fit_efficiency_model(
+        _get_power_matrix(exact), model)
+    g, t = np.meshgrid(np.linspace(100, 1100, 11), np.linspace(15, 75, 7))
+    np.testing.assert_allclose(eta_model(g, t),
+                               exact(g, t) / exact(1000., 25.), rtol=1e-6)
+    assert eta_model.max_error < 1e-6 and eta_model.r2 > 1 - 1e-9
+    if model == "hey":
+        # Temperature coefficient found by the scalar search
+        assert eta_model.params[3] == pytest.approx(params[3], rel=1e-4)
+
+
+def test_unknown_model(example_file):
+    power_matrix = multi_site.get_module_characterisation(
+        example_file)["power_matrix"]
+    with pytest.raises(ValueError):
+        efficiency_models.fit_efficiency_model(power_matrix, "linear")
+
+
+def test_fit_report(example_file):
+    power_matrix = multi_site.get_module_characterisation(
+        example_file)["power_matrix"]
+    report = efficiency_models.fit_all_models(power_matrix)
+    assert list(report.index) == list(efficiency_models.EFFICIENCY_MODELS)
+    assert list(report.columns[-3:]) == ["rmse", "max_error", "r2"]
+    assert (report["r2"] > 0.99).all() and (report["rmse"] < 0.01).all()
+
+
+@pytest.mark.parametrize("model", list(efficiency_models.EFFICIENCY_MODELS))
+def test_cser_close_to_bilinear(example_file, model):
+    climate, pv_tilt, climate_data = equivalence.get_climates()[3]
+    bilinear = multi_site.get_module_characterisation(example_file)
+    fitted = multi_site.get_module_characterisation(example_file,
+                                                    eta_model=model)
+    assert fitted["eta_interpolated"](1000., 25.) == pytest.approx(
+        1, abs=2e-3)
+    cser = equivalence.run_steps(climate_data, bilinear, pv_tilt, None)[0]
+    cser_model = equivalence.run_steps(climate_data, fitted, pv_tilt,
+                                       None)[0]
+    assert cser_model == pytest.approx(cser, rel=0.01)
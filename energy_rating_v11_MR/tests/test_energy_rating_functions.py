@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the transient module temperature (energy_rating_functions.py).
+
+@author: mriveraa
+"""
+import glob
+from os.path import join
+import numpy as np
+import pandas as pd
+import pytest
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the equivalence harness
+import equivalence
+
+
+def _recursion(temp_steady, tau):
+    seconds = (temp_steady.index - temp_steady.index[0]).total_seconds()
+    y = [temp_steady.iloc[0]]
+    for k in range(1, len(temp_steady)):
+        a = np.exp(-(seconds[k] - seconds[k - 1]) / tau)
+        y.append(a * y[-1] + (1 - a) * temp_steady.iloc[k])
+    return np.array(y)
+
+
+def test_constant_step():
+    index = pd.date_range("2021-01-01", periods=48, freq="H")
+    temp_steady = pd.Series(np.r_[np.full(24, 20.), np.full(24, 40.)],
+                            index=index)
+    temp_mod = energy_rating.transient_temperature(temp_steady, tau=1800.)
+    np.testing.assert_allclose(temp_mod.values,
+                               _recursion(temp_steady, 1800.), rtol=1e-12)
+    # Step response after one time step
+    assert np.isclose(temp_mod.iloc[24], 40 - 20 * np.exp(-2))
+
+
+def test_irregular_step():
+    seconds = np.cumsum(np.r_[0, np.random.default_rng(0).uniform(
+        60, 7200, 499)])
+    index = pd.Timestamp("2021-01-01") + pd.to_timedelta(seconds, unit="s")
+    temp_steady = pd.Series(
+        25 + 15 * np.sin(np.linspace(0, 20, 500)), index=index)
+    temp_mod = energy_rating.transient_temperature(temp_steady, tau=600.)
+    np.testing.assert_allclose(temp_mod.values,
+                               _recursion(temp_steady, 600.), rtol=1e-10)
+
+
+def test_gap_restarts():
+    index = pd.date_range("2021-01-01", periods=6, freq="H")
+    temp_steady = pd.Series([20., 21., np.nan, 23., 24., 25.], index=index)
+    temp_mod = energy_rating.transient_temperature(temp_steady, tau=600.)
+    a = np.exp(-6)
+    expected = [20., a * 20 + (1 - a) * 21, np.nan, 23.,
+                a * 23 + (1 - a) * 24,
+                a * (a * 23 + (1 - a) * 24) + (1 - a) * 25]
+    np.testing.assert_allclose(temp_mod.values, expected, rtol=1e-12)
+
+
+def test_steady_state():
+    index = pd.date_range("2021-01-01", periods=3, freq="H")
+    temp_steady = pd.Series([20., 30., 40.], index=index)
+    assert temp_steady.equals(
+        energy_rating.transient_temperature(temp_steady, tau=0))
+
+
+def _get_gap_climate():
+    climate, pv_tilt, climate_data = equivalence.get_climates()[3]
+    climate_data = climate_data.copy()
+    start = climate_data.index.get_loc(climate_data.index[
+        (climate_data.index.month == 6) & (climate_data.index.day == 10)
+        & (climate_data.index.hour == 12)][0])
+    climate_data.iloc[start:start + 3,
+                      climate_data.columns.get_loc("T_amb")] = np.nan
+    climate_data.iloc[start + 10,
+                      climate_data.columns.get_loc("wind")] = np.nan
+    return pv_tilt, climate_data, start
+
+
+def test_pipeline_gap_restarts():
+    # Module with an ETA for all the hours of the climate
+    module = multi_site.get_module_characterisation(glob.glob(join(
+        equivalence.EXAMPLE_FOLDER, "*Trinasolar*.txt"))[0])
+    pv_tilt, climate_data, start = _get_gap_climate()
+    steady = equivalence.run_steps(climate_data, module, pv_tilt, None)[2]
+    transient = equivalence.run_steps(climate_data, module, pv_tilt,
+                                      300.)[2]
+    index = climate_data.index
+    # The gaps are left out with thermal inertia only
+    gaps = index[[start, start + 1, start + 2, start + 10]]
+    assert gaps.isin(steady.index).all()
+    assert not gaps.isin(transient.index).any()
+    # The filter restarts from the steady-state temperature after the gap
+    assert transient.at[index[start + 3], "T_mod"] == pytest.approx(
+        steady.at[index[start + 3], "T_mod"], rel=1e-12)
+    assert transient.at[index[start + 4], "T_mod"] != pytest.approx(
+        steady.at[index[start + 4], "T_mod"], rel=1e-9)
+    # Missing values of the climate taken as 0 °C without thermal inertia
+    assert np.isnan(climate_data["T_amb"].iloc[start])
+    assert steady.at[index[start], "T_amb"] == 0
+
+
+@pytest.mark.parametrize("engine", list(equivalence.ENGINES))
+def test_engines_gap(example_file, engine):
+    module = multi_site.get_module_characterisation(example_file)
+    pv_tilt, climate_data, start = _get_gap_climate()
+    cser, eta_avg, sim_df = equivalence.run_steps(climate_data, module,
+                                                  pv_tilt, 300.)
+    e_cser, e_eta_avg, e_df = equivalence.ENGINES[engine](
+        climate_data, module, pv_tilt, 300.)
+    assert e_cser == pytest.approx(cser, rel=equivalence.RTOL)
+    assert e_eta_avg == pytest.approx(eta_avg, rel=equivalence.RTOL)
+    if e_df is not None:
+        assert equivalence.compare_hourly(sim_df, e_df)[0]
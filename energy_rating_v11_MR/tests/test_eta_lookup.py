@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the dense ETA lookup surface (eta_lookup.py).
+
+@author: mriveraa
+"""
+import numpy as np
+# Importing the IEC91853 standard's code
+import pvpltools_python.pvpltools.iec61853 as std
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+# Importing read functions
+import read_functions
+# Importing the dense ETA lookup
+import eta_lookup
+
+
+def _get_eta_matrix(path):
+    power_matrix, module_area = read_functions.read_callab_stdfile(
+        path=path)[2:7:4]
+    return energy_rating.get_eta_interpolation(
+        module_df=power_matrix, module_area=module_area, eta_calc=False)[2]
+
+
+def test_error_bound(example_file):
+    eta_matrix = _get_eta_matrix(example_file)
+    lookup = eta_lookup.get_eta_lookup(eta_matrix, g_step=5, t_step=0.5)
+    exact = std.BilinearInterpolator(
+        matrix=eta_lookup.fill_matrix_gaps(eta_matrix))
+    rng = np.random.default_rng(0)
+    g = rng.uniform(0, 1500, 20000)
+    t = rng.uniform(-30, 90, 20000)
+    error = np.abs(lookup(g, t) - exact(g, t))
+    assert np.nanmax(error) <= lookup.error_bound
+    # The gaps of the matrix are filled
+    assert not np.isnan(lookup(g, t)).any()
+    # Exact at the nodes of the table, besides the float32 rounding
+    np.testing.assert_allclose(lookup([200., 800.], [25., 50.]),
+                               exact([200., 800.], [25., 50.]), rtol=1e-6)
+
+
+def test_finer_table_smaller_bound(example_file):
+    eta_matrix = _get_eta_matrix(example_file)
+    coarse = eta_lookup.get_eta_lookup(eta_matrix, g_step=20, t_step=2)
+    fine = eta_lookup.get_eta_lookup(eta_matrix, g_step=5, t_step=0.5)
+    assert fine.error_bound < coarse.error_bound
+
+
+def test_cache(example_file):
+    eta_matrix = _get_eta_matrix(example_file)
+    lookup = eta_lookup.get_eta_lookup(eta_matrix)
+    assert eta_lookup.get_eta_lookup(eta_matrix.copy()) is lookup
+    assert eta_lookup.get_eta_lookup(eta_matrix, g_step=10) is not lookup
+
+
+def test_missing_values(example_file):
+    eta_matrix = _get_eta_matrix(example_file)
+    lookup = eta_lookup.get_eta_lookup(eta_matrix)
+    eta_rel = lookup([np.nan, 500.], [25., np.nan])
+    assert np.isnan(eta_rel).all()
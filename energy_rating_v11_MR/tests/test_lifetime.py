@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the lifetime energy projection (lifetime.py).
+
+@author: mriveraa
+"""
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+# Importing the lifetime energy projection
+import lifetime
+# Importing the equivalence harness
+import equivalence
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the Energy Rating main function
+import run_main
+from conftest import EXAMPLE_FILES
+
+SCENARIOS = pd.DataFrame({"lid": [0.02, 0.01, 0.0],
+                          "rate": [0.005, 0.005, 0.008],
+                          "model": ["linear", "compound", "two-step"],
+                          "rate_2": [np.nan, np.nan, 0.003],
+                          "knee": [np.nan, np.nan, 10]},
+                         index=pd.Index(["linear", "compound", "two-step"],
+                                        name="scenario"))
+
+
+def test_degradation_factors():
+    factors = lifetime.get_degradation_factors(SCENARIOS, years=25)
+    assert factors.shape == (3, 25)
+    np.testing.assert_allclose(factors[1], 1 - SCENARIOS["lid"])
+    assert np.isclose(factors.loc["linear", 25], 0.98 * (1 - 0.005 * 24))
+    assert np.isclose(factors.loc["compound", 25], 0.99 * 0.995 ** 24)
+    # Two-step: first rate until year 10, second rate afterwards
+    assert np.isclose(factors.loc["two-step", 10], 1 - 0.008 * 9)
+    assert np.isclose(factors.loc["two-step", 25],
+                      1 - 0.008 * 9 - 0.003 * 15)
+    assert (np.diff(factors.values, axis=1) <= 0).all()
+    with pytest.raises(ValueError):
+        lifetime.get_degradation_factors(
+            SCENARIOS.assign(model="exponential"))
+
+
+def test_first_year_energy(example_file):
+    # The energy from the CSER is the energy of the simulated year
+    module = multi_site.get_module_characterisation(example_file)
+    climate, pv_tilt, climate_data = equivalence.get_climates()[2]
+    cser, eta_avg, sim_df = equivalence.run_steps(climate_data, module,
+                                                  pv_tilt, None)
+    energy = lifetime.get_first_year_energy(
+        cser=cser, irradiation=sim_df["G_tlt"].sum(), pnom=module["pnom"])
+    assert np.isclose(energy, sim_df["Pout"].sum() / 1000, rtol=1e-12)
+
+
+def test_projection():
+    first_year = pd.Series([500.0, 800.0], index=["a", "b"])
+    factors = lifetime.get_degradation_factors(SCENARIOS, years=20)
+    annual = lifetime.project_lifetime(first_year, factors)
+    assert annual.shape == (3 * 20, 2)
+    # Year 1 is the simulated year with LID
+    np.testing.assert_allclose(
+        annual.xs(1, level="year").values,
+        np.outer(1 - SCENARIOS["lid"], first_year))
+    total = lifetime.get_lifetime_energy(first_year, factors)
+    pd.testing.assert_frame_equal(total, annual.groupby(level=0).sum()
+                                  .loc[total.index], check_names=False)
+    discounted = lifetime.get_lifetime_energy(first_year, factors,
+                                              discount_rate=0.05)
+    assert (discounted < total).all().all()
+    assert np.isclose(discounted.loc["linear", "a"],
+                      (annual["a"].loc["linear"]
+                       / 1.05 ** np.arange(1, 21)).sum())
+
+
+def test_simulation_er(tmp_path):
+    # Lifetime energy of the standard climates from the main function
+    shutil.copy(EXAMPLE_FILES[0], tmp_path)
+    run_main.simulation_er(str(tmp_path), plot_mode="binned",
+                           degradation=SCENARIOS, lifetime_years=10)
+    total = pd.read_excel(tmp_path / "results" / "results_lifetime.xlsx",
+                          sheet_name="Lifetime", index_col=[0, 1])
+    assert total.shape == (6, 3)
+    assert list(total.columns) == list(SCENARIOS.index)
+    # Energy of the simulated year times the sum of the factors
+    module = multi_site.get_module_characterisation(EXAMPLE_FILES[0])
+    climate, pv_tilt, climate_data = equivalence.get_climates()[0]
+    energy = equivalence.run_steps(climate_data, module, pv_tilt,
+                                   None)[2]["Pout"].sum() / 1000
+    factors = lifetime.get_degradation_factors(SCENARIOS, years=10)
+    np.testing.assert_allclose(total.loc[(module["int_id"], climate)],
+                               energy * factors.sum(axis=1), rtol=1e-9)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the multi-site Energy Rating (multi_site.py).
+
+@author: mriveraa
+"""
+import shutil
+from os.path import join
+import pandas as pd
+import pytest
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing read functions
+import read_functions
+# Importing the equivalence harness
+import equivalence
+from conftest import EXAMPLE_FILES
+
+
+def _write_index(folder, locations=(3, 0), **columns):
+    rows = []
+    for location in locations:
+        std_location = read_functions.read_standard_locations(location)
+        rows.append({"site_id": "site_%d" % location,
+                     "file": join(equivalence.FOLDER, "the_standard",
+                                  std_location["loc"]),
+                     "lat": std_location["site_lat"],
+                     "lon": std_location["site_lon"],
+                     "pv_tilt": std_location["pv_tilt"]})
+    sites = pd.DataFrame(rows).assign(**columns)
+    path = join(folder, "index.csv")
+    sites.to_csv(path, index=False)
+    return path
+
+
+@pytest.mark.parametrize("kwargs", [{"workers": 1},
+                                    {"workers": 2, "threads": True},
+                                    {"workers": 1, "fused": True}])
+def test_rate_sites(tmp_path, kwargs):
+    sites = multi_site.read_site_index(_write_index(str(tmp_path)))
+    results = multi_site.rate_sites(sites, EXAMPLE_FILES, chunk_size=1,
+                                    **kwargs)
+    assert len(results) == 4
+    climates = dict(zip(["site_3", "site_0"], [
+        equivalence.get_climates()[location] for location in (3, 0)]))
+    for path in EXAMPLE_FILES:
+        module = multi_site.get_module_characterisation(path)
+        for site_id, (climate, pv_tilt, climate_data) in climates.items():
+            cser, eta_avg = equivalence.run_steps(climate_data, module,
+                                                  pv_tilt, None)[:2]
+            row = results[(results["site_id"] == site_id)
+                          & (results["Internal_ID"] == module["int_id"])]
+            assert row["cser"].iloc[0] == pytest.approx(cser, rel=1e-8)
+            assert row["eta_avg"].iloc[0] == pytest.approx(eta_avg,
+                                                           rel=1e-8)
+    site_table = multi_site.get_site_table(results, sites)
+    assert list(site_table.index) == ["site_3", "site_0"]
+    assert list(site_table.columns) == ["lat", "lon"] + [
+        "cser_%s" % multi_site.get_module_characterisation(path)["int_id"]
+        for path in EXAMPLE_FILES]
+
+
+def test_repeated_module(tmp_path):
+    sites = multi_site.read_site_index(_write_index(str(tmp_path)))
+    copy = str(tmp_path / "copy.txt")
+    shutil.copy(EXAMPLE_FILES[0], copy)
+    with pytest.raises(ValueError, match="copy.txt"):
+        multi_site.rate_sites(sites, EXAMPLE_FILES + [copy], workers=1)
+    results = pd.DataFrame({"site_id": ["site_3", "site_3"],
+                            "Internal_ID": ["a", "a"],
+                            "cser": [0.9, 0.91], "eta_avg": [0.2, 0.2]})
+    with pytest.raises(ValueError, match="Internal_ID"):
+        multi_site.get_site_table(results, sites)
+
+
+def test_site_index(tmp_path):
+    with pytest.warns(UserWarning, match="pv_azimuth"):
+        sites = multi_site.read_site_index(
+            _write_index(str(tmp_path), pv_azimuth=90))
+    assert "pv_azimuth" not in sites
+    with pytest.raises(ValueError, match="site_3"):
+        multi_site.read_site_index(_write_index(str(tmp_path),
+                                                locations=(3, 3)))
+    pd.DataFrame({"site_id": [1], "file": ["a.csv"]}).to_csv(
+        str(tmp_path / "index.csv"), index=False)
+    with pytest.raises(ValueError, match="lat, lon"):
+        multi_site.read_site_index(str(tmp_path / "index.csv"))
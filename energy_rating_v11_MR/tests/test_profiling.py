@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the profiling mode (profiling.py).
+
+@author: mriveraa
+"""
+import glob
+import os
+import re
+import socket
+from os.path import basename, join
+import numpy as np
+import pandas as pd
+import pytest
+# Importing the profiling mode
+import profiling
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing read functions
+import read_functions
+# Importing the equivalence harness
+import equivalence
+from conftest import EXAMPLE_FILES
+
+
+def _work():
+    return np.sort(np.random.default_rng(0).random(10**5)).sum()
+
+
+@pytest.fixture(scope="module")
+def profile_dir(tmp_path_factory):
+    # Two sites rated with profiling by two threads
+    folder = tmp_path_factory.mktemp("profile")
+    rows = []
+    for location in (3, 0):
+        std_location = read_functions.read_standard_locations(location)
+        rows.append({"site_id": "site %d" % location,
+                     "file": join(equivalence.FOLDER, "the_standard",
+                                  std_location["loc"]),
+                     "lat": std_location["site_lat"],
+                     "lon": std_location["site_lon"],
+                     "pv_tilt": std_location["pv_tilt"]})
+    pd.DataFrame(rows).to_csv(folder / "index.csv", index=False)
+    sites = multi_site.read_site_index(str(folder / "index.csv"))
+    multi_site.rate_sites(sites, EXAMPLE_FILES, workers=2, threads=True,
+                          chunk_size=1, profile_dir=str(folder / "prof"))
+    return str(folder / "prof")
+
+
+def test_profile_path():
+    path = profiling.get_profile_path("prof", "Module A/1", "Temperate "
+                                      "coastal", worker="node:1")
+    assert basename(path) == "Module_A_1__Temperate_coastal__node_1.prof"
+    # Host name and process id by default
+    worker = basename(profiling.get_profile_path("prof", "a", "b"))
+    assert worker.split("__")[2] == "%s-%d.prof" % (
+        re.sub(r"[^\w.-]+", "_", socket.gethostname()), os.getpid())
+
+
+def test_profile(tmp_path):
+    with profiling.profile(None):
+        _work()
+    assert not os.listdir(tmp_path)
+    path = str(tmp_path / "sub" / "work.prof")
+    with profiling.profile(path):
+        _work()
+    stats = profiling.merge_profiles([path])
+    assert any(function[2] == "_work" for function in stats.stats)
+    with pytest.raises(ValueError):
+        profiling.merge_profiles([])
+
+
+def test_dumps(profile_dir):
+    # One dump per module and site, and one of each climate
+    names = [basename(path).split("__")[:2]
+             for path in glob.glob(join(profile_dir, "*.prof"))]
+    modules = [multi_site.get_module_characterisation(path)["int_id"]
+               for path in EXAMPLE_FILES]
+    expected = sorted([module, site] for module in modules + ["climate"]
+                      for site in ("site_3", "site_0"))
+    assert sorted(names) == expected
+
+
+def test_report(profile_dir):
+    hot_functions = profiling.write_profile_report(profile_dir, n=20)
+    assert len(hot_functions) == 20
+    assert (np.diff(hot_functions["tottime"]) <= 0).all()
+    for name in ["hot_functions.txt", "profile.collapsed", "merged.prof"]:
+        assert os.path.isfile(join(profile_dir, name))
+    with open(join(profile_dir, "hot_functions.txt"),
+              encoding="utf-8") as file:
+        assert file.readline().startswith("%d dumps, %d modules"
+                                          % (3 * 2, len(EXAMPLE_FILES)))
+    # The collapsed stacks keep the time of the merged dumps and go
+    # through the simulation
+    stats = profiling.merge_profiles([join(profile_dir, "merged.prof")])
+    stacks = profiling.get_collapsed_stacks(stats)
+    assert sum(stacks.values()) / 1e6 == pytest.approx(stats.total_tt,
+                                                       rel=0.05)
+    assert any("ersim_dc_daylight" in stack for stack in stacks)
+    with open(join(profile_dir, "profile.collapsed"),
+              encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    assert len(lines) == len(stacks)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    # A second report does not merge the merged dump again
+    profiling.write_profile_report(profile_dir, n=20)
+    with open(join(profile_dir, "hot_functions.txt"),
+              encoding="utf-8") as file:
+        assert file.readline().startswith("%d dumps" % (3 * 2))
+
+
+def test_package():
+    assert profiling.get_package((np.__file__, 1, "sum")) == "numpy"
+    assert profiling.get_package(
+        ("~", 0, "<method 'copy' of 'numpy.ndarray' objects>")) == "numpy"
+    assert profiling.get_package(("~", 0, "<built-in method len>")) == \
+        "builtin"
+    assert profiling.get_package((profiling.__file__, 1, "profile")) == "er"
+    assert profiling.get_package(("/usr/lib/python3/json/decoder.py", 1,
+                                  "decode")) == "other"
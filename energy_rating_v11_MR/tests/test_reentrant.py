@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the reentrant engine and the thread-pool batch mode: no mutation of
+the inputs, no dependence on the working directory and the same results in
+threads as in series.
+
+@author: mriveraa
+"""
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+import numpy as np
+import pandas as pd
+import pytest
+# Importing the Energy rating functions
+import energy_rating_functions as energy_rating
+# Importing read functions
+import read_functions
+# Importing the dense ETA lookup table
+import eta_lookup
+# Importing the equivalence harness
+import equivalence
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the Energy Rating main function
+import run_main
+from conftest import EXAMPLE_FILES
+
+
+@pytest.fixture(scope="module")
+def modules():
+    return [multi_site.get_module_characterisation(path)
+            for path in EXAMPLE_FILES]
+
+
+@pytest.fixture(scope="module")
+def climates():
+    return equivalence.get_climates()
+
+
+def _copy_module(module):
+    # Deep copy of the tables of a module characterisation
+    return {key: value.copy(deep=True)
+            if isinstance(value, (pd.DataFrame, pd.Series)) else value
+            for key, value in module.items()}
+
+
+def _assert_module_equal(module, expected):
+    for key, value in expected.items():
+        if isinstance(value, pd.DataFrame):
+            pd.testing.assert_frame_equal(module[key], value)
+        elif isinstance(value, pd.Series):
+            pd.testing.assert_series_equal(module[key], value)
+
+
+def test_power_matrix_unchanged(modules):
+    # The ETA interpolation does not write into the CalLab matrix
+    (mod_parameters, spec_resp, power_matrix, a_r, u0, u1, module_area,
+     tech, int_id) = read_functions.read_callab_stdfile(EXAMPLE_FILES[0])
+    expected = power_matrix.copy()
+    energy_rating.get_eta_interpolation(module_df=power_matrix,
+                                        module_area=module_area,
+                                        eta_calc=False)
+    prepared = energy_rating.prepare_power_matrix(module_df=power_matrix,
+                                                  module_area=module_area,
+                                                  eta_calc=False)
+    pd.testing.assert_frame_equal(power_matrix, expected)
+    assert {"eta", "g_round", "t_round"} <= set(prepared.columns)
+    assert prepared is not power_matrix
+
+
+def test_climate_unchanged(modules, climates):
+    # Neither the steps nor the whole simulation change the climate
+    climate, pv_tilt, climate_data = climates[0]
+    expected = climate_data.copy()
+    module = modules[0]
+    expected_module = _copy_module(module)
+    climate_df = energy_rating.aoi_correction(climate_df=climate_data,
+                                              a_r=module["a_r"],
+                                              pv_tilt=pv_tilt)
+    climate_df = energy_rating.bifacial_correction(
+        climate_df=climate_df, a_r=module["a_r"], albedo=0.2,
+        bifaciality=0.7, pv_tilt=pv_tilt)
+    climate_df = energy_rating.spec_correction(
+        climate_df=climate_df, spec_resp_factor=module["spec_resp"])
+    after_spec = climate_df.copy()
+    climate_df = energy_rating.temp_correction(climate_df=climate_df,
+                                               u0=module["u0"],
+                                               u1=module["u1"], tau=300.)
+    pd.testing.assert_frame_equal(climate_df[after_spec.columns],
+                                  after_spec)
+    energy_rating.module_power_er(climate_df=climate_df,
+                                  eta_interpolated=module["eta_interpolated"],
+                                  power_matrix=module["power_matrix"],
+                                  module_area=module["module_area"])
+    for engine in [equivalence.run_steps] + list(
+            equivalence.ENGINES.values()):
+        engine(climate_data, module, pv_tilt, 300.)
+    pd.testing.assert_frame_equal(climate_data, expected)
+    _assert_module_equal(module, expected_module)
+    # Renaming gives a new DataFrame
+    raw = read_functions.read_climate_locs(
+        folder_locations="the_standard",
+        loc_name=read_functions.read_standard_locations(0)["loc"])
+    columns = list(raw.columns)
+    renamed = read_functions.change_names_climate_df(raw)
+    assert list(raw.columns) == columns
+    assert list(renamed.columns) != columns
+
+
+def test_threads_equal_serial(modules, climates):
+    # The same modules and climates shared by threads give the serial
+    # results of every engine
+    engines = [equivalence.run_steps] + list(equivalence.ENGINES.values())
+    tasks = [(engine, climate_data, module, pv_tilt)
+             for engine in engines
+             for climate, pv_tilt, climate_data in climates[:2]
+             for module in modules]
+    expected_modules = [_copy_module(module) for module in modules]
+
+    def run(task):
+        engine, climate_data, module, pv_tilt = task
+        return engine(climate_data, module, pv_tilt, None)[:2]
+
+    serial = [run(task) for task in tasks]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        threaded = list(executor.map(run, tasks))
+    assert threaded == serial
+    for module, expected in zip(modules, expected_modules):
+        _assert_module_equal(module, expected)
+
+
+def test_lookup_threads(modules):
+    # The cached lookup table is built once for concurrent requests
+    eta_matrix = energy_rating.get_eta_interpolation(
+        module_df=modules[1]["power_matrix"],
+        module_area=modules[1]["module_area"], eta_calc=False)[2]
+    eta_lookup._lookup_cache.clear()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        tables = list(executor.map(
+            lambda _: eta_lookup.get_eta_lookup(eta_matrix), range(8)))
+    assert len(eta_lookup._lookup_cache) == 1
+    cached = next(iter(eta_lookup._lookup_cache.values()))
+    g = np.array([100.0, 500.0, 1000.0])
+    t = np.array([20.0, 35.0, 50.0])
+    for table in tables:
+        np.testing.assert_array_equal(table(g, t), cached(g, t))
+
+
+@pytest.mark.parametrize("fused", [False, True])
+def test_rate_sites_threads(tmp_path, fused):
+    rows = []
+    for location in range(6):
+        std_location = read_functions.read_standard_locations(location)
+        rows.append({"site_id": "site_%d" % location,
+                     "file": join(equivalence.FOLDER, "the_standard",
+                                  std_location["loc"]),
+                     "lat": std_location["site_lat"],
+                     "lon": std_location["site_lon"],
+                     "pv_tilt": std_location["pv_tilt"]})
+    pd.DataFrame(rows).to_csv(tmp_path / "index.csv", index=False)
+    sites = multi_site.read_site_index(str(tmp_path / "index.csv"))
+    serial = multi_site.rate_sites(sites, EXAMPLE_FILES, workers=1,
+                                   fused=fused)
+    threaded = multi_site.rate_sites(sites, EXAMPLE_FILES, workers=3,
+                                     threads=True, chunk_size=1, fused=fused)
+    columns = ["site_id", "Internal_ID"]
+    pd.testing.assert_frame_equal(
+        threaded.sort_values(columns).reset_index(drop=True),
+        serial.sort_values(columns).reset_index(drop=True))
+
+
+def test_working_directory(tmp_path):
+    # The main function does not change the working directory and does not
+    # depend on it
+    shutil.copy(EXAMPLE_FILES[0], tmp_path)
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        run_main.simulation_er(str(tmp_path), plot_mode="binned")
+        assert os.getcwd() == str(tmp_path)
+    finally:
+        os.chdir(cwd)
+    assert os.path.isfile(tmp_path / "results" / "results_cser_eta.xlsx")
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the results database (results_db.py).
+
+@author: mriveraa
+"""
+import sqlite3
+import pandas as pd
+import pytest
+# Importing the results database
+import results_db
+# Importing read functions
+import read_functions
+
+CLIMATES = ["Tropical humid", "Temperate coastal"]
+
+
+@pytest.fixture
+def module(example_file):
+    mod_parameters = read_functions.read_callab_stdfile(example_file)[0]
+    return example_file, mod_parameters
+
+
+def _write(db_path, module, cser, settings=""):
+    path, mod_parameters = module
+    results_db.write_module_results(
+        db_path=db_path, mod_parameters=mod_parameters, climates=CLIMATES,
+        cser=cser, eta_avg=[0.2, 0.2],
+        input_hash=results_db.get_input_hash(path, settings=settings),
+        settings=settings)
+
+
+def test_settings():
+    assert results_db.get_rating_settings() == ""
+    assert results_db.get_rating_settings(
+        engine="fused", eta_model="hey", lookup_steps=(5, 0.5), tau=420,
+        bifaciality=0.7) == \
+        "engine=fused;eta_model=hey;tau=420.0;bifaciality=0.7;albedo=0.2"
+    assert results_db.get_rating_settings(lookup_steps=(5, 0.5)) == \
+        "lookup_steps=5.0,0.5"
+
+
+def test_settings_kept_apart(tmp_path, module):
+    db_path = str(tmp_path / "results.db")
+    settings = results_db.get_rating_settings(eta_model="hey", tau=420)
+    _write(db_path, module, [0.95, 0.97])
+    _write(db_path, module, [0.90, 0.92], settings=settings)
+    int_id = str(module[1]["Internal_ID"].iloc[0])
+    history = results_db.get_module_history(db_path, int_id)
+    # Two rows per climate, one per settings
+    assert len(history) == 4
+    assert sorted(history["settings"].unique()) == ["", settings]
+    # The rankings only compare ratings with the same settings
+    top = results_db.get_top_modules(db_path, "Temperate coastal")
+    assert list(top["cser"]) == [0.97]
+    top = results_db.get_top_modules(db_path, "Temperate coastal",
+                                     settings=settings)
+    assert list(top["cser"]) == [0.92]
+    distribution = results_db.get_technology_distribution(
+        db_path, climate="Tropical humid", settings=settings)
+    assert distribution["mean"].iloc[0] == pytest.approx(0.90)
+
+
+def test_same_settings_replaced(tmp_path, module):
+    db_path = str(tmp_path / "results.db")
+    _write(db_path, module, [0.95, 0.97])
+    _write(db_path, module, [0.96, 0.98])
+    history = results_db.get_module_history(
+        db_path, str(module[1]["Internal_ID"].iloc[0]))
+    assert sorted(history["cser"]) == [0.96, 0.98]
+
+
+def test_older_file(tmp_path, module):
+    # Database written before the settings were stored
+    db_path = str(tmp_path / "results.db")
+    con = sqlite3.connect(db_path)
+    con.executescript(results_db._SCHEMA.replace(
+        "    settings TEXT NOT NULL DEFAULT '',\n", ""))
+    con.close()
+    _write(db_path, module, [0.95, 0.97])
+    top = results_db.get_top_modules(db_path, "Tropical humid")
+    assert isinstance(top, pd.DataFrame) and list(top["cser"]) == [0.95]
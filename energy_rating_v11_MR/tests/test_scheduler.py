@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the pre-flight memory estimate and the batch scheduler
+(scheduler.py).
+
+@author: mriveraa
+"""
+import shutil
+from os.path import join
+import numpy as np
+import pandas as pd
+import pytest
+# Importing the batch scheduler
+import scheduler
+# Importing the equivalence harness
+import equivalence
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the Energy Rating main function
+import run_main
+from conftest import EXAMPLE_FILES
+
+SIZE = {"n_steps": 8760, "n_bands": 29}
+
+
+def test_climate_size():
+    path = join(equivalence.FOLDER, "the_standard",
+                "enra_temperate_coastal.csv")
+    assert scheduler.get_climate_size(path) == (8760, 29)
+
+
+def test_estimate_grows():
+    base = scheduler.estimate_memory(n_modules=10, n_climates=6, **SIZE)
+    assert base["worker"] == base[["process", "modules", "climates",
+                                   "simulation", "outputs",
+                                   "results"]].sum()
+    assert base["total"] == base["worker"]
+    for kwargs in [{"n_modules": 1000}, {"n_climates": 600,
+                                         "cached_climates": 600},
+                   {"n_steps": 8760 * 6}, {"outputs": ["frames", "plots"]},
+                   {"outputs": ["tables"]}, {"workers": 4},
+                   {"chunk_size": 50}]:
+        memory = scheduler.estimate_memory(**dict(
+            {"n_modules": 10, "n_climates": 6}, **dict(SIZE, **kwargs)))
+        assert memory["total"] > base["total"], kwargs
+    # The fused kernel keeps fewer copies of the climate
+    fused = scheduler.estimate_memory(n_modules=10, n_climates=6, fused=True,
+                                      **SIZE)
+    assert fused["simulation"] < base["simulation"]
+    with pytest.raises(ValueError):
+        scheduler.estimate_memory(n_modules=1, n_climates=1,
+                                  outputs=["maps"], **SIZE)
+
+
+@pytest.mark.parametrize("memory_budget", [0.5e9, 2e9, 8e9])
+def test_plan_fits(memory_budget):
+    plan = scheduler.plan_batch(n_modules=100, n_climates=1000,
+                                memory_budget=memory_budget, max_workers=16,
+                                **SIZE)
+    assert plan["memory"]["total"] <= memory_budget
+    assert 1 <= plan["workers"] <= 16
+    # One more worker does not fit
+    if plan["workers"] < 16:
+        memory = scheduler.estimate_memory(
+            n_modules=100, n_climates=1000, workers=plan["workers"] + 1,
+            chunk_size=1, **SIZE)
+        assert memory["total"] > memory_budget
+    # A larger budget does not give fewer workers
+    larger = scheduler.plan_batch(n_modules=100, n_climates=1000,
+                                  memory_budget=2 * memory_budget,
+                                  max_workers=16, **SIZE)
+    assert larger["workers"] >= plan["workers"]
+
+
+def test_plan_tasks():
+    # The chunks are split by tasks (CalLab files of "simulation_er")
+    plan = scheduler.plan_batch(n_modules=1, n_climates=6,
+                                memory_budget=8e9, max_workers=4,
+                                cached_climates=6, n_tasks=40, **SIZE)
+    assert plan["workers"] == 4
+    assert plan["chunk_size"] == 40 // (4 * scheduler.TASKS_PER_WORKER) + 1
+    assert scheduler.plan_batch(n_modules=1, n_climates=6,
+                                memory_budget=8e9, max_workers=4,
+                                n_tasks=2, **SIZE)["workers"] == 2
+    with pytest.raises(ValueError):
+        scheduler.plan_batch(n_modules=1, n_climates=6, memory_budget=1e8,
+                             **SIZE)
+
+
+def test_batch_size():
+    batch = scheduler.get_batch_size(memory_budget=0.5e9, max_batch=10**6,
+                                     **SIZE)
+    assert 1 <= batch < 10**6
+    assert scheduler.estimate_memory(n_modules=batch, n_climates=1,
+                                     **SIZE)["total"] <= 0.5e9
+    assert scheduler.get_batch_size(memory_budget=0.5e9, max_batch=8,
+                                    **SIZE) == 8
+    with pytest.raises(ValueError):
+        scheduler.get_batch_size(memory_budget=1e8, max_batch=8, **SIZE)
+
+
+def test_simulation_er(tmp_path):
+    # CalLab files in chunks of two worker processes within the budget
+    for path in EXAMPLE_FILES:
+        shutil.copy(path, tmp_path)
+    with pytest.raises(ValueError):
+        run_main.simulation_er(str(tmp_path), memory_budget=1e8)
+    run_main.simulation_er(str(tmp_path), plot_mode="binned",
+                           memory_budget=2e9, max_workers=2)
+    sheet = pd.read_excel(tmp_path / "results" / "results_cser_eta.xlsx",
+                          sheet_name="Results", header=None)
+    cser = sheet.iloc[2:8, 2:].astype(float)
+    cser.columns = sheet.iloc[1, 2:]
+    climates = equivalence.get_climates()
+    for path in EXAMPLE_FILES:
+        module = multi_site.get_module_characterisation(path)
+        expected = [equivalence.run_steps(climate_data, module, pv_tilt,
+                                          None)[0]
+                    for climate, pv_tilt, climate_data in climates]
+        np.testing.assert_allclose(cser["cser_%s" % module["int_id"]],
+                                   expected, rtol=1e-12)
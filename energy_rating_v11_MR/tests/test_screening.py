@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the two-tier screening (screening.py).
+
+@author: mriveraa
+"""
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+# Importing the two-tier screening
+import screening
+# Importing the synthetic data generator
+import synthetic
+# Importing the equivalence harness
+import equivalence
+# Importing the multi-site Energy Rating
+import multi_site
+
+N_MODULES = 30
+N_TOP = 5
+
+
+def _without_alpha(module):
+    # Module with only the measurement at 25 °C at 1000 W/m², without the
+    # temperature coefficient of the surrogate
+    power_matrix = module["power_matrix"]
+    other = ((power_matrix["gmean"].round(decimals=-2) == 1000)
+             & ((power_matrix["temp"] / 5).round() * 5 != 25))
+    return dict(module, power_matrix=power_matrix[~other])
+
+
+@pytest.fixture(scope="module")
+def batch(tmp_path_factory):
+    # Synthetic batch in one climate, with the exhaustive ranking of the
+    # reference steps
+    folder = str(tmp_path_factory.mktemp("screening"))
+    modules = [multi_site.get_module_characterisation(path)
+               for path in synthetic.write_modules(folder, N_MODULES,
+                                                   seed=11)]
+    climate, pv_tilt, climate_data = equivalence.get_climates()[1]
+    exhaustive = pd.Series(
+        [equivalence.run_steps(climate_data, module, pv_tilt, None)[0]
+         for module in modules],
+        index=[module["int_id"] for module in modules]).sort_values(
+            ascending=False)
+    return modules, pv_tilt, climate_data, exhaustive
+
+
+def test_screen_exhaustive(batch):
+    modules, pv_tilt, climate_data, exhaustive = batch
+    calibration = screening.calibrate_margin(climate_data, modules[:10],
+                                             pv_tilt=pv_tilt)
+    assert calibration["skipped"].empty
+    result = screening.screen(climate_data, modules, n_top=N_TOP,
+                              margin=calibration["margin"],
+                              bias=calibration["bias"], pv_tilt=pv_tilt)
+    ranking = result["ranking"]
+    assert list(ranking.index) == list(range(1, N_TOP + 1))
+    assert list(ranking["Internal_ID"]) == list(exhaustive.index[:N_TOP])
+    np.testing.assert_allclose(ranking["cser"], exhaustive.values[:N_TOP],
+                               rtol=1e-9)
+    assert result["violations"] == 0
+    assert result["unbounded"].empty
+    assert result["n_simulated"] == result["surrogate"]["contender"].sum()
+    assert N_TOP <= result["n_simulated"] < N_MODULES
+
+
+def test_screen_unbounded(batch):
+    # The best module and a module out of the top without the measurements
+    # of the surrogate are simulated and ranked as the others
+    modules, pv_tilt, climate_data, exhaustive = batch
+    ids = [module["int_id"] for module in modules]
+    stripped = {exhaustive.index[0], exhaustive.index[-1]}
+    modules = [_without_alpha(module) if module["int_id"] in stripped
+               else module for module in modules]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = screening.screen(climate_data, modules, n_top=N_TOP,
+                                  margin=0.01, pv_tilt=pv_tilt)
+    assert set(result["unbounded"]["Internal_ID"]) == stripped
+    surrogate = result["surrogate"].set_index("Internal_ID").loc[ids]
+    unbounded = surrogate.index.isin(stripped)
+    assert surrogate.loc[unbounded, "contender"].all()
+    assert surrogate.loc[unbounded, ["cser_surrogate", "lower",
+                                     "upper"]].isna().all().all()
+    # The cutoff is the "n_top"-th lower bound of the bounded modules
+    assert result["cutoff"] == np.sort(
+        surrogate.loc[~unbounded, "lower"].values)[::-1][N_TOP - 1]
+    assert list(result["ranking"]["Internal_ID"]) == \
+        list(exhaustive.index[:N_TOP])
+    # All the modules without the measurements of the surrogate
+    result = screening.screen(climate_data,
+                              [_without_alpha(module)
+                               for module in modules[:3]],
+                              n_top=2, pv_tilt=pv_tilt)
+    assert result["n_simulated"] == 3
+    assert result["cutoff"] == -np.inf
+    assert list(result["ranking"]["Internal_ID"]) == list(
+        exhaustive.loc[ids[:3]].sort_values(ascending=False).index[:2])
+    # Without the measurement at STC the module cannot be simulated either
+    power_matrix = modules[0]["power_matrix"]
+    stc = ((power_matrix["gmean"].round(decimals=-2) == 1000)
+           & ((power_matrix["temp"] / 5).round() * 5 == 25))
+    with pytest.raises(ValueError):
+        screening.screen(climate_data, [dict(modules[0],
+                                             power_matrix=power_matrix[~stc])],
+                         n_top=1, pv_tilt=pv_tilt)
+
+
+def test_calibrate_unbounded(batch):
+    modules, pv_tilt, climate_data, exhaustive = batch
+    with pytest.warns(UserWarning):
+        calibration = screening.calibrate_margin(
+            climate_data, [_without_alpha(modules[0])] + modules[1:4],
+            pv_tilt=pv_tilt)
+    assert list(calibration["skipped"]["Internal_ID"]) == \
+        [modules[0]["int_id"]]
+    assert len(calibration["errors"]) == 3
+    with pytest.raises(ValueError), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        screening.calibrate_margin(climate_data,
+                                   [_without_alpha(modules[0])],
+                                   pv_tilt=pv_tilt)
+
+
+def test_screen_parameters(batch):
+    modules, pv_tilt, climate_data, exhaustive = batch
+    with pytest.raises(ValueError):
+        screening.screen(climate_data, modules, n_top=0)
+    with pytest.raises(ValueError):
+        screening.screen(climate_data, modules, margin=-0.1)
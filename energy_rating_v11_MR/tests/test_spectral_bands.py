@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the spectral banding engine (spectral_bands.py).
+
+@author: mriveraa
+"""
+import numpy as np
+import pandas as pd
+import pytest
+# Importing the IEC91853 standard's code
+import pvpltools_python.pvpltools.iec61853 as std
+# Importing the spectral bands
+import spectral_bands
+
+
+def test_climate_bands():
+    bands = spectral_bands.get_climate_bands(
+        ["T_amb", "Inclined global spectral irradiance,306.8-327.8nm",
+         "327.8-362.5nm"])
+    assert bands[1] == (306.8, 327.8) and bands[2] == (327.8, 362.5)
+    with pytest.raises(ValueError):
+        spectral_bands.get_climate_bands(["T_amb", "wind"])
+
+
+def test_operator_linear():
+    # The linear interpolation of a linear spectrum is exact
+    bands = (("a", "b"), (100., 150.), (150., 400.))
+    wavelengths = np.array([100., 120., 200., 300., 400.])
+    spectrum = 2 * wavelengths + 1
+    mean = spectral_bands.get_band_operator(bands, wavelengths) @ spectrum
+    integral = spectral_bands.get_band_operator(
+        bands, wavelengths, mean=False) @ spectrum
+    np.testing.assert_allclose(mean, [251., 551.])
+    np.testing.assert_allclose(integral, [251. * 50, 551. * 250])
+
+
+def test_operator_partial():
+    # Only the part of the band with samples is integrated
+    bands = (("a",), (0., 100.), (100., 200.))
+    operator = spectral_bands.get_band_operator(bands, [50., 150.],
+                                                mean=False)
+    np.testing.assert_allclose(operator @ np.array([1., 1.]), [50., 50.])
+
+
+def test_standard_responsivity():
+    wavelengths = np.arange(280., 1250., 10.)
+    responsivity = pd.Series(
+        np.clip(np.sin((wavelengths - 280) / 970 * np.pi), 0, None) - 0.05,
+        index=wavelengths)
+    np.testing.assert_allclose(
+        spectral_bands.get_banded_responsivity(responsivity),
+        std.convert_to_banded(responsivity), rtol=1e-10, atol=1e-12)
+
+
+def test_spectral_factor():
+    # Same spectral factor as the standard's code for the 29 bands
+    spec_g = np.random.default_rng(0).uniform(
+        0, 60, (10, len(spectral_bands.IEC_BANDS[0])))
+    fsr = spectral_bands.get_banded_responsivity(
+        pd.Series([0.2, 0.6, 0.1], index=[300., 900., 1200.]))
+    np.testing.assert_allclose(
+        spectral_bands.get_spectral_factor(spec_g, fsr),
+        std.calc_spectral_factor(spec_g, fsr), rtol=1e-12)
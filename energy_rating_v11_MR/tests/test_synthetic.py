@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the synthetic input data generator (synthetic.py).
+
+@author: mriveraa
+"""
+from os.path import join
+import numpy as np
+import pandas as pd
+import pytest
+# Importing the synthetic data generator
+import synthetic
+# Importing read functions
+import read_functions
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the equivalence harness
+import equivalence
+
+TEMPLATE_PATH = join(equivalence.FOLDER, "the_standard",
+                     "enra_temperate_coastal.csv")
+
+
+@pytest.fixture(scope="module")
+def template():
+    return pd.read_csv(TEMPLATE_PATH, sep=",", encoding="ISO-8859-1")
+
+
+def test_module_seedable(tmp_path):
+    # Module "i" does not depend on the number or order of the modules
+    first = synthetic.write_modules(str(tmp_path / "a"), 5, seed=3)
+    second = synthetic.write_modules(str(tmp_path / "b"), 2, seed=3,
+                                     start=3)
+    for path_a, path_b in zip(first[3:], second):
+        with open(path_a, encoding="utf-8") as file_a, \
+                open(path_b, encoding="utf-8") as file_b:
+            assert file_a.read() == file_b.read()
+    text = synthetic.module_to_text(synthetic.generate_module(3, seed=3))
+    assert text != synthetic.module_to_text(
+        synthetic.generate_module(3, seed=4))
+
+
+def test_module_readable(tmp_path):
+    path = synthetic.write_modules(str(tmp_path), 1, seed=1, start=7)[0]
+    module = synthetic.generate_module(7, seed=1)
+    (mod_parameters, spec_resp, power_matrix, a_r, u0, u1, module_area,
+     tech, int_id) = read_functions.read_callab_stdfile(path)
+    assert int_id == "Synthetic_0000007"
+    assert tech == module["parameters"]["Technology"]
+    assert np.isclose(module_area, module["parameters"]["Module_Area_[m2]"])
+    assert np.allclose(spec_resp.values, module["spec_resp"].values)
+    assert np.allclose(power_matrix.values, module["power_matrix"].values)
+    assert np.isclose(a_r, module["a_r"])
+    assert np.isclose(u0, module["u0"]) and np.isclose(u1, module["u1"])
+    # The module can be characterised and its efficiency is realistic
+    characterisation = multi_site.get_module_characterisation(path)
+    # Nominal power in kW
+    eta_stc = characterisation["pnom"] / module_area
+    assert 0.15 < eta_stc < 0.25
+
+
+def test_climate(template):
+    climate = synthetic.generate_climate(template, years=2,
+                                         start_year=2020, seed=5)
+    assert list(climate.columns) == list(template.columns)
+    assert len(climate) == 2 * len(template)
+    assert sorted(climate["Year"].unique()) == [2020, 2021]
+    # Calendar and sun position of the template
+    assert np.array_equal(climate["Month"].values[:len(template)],
+                          template["Month"].values)
+    assert np.allclose(climate["Sun elevation (ø)"].values[len(template):],
+                       template["Sun elevation (ø)"].values)
+    # No irradiance where the sun is below the horizon
+    night = np.tile(template["Sun elevation (ø)"].values <= 0, 2)
+    irradiance = climate.loc[:, "Gh (W/m2)":].values
+    assert (irradiance[night] == 0).all()
+    assert (irradiance >= 0).all() and (climate["Wind speed (m/s)"] >= 0).all()
+    # The yearly irradiation stays close to the template
+    ratio = (climate["Gh (W/m2)"].sum()
+             / (2 * template["Gh (W/m2)"].sum()))
+    assert 0.9 < ratio < 1.1
+
+
+def test_climate_seedable(template, tmp_path):
+    climate = synthetic.generate_climate(template, seed=5)
+    pd.testing.assert_frame_equal(
+        climate, synthetic.generate_climate(template, seed=5))
+    assert not climate.equals(synthetic.generate_climate(template, seed=6))
+    # The written file is read as a standard climate
+    path = str(tmp_path / "enra_synthetic.csv")
+    synthetic.write_climate(TEMPLATE_PATH, path, seed=5)
+    climate_data = read_functions.change_names_climate_df(
+        read_functions.read_climate_locs(folder_locations=str(tmp_path),
+                                         loc_name="enra_synthetic.csv"))
+    assert len(climate_data) == len(template)
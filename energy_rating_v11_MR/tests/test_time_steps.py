@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the sub-hourly and irregular time steps (get_time_steps in utils.py
+and resample_climate in read_functions.py).
+
+@author: mriveraa
+"""
+import numpy as np
+import pandas as pd
+import pytest
+# Importing execution functions
+import utils
+# Importing read functions
+import read_functions
+# Importing the equivalence harness
+import equivalence
+# Importing the multi-site Energy Rating
+import multi_site
+
+
+def _get_subhourly(climate_data, n=4):
+    # Each hour repeated "n" times with the same values
+    minutes = np.tile(np.arange(n) * 60 // n, len(climate_data))
+    subhourly = climate_data.iloc[np.repeat(np.arange(len(climate_data)), n)]
+    subhourly.index = (subhourly.index
+                       + pd.to_timedelta(minutes, unit="min"))
+    return subhourly
+
+
+@pytest.fixture(scope="module")
+def rating(example_file):
+    module = multi_site.get_module_characterisation(example_file)
+    climate, pv_tilt, climate_data = equivalence.get_climates()[3]
+    cser, eta_avg, sim_df = equivalence.run_steps(climate_data, module,
+                                                  pv_tilt, None)
+    return module, pv_tilt, climate_data, cser, eta_avg
+
+
+def test_time_steps():
+    hourly = pd.date_range("2021-01-01", periods=48, freq="1h")
+    assert utils.get_time_steps(hourly) is None
+    steps = utils.get_time_steps(pd.date_range("2021-01-01", periods=60,
+                                               freq="10min"))
+    np.testing.assert_allclose(steps, 1 / 6)
+    # Isolated jumps of a uniform index are ignored
+    jump = hourly.delete(slice(10, 11)).append(
+        pd.date_range("2021-01-03", periods=300, freq="1h"))
+    assert utils.get_time_steps(jump) is None
+    # Irregular steps: half the interval on each side, the gaps limited to
+    # MAX_GAP steps
+    irregular = pd.DatetimeIndex(["2021-01-01 00:00", "2021-01-01 00:10",
+                                  "2021-01-01 00:20", "2021-01-01 00:25",
+                                  "2021-01-01 00:30", "2021-01-01 02:00"])
+    steps = utils.get_time_steps(irregular) * 60
+    median = 10 * utils.MAX_GAP
+    np.testing.assert_allclose(steps, [10, 10, 7.5, 5, 2.5 + median / 2,
+                                       median])
+
+
+def test_standard_climates_hourly():
+    for climate, pv_tilt, climate_data in equivalence.get_climates():
+        assert utils.get_time_steps(climate_data.index) is None
+
+
+def test_subhourly_rating(rating):
+    # 15-minute data with the values of each hour give the hourly rating
+    module, pv_tilt, climate_data, cser, eta_avg = rating
+    subhourly = _get_subhourly(climate_data)
+    for name, engine in [("steps", equivalence.run_steps)] + list(
+            equivalence.ENGINES.items()):
+        s_cser, s_eta_avg, s_df = engine(subhourly, module, pv_tilt, None)
+        assert np.isclose(s_cser, cser, rtol=1e-9), name
+        assert np.isclose(s_eta_avg, eta_avg, rtol=1e-9), name
+        if s_df is not None:
+            np.testing.assert_allclose(s_df["time_step"], 0.25)
+
+
+def test_resample(rating):
+    module, pv_tilt, climate_data, cser, eta_avg = rating
+    # Hours from the start of the hour instead of the solar time stamps of
+    # the standard climates (the steady-state rating does not change)
+    climate_data = climate_data.set_axis(pd.date_range(
+        "2011-01-01", periods=len(climate_data), freq="1h"))
+    resampled = read_functions.resample_climate(
+        _get_subhourly(climate_data), resolution="1h")
+    pd.testing.assert_index_equal(resampled.index, climate_data.index,
+                                  check_names=False)
+    columns = [column for column in climate_data
+               if column != "IncidentAngle"]
+    np.testing.assert_allclose(resampled[columns].values,
+                               climate_data[columns].values, rtol=1e-12)
+    r_cser, r_eta_avg, r_df = equivalence.run_steps(resampled, module,
+                                                    pv_tilt, None)
+    assert np.isclose(r_cser, cser, rtol=1e-9)
+    assert "time_step" not in r_df
+
+
+def test_irregular_rating(rating):
+    # Every other daylight hour left out: the hours kept count twice
+    module, pv_tilt, climate_data, cser, eta_avg = rating
+    irregular = climate_data.iloc[::2]
+    i_cser, i_eta_avg, i_df = equivalence.run_steps(irregular, module,
+                                                    pv_tilt, None)
+    assert np.isclose(i_df["time_step"].median(), 2.0)
+    assert np.isclose(i_cser, cser, rtol=0.02)
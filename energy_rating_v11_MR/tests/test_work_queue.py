@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the leases of the work queue (work_queue.py).
+
+@author: mriveraa
+"""
+import pytest
+# Importing the work queue
+import work_queue
+# Importing the results database
+import results_db
+from conftest import EXAMPLE_FILES
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    assert work_queue.enqueue(path, [str(tmp_path / "module.txt")]) == 6
+    # The items are not added twice
+    assert work_queue.enqueue(path, [str(tmp_path / "module.txt")]) == 0
+    return path
+
+
+def test_lease_held(queue_path):
+    items = work_queue.claim(queue_path, "node_a", n=4)
+    assert len(items) == 4
+    # Only the items not leased are given to another node
+    others = work_queue.claim(queue_path, "node_b", n=6)
+    assert len(others) == 2
+    assert not set(items["item_id"]) & set(others["item_id"])
+    assert work_queue.claim(queue_path, "node_c", n=6).empty
+
+
+def test_lease_expired(queue_path):
+    items = work_queue.claim(queue_path, "node_a", n=6, lease_seconds=-1)
+    again = work_queue.claim(queue_path, "node_b", n=6)
+    assert sorted(again["item_id"]) == sorted(items["item_id"])
+    assert work_queue.complete(queue_path, "node_b", again["item_id"]) == 6
+    # A late failure of the first node does not undo the results
+    assert work_queue.fail(queue_path, "node_a", items["item_id"],
+                           "late") == 0
+    assert work_queue.get_status(queue_path)["done"] == 6
+
+
+def test_stale_worker(queue_path):
+    items = work_queue.claim(queue_path, "node_a", n=6, lease_seconds=-1)
+    again = work_queue.claim(queue_path, "node_b", n=6)
+    # The stale worker finishes or fails after its lease was claimed again:
+    # the items stay leased to the new worker
+    assert work_queue.complete(queue_path, "node_a", items["item_id"]) == 0
+    assert work_queue.fail(queue_path, "node_a", items["item_id"],
+                           "late") == 0
+    status = work_queue.get_status(queue_path)
+    assert status["leased"] == 6 and status["done"] == 0
+    # The new worker fails: the items are given back to the queue
+    assert work_queue.fail(queue_path, "node_b", again["item_id"][:2],
+                           "error") == 2
+    assert work_queue.complete(queue_path, "node_b",
+                               again["item_id"][2:]) == 4
+    status = work_queue.get_status(queue_path)
+    assert status["pending"] == 2 and status["done"] == 4
+    assert work_queue.claim(queue_path, "node_c", n=6)["item_id"].tolist() \
+        == again["item_id"][:2].tolist()
+
+
+def test_lease_expired_last_attempt(queue_path):
+    for attempt in range(work_queue.MAX_ATTEMPTS):
+        items = work_queue.claim(queue_path, "node", n=6, lease_seconds=-1)
+        assert len(items) == 6
+    assert work_queue.claim(queue_path, "node", n=6).empty
+    status = work_queue.get_status(queue_path)
+    assert status["failed"] == 6 and status["leased"] == 0
+
+
+def test_run_worker(tmp_path):
+    queue_path = str(tmp_path / "queue.sqlite")
+    db_path = str(tmp_path / "results.sqlite")
+    assert work_queue.enqueue(queue_path, EXAMPLE_FILES) == 12
+    # A stale worker whose leases expired
+    stale = work_queue.claim(queue_path, "node_a", n=4, lease_seconds=-1)
+    assert work_queue.run_worker(queue_path, db_path, batch=5, fused=True,
+                                 wait=False, owner="node_b") == 12
+    assert work_queue.complete(queue_path, "node_a", stale["item_id"]) == 0
+    assert work_queue.get_status(queue_path)["done"] == 12
+    results = results_db.get_top_modules(
+        db_path, "Temperate coastal", k=10, settings="engine=fused")
+    assert len(results) == 2
@@ -4,7 +4,11 @@ This file contains some useful functions for the Energy Rating simulation.
 
     - Climate Specific Energy Rating (CSER) based on the Equation 20 from
         IEC61853-3[1].
+    - Duration of the time steps of sub-hourly or irregular climate data
     - Write final results in excel file
+    - Write the monthly, daily and hour of the day tables in excel file
+    - Write the loss waterfall of all modules in excel file
+    - Write the site x module CSER table of the multi-site rating
 
     References
     ----------
@@ -13,9 +17,26 @@ This file contains some useful functions for the Energy Rating simulation.
 @author: dguzmanr
 @modified: mriveraa
 """
+import warnings
+import numpy as np
 import pandas as pd
 from os.path import join
 
+# Version of the simulation, stored with the results (please check
+# results_db.py) so ratings of different versions are not mixed. It has to
+# be changed with every change of the numbers of the simulation, e.g. 11.1:
+# time steps of the climate, banded spectral responsivity, daylight steps
+# and bifacial modules in the batch paths
+ENGINE_VERSION = "11.1"
+
+# Largest relative jitter of uniform time steps (fraction of the step)
+STEP_TOLERANCE = 0.01
+# Gaps longer than this many time steps are taken as missing data
+MAX_GAP = 1.5
+# Share of the irradiation in POA left out of the CSER (NaN time steps)
+# above which a warning is given
+EXCLUDED_WARNING = 0.01
+
 def write_results(df_1, df_2, folder):
     """
     This function creates a excel file with the final results (efficiency
@@ -55,7 +76,223 @@ def write_results(df_1, df_2, folder):
     return
 
 
-def get_cser(power_series, gpoa_series, pnom):
+def write_tables(tables, module_id, folder):
+    """
+    This function creates a excel file with the monthly, daily and hour of
+    the day x month loss tables of a module in each standard climate. Please
+    check the function "get_energy_tables" in aggregates.py.
+
+    Parameters
+    ----------
+    tables: Dictionary
+        Dictionary with the standard climate names as keys and the
+        dictionaries of tables ("monthly", "daily" and "hour_month") as
+        values.
+    module_id: String
+        Name or ID of the module
+    folder: String
+        Path to folder where results want to be saved.
+
+    Returns
+    -------
+    tables_Module-name.xlsx : Excel file
+        Excel file with one sheet for each table, the standard climate is the
+        first index level.
+    """
+    file = join(folder, "tables_%s.xlsx" % (module_id))
+    with pd.ExcelWriter(file, engine='xlsxwriter') as writer:
+        for name in ["monthly", "daily", "hour_month"]:
+            table = pd.concat({site: site_tables[name]
+                               for site, site_tables in tables.items()},
+                              names=["Std_climate"])
+            table.to_excel(writer, sheet_name=name)
+    return
+
+
+def write_waterfall(df, folder):
+    """
+    This function creates a excel file with the annual loss waterfall of
+    each CalLab file in each standard climate. Please check the function
+    "get_waterfall_table" in aggregates.py.
+
+    Parameters
+    ----------
+    df: DataFrame
+        Data frame with the losses (columns) of each module and standard
+        climate (rows).
+    folder: String
+        Path to folder where results want to be saved.
+
+    Returns
+    -------
+    results_losses.xlsx : Excel file
+        Excel file with the loss waterfall.
+    """
+    file = join(folder, 'results_losses.xlsx')
+    with pd.ExcelWriter(file, engine='xlsxwriter') as writer:
+        df.to_excel(writer, sheet_name='Losses')
+    return
+
+
+def write_ac_table(df, folder):
+    """
+    This function creates a excel file with the AC energy, inverter and
+    clipping losses of each CalLab file in each standard climate and DC/AC
+    ratio. Please check the function "get_ac_table" in ac_stage.py.
+
+    Parameters
+    ----------
+    df: DataFrame
+        Data frame with the AC energy and losses (columns) of each module,
+        standard climate and DC/AC ratio (rows).
+    folder: String
+        Path to folder where results want to be saved.
+
+    Returns
+    -------
+    results_ac.xlsx : Excel file
+        Excel file with the AC energy and losses.
+    """
+    file = join(folder, 'results_ac.xlsx')
+    with pd.ExcelWriter(file, engine='xlsxwriter') as writer:
+        df.to_excel(writer, sheet_name='AC')
+    return
+
+
+def write_lifetime(annual, total, folder):
+    """
+    This function creates a excel file with the lifetime energy projection
+    of each CalLab file in each standard climate and degradation scenario.
+    Please check the functions "project_lifetime" and "get_lifetime_energy"
+    in lifetime.py.
+
+    Parameters
+    ----------
+    annual: DataFrame
+        Data frame with the energy of each scenario and year (rows) and
+        module and standard climate (columns).
+    total: DataFrame
+        Data frame with the lifetime energy of each scenario (rows) and
+        module and standard climate (columns).
+    folder: String
+        Path to folder where results want to be saved.
+
+    Returns
+    -------
+    results_lifetime.xlsx : Excel file
+        Excel file with the annual and the lifetime energy.
+    """
+    file = join(folder, 'results_lifetime.xlsx')
+    with pd.ExcelWriter(file, engine='xlsxwriter') as writer:
+        total.T.to_excel(writer, sheet_name='Lifetime')
+        annual.T.to_excel(writer, sheet_name='Annual')
+    return
+
+
+def write_site_table(df, folder):
+    """
+    This function creates a CSV file with the CSER of each module in each
+    site of the multi-site rating. A CSV file is used since the table can
+    have thousands of rows. Please check the function "get_site_table" in
+    multi_site.py.
+
+    Parameters
+    ----------
+    df: DataFrame
+        Data frame with the latitude, longitude and CSER of each module
+        (columns) in each site (rows).
+    folder: String
+        Path to folder where results want to be saved.
+
+    Returns
+    -------
+    results_sites_cser.csv : CSV file
+        CSV file with the site x module CSER table.
+    """
+    file = join(folder, 'results_sites_cser.csv')
+    df.to_csv(file)
+    return
+
+
+def get_time_steps(index, tolerance=STEP_TOLERANCE, max_gap=MAX_GAP):
+    """
+    This function calculates the duration of each time step of a climate
+    from its Datetime index, so the energy can be integrated with sub-hourly
+    (e.g. 1-minute or 10-minute) or irregular data.
+
+    The time steps are uniform when 99% of them are within "tolerance" of
+    the median step (isolated jumps, like the ones at the month boundaries
+    of some standard climate files, are ignored). Otherwise each time step
+    covers half the interval to the previous and to the next time stamp,
+    with the intervals limited to "max_gap" times the median step, so gaps
+    in the data are not filled by their neighbours.
+
+    Parameters
+    ----------
+    index : Pandas DatetimeIndex
+        Time stamps of the climate data, sorted.
+    tolerance : Float, optional
+        Largest relative jitter of uniform time steps. The default is
+        STEP_TOLERANCE.
+    max_gap : Float, optional
+        Longest interval, in median steps, of a time step. The default is
+        MAX_GAP.
+
+    Returns
+    -------
+    time_steps : Pandas Series or None
+        Duration in hours of each time step. None when the time steps are
+        uniform and hourly: every row is one hour, as in the standard
+        climates.
+    """
+    if len(index) < 2:
+        return None
+    seconds = np.asarray((index - index[0]).total_seconds(), dtype=float)
+    interval = np.diff(seconds)
+    step = np.median(interval)
+    if np.percentile(np.abs(interval - step), 99) <= tolerance * step:
+        if abs(step - 3600) <= tolerance * 3600:
+            return None
+        steps = np.full(len(index), step)
+    else:
+        interval = np.clip(interval, 0, max_gap * step)
+        steps = (np.r_[interval[0], interval] + np.r_[interval, interval[-1]]
+                 ) / 2
+    return pd.Series(steps / 3600, index=index, name="time_step")
+
+
+def get_excluded_share(climate_data):
+    """
+    This function gives the share of the irradiation in POA of the time
+    steps with NaN values, which are left out of the CSER and the average
+    ETA (e.g. irradiance and temperature outside the ETA matrix). A warning
+    is given when it is above EXCLUDED_WARNING, since those time steps are
+    usually not random (high irradiance or low temperatures) and the CSER is
+    biased towards the conditions of the time steps kept.
+
+    Parameters
+    ----------
+    climate_data : Pandas DataFrame
+        DataFrame from the simulation with 'G_tlt', before removing the NaN
+        values.
+
+    Returns
+    -------
+    share : Float
+        Share of the irradiation (from 0 to 1) left out.
+    """
+    weights = climate_data.get("time_step", 1.0)
+    g_tlt = (climate_data["G_tlt"] * weights).fillna(0)
+    excluded = climate_data.isna().any(axis=1)
+    total = g_tlt.sum()
+    share = g_tlt[excluded].sum() / total if total else 0.0
+    if share > EXCLUDED_WARNING:
+        warnings.warn("%.1f%% of the irradiation in POA is left out of the "
+                      "CSER (time steps with NaN values)" % (100 * share))
+    return share
+
+
+def get_cser(power_series, gpoa_series, pnom, time_steps=None):
     """
     This functions calculates the Climate Specific Energy Rating (CSER) based
     on the Equation 20 from the IEC61853-3 [1] standard.
@@ -68,6 +305,9 @@ def get_cser(power_series, gpoa_series, pnom):
         Irradiance in Plane of Array.
     pnom : Float.
         Module's nominal power.
+    time_steps : Pandas series, optional
+        Duration in hours of each time step, please check "get_time_steps".
+        The default is None (one hour each).
 
     Returns
     -------
@@ -82,6 +322,10 @@ def get_cser(power_series, gpoa_series, pnom):
     if len(power_series.dropna()) != len(gpoa_series.dropna()):
         print("Different series' length. Please make same length.")
         return
+    if time_steps is not None:
+        # Energy of each time step
+        power_series = power_series * time_steps
+        gpoa_series = gpoa_series * time_steps
     # Total energy over one year (Wh)
     total_e = power_series.sum()
     # Irradiance at STC (W/m2)
@@ -93,3 +337,32 @@ def get_cser(power_series, gpoa_series, pnom):
     # CSER (climate specific energy rating) over one year
     cser = (total_e * g_stc) / (total_g_poa * p_stc)
     return cser
+
+
+def get_eta_avg(power_series, gpoa_series, mod_area, time_steps=None):
+    """
+    This function calculates the average ETA of the time steps, weighted by
+    their duration.
+
+    Parameters
+    ----------
+    power_series : Pandas series
+        Instantaneous Power calculated.
+    gpoa_series : Pandas series.
+        Irradiance in Plane of Array.
+    mod_area : Float
+        Module's area in m².
+    time_steps : Pandas series, optional
+        Duration in hours of each time step, please check "get_time_steps".
+        The default is None (one hour each).
+
+    Returns
+    -------
+    eta_avg : Float
+        Average ETA.
+    """
+    eta = (power_series / mod_area) / gpoa_series
+    if time_steps is None:
+        return eta.mean()
+    valid = eta.notna()
+    return (eta[valid] * time_steps[valid]).sum() / time_steps[valid].sum()
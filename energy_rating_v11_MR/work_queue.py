@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the work queue of the distributed batch mode. The work
+items (one CalLab file in one climate) are kept in a SQLite file, so any
+number of nodes with access to the file (shared file system or one machine)
+pull items from it without any other service:
+
+    - Items are claimed with a lease: a node gets a batch of items for
+        "lease_seconds" and, if it dies, the items are given to another node
+        once the lease has expired. Only the node holding the lease marks
+        the items as done or failed.
+    - An item that fails is retried up to MAX_ATTEMPTS times, afterwards it
+        is marked as failed with the error.
+    - The results are written to the results database (please check
+        results_db.py), one row per module, climate, engine version and
+        input file and settings. Writing them twice (e.g. after a lease expired while the
+        first node was still working) gives the same rows, so no result is
+        duplicated or lost.
+
+The items are claimed sorted by climate, so a node simulates all the
+modules of a climate reading the climate file only once.
+
+The file system must support the SQLite locks (local disks and most network
+file systems with working locks), and the clocks of the nodes should be
+synchronised since the leases use their time.
+
+@author: mriveraa
+"""
+import os
+import socket
+import sqlite3
+import time
+import traceback
+from collections import OrderedDict
+from os.path import join, dirname, abspath
+import pandas as pd
+# Importing read functions
+import read_functions
+# Importing the multi-site Energy Rating
+import multi_site
+# Importing the results database
+import results_db
+# Importing the batch scheduler
+import scheduler
+# Importing the synthetic data generator (CalLab file format)
+import synthetic
+
+# Seconds a writer waits for the queue lock
+TIMEOUT = 60
+# Seconds an item is leased to a node
+LEASE_SECONDS = 600
+# Times an item is tried before it is marked as failed
+MAX_ATTEMPTS = 3
+# Seconds a worker waits before asking again for items leased to others
+POLL_SECONDS = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    item_id INTEGER PRIMARY KEY,
+    module_file TEXT NOT NULL,
+    climate_file TEXT NOT NULL,
+    climate TEXT NOT NULL,
+    pv_tilt REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    UNIQUE (module_file, climate_file, pv_tilt)
+);
+CREATE INDEX IF NOT EXISTS items_claim
+    ON items (status, climate_file, module_file);
+"""
+
+
+def connect(queue_path):
+    """
+    This function opens the queue, creating the table if it does not exist
+    yet. The transactions are handled explicitly (autocommit mode).
+
+    Parameters
+    ----------
+    queue_path : String
+        Path like. Path to the SQLite file of the queue.
+
+    Returns
+    -------
+    con : sqlite3.Connection
+        Connection to the queue.
+    """
+    con = sqlite3.connect(queue_path, timeout=TIMEOUT, isolation_level=None)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_SCHEMA)
+    return con
+
+
+def get_owner():
+    """
+    Returns the name of this worker in the leases: host name and process id.
+    """
+    return "%s:%d" % (socket.gethostname(), os.getpid())
+
+
+def enqueue(queue_path, module_files, sites=None):
+    """
+    This function adds the work items of the CalLab files in the six standard
+    climates or in the sites of a site index. Items already in the queue are
+    not added again.
+
+    Parameters
+    ----------
+    queue_path : String
+        Path like. Path to the SQLite file of the queue.
+    module_files : List
+        Paths to the CalLab files.
+    sites : Pandas DataFrame, optional
+        Site index, please check "read_site_index" in multi_site.py. The
+        default is None (standard climates).
+
+    Returns
+    -------
+    added : Integer
+        Number of items added.
+    """
+    if sites is None:
+        climates = []
+        for location in range(6):
+            std_location = read_functions.read_standard_locations(location)
+            climates.append((join(dirname(abspath(__file__)), "the_standard",
+                                  std_location["loc"]),
+                             std_location["site_name"],
+                             float(std_location["pv_tilt"])))
+    else:
+        climates = [(site["file"], str(site["site_id"]),
+                     float(site["pv_tilt"]))
+                    for site in sites.to_dict("records")]
+    rows = [(abspath(module_file), climate_file, climate, pv_tilt)
+            for climate_file, climate, pv_tilt in climates
+            for module_file in module_files]
+
+    con = connect(queue_path)
+    try:
+        before = con.total_changes
+        con.execute("BEGIN IMMEDIATE")
+        con.executemany("INSERT OR IGNORE INTO items "
+                        "(module_file, climate_file, climate, pv_tilt) "
+                        "VALUES (?, ?, ?, ?)", rows)
+        con.execute("COMMIT")
+        return con.total_changes - before
+    finally:
+        con.close()
+
+
+def enqueue_callab(queue_path, path, folder_modules, data_file, template_path,
+                   folder, sites=None, workers=None):
+    """
+    This function adds the work items of the modules of the CalLab results
+    (summary workbook and customer files, please check "read_callab_bulk"
+    in read_functions.py). The customer files only have the Power Rating
+    Matrix, so a CalLab file is written for each module in "folder" with the
+    spectral responsivity, the angle of incidence and the thermal
+    coefficients of a template CalLab file (e.g. of the same technology).
+
+    Parameters
+    ----------
+    queue_path : String
+        Path like. Path to the SQLite file of the queue.
+    path, folder_modules, data_file, workers :
+        Please check "read_callab_bulk" in read_functions.py.
+    template_path : String
+        Path like. CalLab file with the quantities the customer files do not
+        have.
+    folder : String
+        Path like. Folder where the CalLab files of the modules are written.
+    sites : Pandas DataFrame, optional
+        Please check "enqueue".
+
+    Returns
+    -------
+    added : Integer
+        Number of items added.
+    summary : Pandas DataFrame
+        Please check "read_callab_bulk", with the CalLab file written for
+        each module read ("module_file", None for the others).
+    """
+    modules, summary = read_functions.read_callab_bulk(
+        path=path, folder_modules=folder_modules, data_file=data_file,
+        workers=workers)
+    (_, spec_resp, _, a_r, u0, u1, _, _, _) = \
+        read_functions.read_callab_stdfile(path=template_path)
+    os.makedirs(folder, exist_ok=True)
+    module_files = {}
+    for module in modules:
+        module_file = join(folder, "CSER input file_%s.txt"
+                           % module["module_id_callab"])
+        text = synthetic.module_to_text(
+            {"parameters": {"Internal_ID": module["module_id_callab"],
+                            "Technology": module["tech"],
+                            "Module_Area_[m2]": module["mod_area"]},
+             "spec_resp": spec_resp,
+             "power_matrix": module["power_matrix"],
+             "a_r": float(a_r), "u0": float(u0), "u1": float(u1)})
+        with open(module_file, "w", encoding="utf-8") as file:
+            file.write(text)
+        module_files[module["module_id_callab"]] = module_file
+    summary["module_file"] = [
+        module_files.get(module_id) if status == "ok" else None
+        for module_id, status in zip(summary["Measurement_ID_tk"],
+                                     summary["status"])]
+    added = enqueue(queue_path, list(module_files.values()), sites=sites)
+    return added, summary
+
+
+def claim(queue_path, owner, n=1, lease_seconds=LEASE_SECONDS):
+    """
+    This function leases up to "n" items to a worker: pending items and
+    items whose lease has expired, sorted by climate. The items that expired
+    after MAX_ATTEMPTS attempts are marked as failed.
+
+    Parameters
+    ----------
+    queue_path : String
+        Path like. Path to the SQLite file of the queue.
+    owner : String
+        Name of the worker, please check "get_owner".
+    n : Integer, optional
+        Largest number of items. The default is 1.
+    lease_seconds : Float, optional
+        Duration of the lease. The default is LEASE_SECONDS.
+
+    Returns
+    -------
+    items : Pandas DataFrame
+        The items leased ("item_id", "module_file", "climate_file",
+        "climate" and "pv_tilt"), empty when there is nothing to do now.
+    """
+    now = time.time()
+    con = connect(queue_path)
+    try:
+        # The lock is taken before reading, so no item is given twice
+        con.execute("BEGIN IMMEDIATE")
+        con.execute("UPDATE items SET status = 'failed', "
+                    "error = 'Lease expired after the last attempt' "
+                    "WHERE status = 'leased' AND lease_expires < ? "
+                    "AND attempts >= ?", (now, MAX_ATTEMPTS))
+        items = pd.read_sql_query(
+            "SELECT item_id, module_file, climate_file, climate, pv_tilt "
+            "FROM items "
+            "WHERE status = 'pending' "
+            "OR (status = 'leased' AND lease_expires < ?) "
+            "ORDER BY climate_file, module_file LIMIT ?",
+            con, params=(now, n))
+        con.executemany("UPDATE items SET status = 'leased', "
+                        "lease_owner = ?, lease_expires = ?, "
+                        "attempts = attempts + 1 WHERE item_id = ?",
+                        [(owner, now + lease_seconds, int(item_id))
+                         for item_id in items["item_id"]])
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+    return items
+
+
+def complete(queue_path, owner, item_ids):
+    """
+    Marks the items leased to "owner" as done, once their results are
+    written. The items whose lease expired and were claimed again by another
+    worker are left to it (their results are the same).
+
+    Returns
+    -------
+    completed : Integer
+        Number of items marked as done.
+    """
+    con = connect(queue_path)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        completed = con.executemany(
+            "UPDATE items SET status = 'done', error = NULL "
+            "WHERE item_id = ? AND lease_owner = ?",
+            [(int(item_id), owner) for item_id in item_ids]).rowcount
+        con.execute("COMMIT")
+    finally:
+        con.close()
+    return completed
+
+
+def fail(queue_path, owner, item_ids, error):
+    """
+    Gives the items leased to "owner" back to the queue after an error, or
+    marks them as failed after MAX_ATTEMPTS attempts. Items already done or
+    claimed again by another worker are not changed.
+
+    Returns
+    -------
+    failed : Integer
+        Number of items given back or marked as failed.
+    """
+    con = connect(queue_path)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        failed = con.executemany(
+            "UPDATE items SET error = ?, lease_owner = NULL, "
+            "status = CASE WHEN attempts >= ? THEN 'failed' "
+            "ELSE 'pending' END "
+            "WHERE item_id = ? AND lease_owner = ? AND status != 'done'",
+            [(error, MAX_ATTEMPTS, int(item_id), owner)
+             for item_id in item_ids]).rowcount
+        con.execute("COMMIT")
+    finally:
+        con.close()
+    return failed
+
+
+def get_status(queue_path):
+    """
+    This function counts the items of the queue in each status.
+
+    Returns
+    -------
+    status : Pandas Series
+        Number of items "pending", "leased", "done" and "failed".
+    """
+    con = connect(queue_path)
+    try:
+        counts = dict(con.execute(
+            "SELECT status, COUNT(*) FROM items GROUP BY status"))
+    finally:
+        con.close()
+    return pd.Series({status: counts.get(status, 0)
+                      for status in ["pending", "leased", "done",
+                                     "failed"]})
+
+
+def get_failed(queue_path):
+    """
+    Returns the failed items with their error.
+    """
+    con = connect(queue_path)
+    try:
+        return pd.read_sql_query(
+            "SELECT item_id, module_file, climate, attempts, error "
+            "FROM items WHERE status = 'failed'", con)
+    finally:
+        con.close()
+
+
+def get_module(module_file, bifaciality=None, albedo=0.2, tau=None,
+               fused=False):
+    """
+    Returns the module characterisation of a CalLab file (please check
+    "get_module_characterisation" in multi_site.py) with the "settings" of
+    its rating and its "input_hash" (please check "get_rating_settings" and
+    "get_input_hash" in results_db.py).
+    """
+    module = multi_site.get_module_characterisation(
+        module_file, bifaciality=bifaciality, albedo=albedo)
+    module["settings"] = results_db.get_rating_settings(
+        engine="fused" if fused else "steps", tau=tau,
+        bifaciality=module["bifaciality"], albedo=module["albedo"])
+    module["input_hash"] = results_db.get_input_hash(
+        module_file, settings=module["settings"])
+    return module
+
+
+def run_items(items, db_path, modules, tau=None, fused=False,
+              profile_dir=None):
+    """
+    This function rates the items of one climate (and tilt) and writes their
+    results.
+
+    Parameters
+    ----------
+    items : Pandas DataFrame
+        Items of one climate, please check "claim".
+    db_path : String
+        Path like. Path to the results database.
+    modules : Dictionary
+        Module characterisations of the CalLab files of the items, please
+        check "get_module".
+    tau, fused, profile_dir : optional
+        Please check the function "rate_site" in multi_site.py.
+    """
+    rated = [modules[module_file] for module_file in items["module_file"]]
+    first = items.iloc[0]
+    site = {"site_id": first["climate"], "file": first["climate_file"],
+            "pv_tilt": first["pv_tilt"]}
+    rows = multi_site.rate_site(site, rated, tau=tau, fused=fused,
+                                profile_dir=profile_dir)
+    for module, (_, _, cser, eta_avg) in zip(rated, rows):
+        results_db.write_module_results(
+            db_path=db_path,
+            mod_parameters=module["mod_parameters"],
+            climates=[first["climate"]],
+            cser=[cser],
+            eta_avg=[eta_avg],
+            input_hash=module["input_hash"],
+            settings=module["settings"])
+    return
+
+
+def run_worker(queue_path, db_path, batch=20, lease_seconds=LEASE_SECONDS,
+               tau=None, fused=False, wait=True, owner=None,
+               profile_dir=None, bifaciality=None, albedo=0.2,
+               memory_budget=None):
+    """
+    This function runs a worker: it claims batches of items, rates them and
+    writes the results until the queue is finished. Several workers (in the
+    same or in other nodes) can run at the same time on the same queue.
+
+    Parameters
+    ----------
+    queue_path : String
+        Path like. Path to the SQLite file of the queue.
+    db_path : String
+        Path like. Path to the results database.
+    batch : Integer, optional
+        Items claimed at once, the lease must be long enough to rate them.
+        The default is 20.
+    lease_seconds : Float, optional
+        Duration of the lease. The default is LEASE_SECONDS.
+    tau, fused : optional
+        Please check the function "rate_site" in multi_site.py.
+    wait : Boolean, optional
+        If True, when no item can be claimed but other workers still have
+        items leased, the worker waits in case their leases expire. If False
+        it stops. The default is True.
+    owner : String, optional
+        Name of the worker. The default is None (please check "get_owner").
+    profile_dir : String, optional
+        Path like. Folder where the worker writes the cProfile dump of each
+        module in each climate, please check profiling.py. The default is
+        None (no profiling).
+    bifaciality, albedo : optional
+        Please check the function "get_module_characterisation" in
+        multi_site.py.
+    memory_budget : Float, optional
+        Memory available for the worker in bytes. When given, at most the
+        items that fit in it are claimed at once (up to "batch"), please
+        check "get_batch_size" in scheduler.py. The default is None.
+
+    Returns
+    -------
+    done : Integer
+        Number of items rated and marked as done by this worker, without
+        the ones claimed again by another worker after the lease expired.
+    """
+    owner = owner or get_owner()
+    if memory_budget is not None:
+        # Size of a climate of the queue
+        con = connect(queue_path)
+        try:
+            row = con.execute("SELECT climate_file FROM items LIMIT 1"
+                              ).fetchone()
+        finally:
+            con.close()
+        if row is not None:
+            n_steps, n_bands = scheduler.get_climate_size(row[0])
+            batch = scheduler.get_batch_size(
+                n_steps=n_steps, memory_budget=memory_budget, max_batch=batch,
+                outputs=["profile"] if profile_dir is not None else [],
+                n_bands=n_bands, fused=fused)
+    # Module characterisations of the last items, at most one per item of
+    # a batch (the least recently used are dropped)
+    modules = OrderedDict()
+    done = 0
+    while True:
+        items = claim(queue_path, owner, n=batch, lease_seconds=lease_seconds)
+        if items.empty:
+            if wait and get_status(queue_path)[["pending", "leased"]].sum():
+                time.sleep(POLL_SECONDS)
+                continue
+            return done
+        # Errors of the CalLab files of this batch that cannot be read, they
+        # are read only once
+        broken_files = {}
+        for _, group in items.groupby(["climate_file", "pv_tilt"],
+                                      sort=False):
+            # Only the items of the CalLab files that cannot be read fail
+            broken = []
+            for item_id, module_file in zip(group["item_id"],
+                                            group["module_file"]):
+                if module_file in broken_files:
+                    fail(queue_path, owner, [item_id],
+                         broken_files[module_file])
+                    broken.append(item_id)
+                elif module_file in modules:
+                    modules.move_to_end(module_file)
+                else:
+                    try:
+                        modules[module_file] = get_module(
+                            module_file, bifaciality=bifaciality,
+                            albedo=albedo, tau=tau, fused=fused)
+                    except Exception:
+                        broken_files[module_file] = traceback.format_exc()
+                        fail(queue_path, owner, [item_id],
+                             broken_files[module_file])
+                        broken.append(item_id)
+                        continue
+                    if len(modules) > batch:
+                        modules.popitem(last=False)
+            group = group[~group["item_id"].isin(broken)]
+            if group.empty:
+                continue
+            try:
+                run_items(group, db_path, modules, tau=tau, fused=fused,
+                          profile_dir=profile_dir)
+            except Exception:
+                fail(queue_path, owner, group["item_id"],
+                     traceback.format_exc())
+                continue
+            done += complete(queue_path, owner, group["item_id"])